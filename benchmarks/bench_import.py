@@ -0,0 +1,78 @@
+"""
+Startup-time benchmark. Times a few typical imports in fresh interpreters and reports which
+heavy dependencies each one drags in.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --repeats 10 --max-seconds 0.5
+
+With --max-seconds, exits with status 1 if any of the lightweight targets (the ones that
+shouldn't need dspy or mlflow) is slower than that or loads a heavy dependency.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import statistics
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ["dspy", "mlflow", "pandas", "numpy", "tqdm", "litellm"]
+
+# name -> (statement, whether it should stay lightweight)
+TARGETS = {
+    "import bishop":("import bishop", True),
+    "code_checker":("from bishop._scrub import code_checker", True),
+    "get_runs_as_json":("from bishop import get_runs_as_json", True),
+    "Laboratory":("from bishop import Laboratory", False),
+}
+
+SCRIPT = """
+import sys, time, json
+tic = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - tic
+print(json.dumps({{"seconds":elapsed, "loaded":[m for m in {heavy} if m in sys.modules]}}))
+"""
+
+
+def time_import(statement:str, repeats:int) -> dict:
+    """
+    Run an import statement in `repeats` fresh interpreters; return the median time and the
+    heavy modules it loaded
+    """
+    times = []
+    loaded = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", SCRIPT.format(statement=statement, heavy=HEAVY)],
+                             cwd=ROOT, capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().split("\n")[-1])
+        times.append(result["seconds"])
+        loaded = result["loaded"]
+    return {"median_s":statistics.median(times), "min_s":min(times), "loaded":loaded}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5, help="fresh interpreters per target")
+    parser.add_argument("--max-seconds", type=float, help="time budget for the lightweight targets")
+    args = parser.parse_args()
+
+    failures = []
+    for name, (statement, light) in TARGETS.items():
+        result = time_import(statement, args.repeats)
+        print(f"{name:20s} {result['median_s']:.3f}s (min {result['min_s']:.3f}s)  loads: {', '.join(result['loaded']) or '-'}")
+        if light and (args.max_seconds is not None):
+            if result["median_s"] > args.max_seconds:
+                failures.append(f"{name} took {result['median_s']:.3f}s")
+            if len(result["loaded"]) > 0:
+                failures.append(f"{name} loaded {', '.join(result['loaded'])}")
+    for f in failures:
+        print("REGRESSION:", f)
+    if len(failures) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
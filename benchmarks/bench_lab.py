@@ -0,0 +1,229 @@
+"""
+Offline benchmark for lab overhead. Runs each Laboratory class against a scripted mock LM,
+a local MLflow store in a temporary directory, and synthetic experiments of different sizes,
+and reports where the time goes.
+
+    python benchmarks/bench_lab.py
+    python benchmarks/bench_lab.py --rows 1000 100000 --save baseline.json
+    python benchmarks/bench_lab.py --compare baseline.json
+
+With --compare, exits with status 1 if any timing got more than --tolerance slower.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import warnings
+import logging
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+import mlflow
+import mlflow.tracking.fluent
+import dspy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bishop
+import bishop._analyst
+from mock_lm import ScriptedLM
+
+
+LABS = {
+    "Laboratory":bishop.Laboratory,
+    "LaboratoryWithIdeaCritic":bishop.LaboratoryWithIdeaCritic,
+    "LaboratoryWithNoAnalyst":bishop.LaboratoryWithNoAnalyst,
+}
+
+PROMPTS = {
+    "background":"We're trying to find a function that maximizes the score on a synthetic dataset.",
+    "analysis_question":"Which groups score best, and how consistent is that across replicates?",
+    "function_name":"run",
+    "constraints":"Write a single python function called run() that inputs and outputs a numpy array."
+}
+
+MLFLOW_FUNCTIONS = ["start_run", "end_run", "log_param", "log_params", "log_metric", "log_metrics",
+                    "set_tag", "set_tags", "log_dict", "search_runs", "set_experiment_tag"]
+
+
+def make_experiment_fn(rows:int, seed:int=0):
+    """
+    Synthetic experiment: run the LLM's function on some random data and return a results
+    frame with `rows` rows
+    """
+    rng = np.random.default_rng(seed)
+    def experiment_fn(code, report=None, budget=None):
+        namespace = {}
+        exec(code, namespace)
+        x = rng.normal(size=rows)
+        y = namespace["run"](x)
+        df = pd.DataFrame({"x":x, "y":y, "score":y + rng.normal(size=rows),
+                           "group":rng.choice(["a", "b", "c", "d"], size=rows),
+                           "size":rng.integers(0, 100, size=rows)})
+        score = float(df["score"].mean())
+        if report is not None:
+            report(0, {"score":score})
+        return {"score":score, "df":df}
+    return experiment_fn
+
+
+class Timers():
+    """
+    Accumulate time spent inside wrapped functions, ignoring nested calls to the same group
+    """
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self._depth = defaultdict(int)
+        self._patched = []
+
+    def wrap(self, owner, attr, group):
+        original = getattr(owner, attr)
+        def wrapped(*args, **kwargs):
+            self._depth[group] += 1
+            tic = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self._depth[group] -= 1
+                if self._depth[group] == 0:
+                    self.totals[group] += time.perf_counter() - tic
+                    self.counts[group] += 1
+        setattr(owner, attr, wrapped)
+        self._patched.append((owner, attr, original))
+
+    def restore(self):
+        for owner, attr, original in self._patched[::-1]:
+            setattr(owner, attr, original)
+        self._patched = []
+
+
+def run_one(lab_name:str, rows:int, num_experiments:int, latency:float, tool_calls:int,
+            replicates:int, store:str) -> dict:
+    # everything mlflow writes, artifacts included, stays in a scratch directory
+    directory = tempfile.mkdtemp()
+    try:
+        return _run_one(directory, lab_name, rows, num_experiments, latency, tool_calls, replicates, store)
+    finally:
+        mlflow.set_tracking_uri(None)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _run_one(directory:str, lab_name:str, rows:int, num_experiments:int, latency:float, tool_calls:int,
+             replicates:int, store:str) -> dict:
+    if store == "file":
+        os.environ["MLFLOW_ALLOW_FILE_STORE"] = "true"
+        mlflow.set_tracking_uri(f"file://{directory}/mlruns")
+    else:
+        mlflow.set_tracking_uri(f"sqlite:///{directory}/mlflow.db")
+    experiment_name = f"bench_{lab_name}_{rows}"
+    mlflow.create_experiment(experiment_name, artifact_location=f"file://{directory}/artifacts")
+    mlflow.set_experiment(experiment_name)
+    lm = ScriptedLM(latency=latency, tool_calls=tool_calls)
+    dspy.configure(lm=lm, track_usage=True)
+
+    timers = Timers()
+    for f in MLFLOW_FUNCTIONS:
+        timers.wrap(mlflow, f, "mlflow")
+    timers.wrap(mlflow.tracking.fluent, "end_run", "mlflow")
+    timers.wrap(bishop._analyst, "_pandas_query", "analyst_pandas")
+    experiment_fn = make_experiment_fn(rows)
+    lab = LABS[lab_name](lm, experiment_fn, experiment_name, ["score"], PROMPTS, human_in_loop=False,
+                         num_experiment_averages=replicates)
+    for stage in ["propose_experiment", "run_experiment", "analyze_results"]:
+        timers.wrap(lab, stage, stage)
+    # time each agent separately
+    original_call_agent = lab._call_agent
+    def _call_agent(name, **kwargs):
+        tic = time.perf_counter()
+        try:
+            return original_call_agent(name, **kwargs)
+        finally:
+            timers.totals[f"agent.{name}"] += time.perf_counter() - tic
+            timers.counts[f"agent.{name}"] += 1
+    lab._call_agent = _call_agent
+
+    tracemalloc.start()
+    tic = time.perf_counter()
+    try:
+        for _ in range(num_experiments):
+            lab()
+    finally:
+        total = time.perf_counter() - tic
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        timers.restore()
+    # how much of the history lookup cost is mlflow
+    tic = time.perf_counter()
+    lab._get_history()
+    history_time = time.perf_counter() - tic
+
+    result = {"lab":lab_name, "rows":rows, "experiments":num_experiments, "total_s":total,
+              "lm_calls":lm.num_calls, "lm_sleep_s":lm.sleep_time,
+              "overhead_s":total - lm.sleep_time,
+              "history_lookup_s":history_time, "peak_memory_mb":peak/2**20}
+    for k in timers.totals:
+        result[f"{k}_s"] = timers.totals[k]
+        result[f"{k}_calls"] = timers.counts[k]
+    return result
+
+
+def compare(results:list, baseline:list, tolerance:float, min_seconds:float=0.05) -> list:
+    """
+    Return a list of human-readable regressions relative to a saved baseline
+    """
+    regressions = []
+    base = {(b["lab"], b["rows"]):b for b in baseline}
+    for r in results:
+        b = base.get((r["lab"], r["rows"]))
+        if b is None:
+            continue
+        for k in r:
+            if k.endswith("_s") and (k in b) and (r[k] > min_seconds):
+                if r[k] > (1+tolerance)*b[k]:
+                    regressions.append(f"{r['lab']} rows={r['rows']} {k}: {b[k]:.3f}s -> {r[k]:.3f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labs", nargs="+", default=list(LABS.keys()), choices=list(LABS.keys()))
+    parser.add_argument("--rows", nargs="+", type=int, default=[1000, 100000])
+    parser.add_argument("--experiments", type=int, default=3, help="experiments per lab")
+    parser.add_argument("--replicates", type=int, default=1, help="num_experiment_averages")
+    parser.add_argument("--latency", type=float, default=0., help="seconds of simulated latency per LM call")
+    parser.add_argument("--tool-calls", type=int, default=3, help="tool calls per ReAct loop")
+    parser.add_argument("--store", choices=["sqlite", "file"], default="sqlite", help="local MLflow backend")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown relative to baseline")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    logging.getLogger("mlflow").setLevel(logging.ERROR)
+    results = []
+    for lab_name in args.labs:
+        for rows in args.rows:
+            r = run_one(lab_name, rows, args.experiments, args.latency, args.tool_calls,
+                        args.replicates, args.store)
+            results.append(r)
+            print(json.dumps(r, indent=2))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r in regressions:
+            print("REGRESSION:", r)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
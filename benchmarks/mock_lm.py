@@ -0,0 +1,104 @@
+"""
+Deterministic stand-in for a dspy.LM, so we can measure everything the lab does
+*around* the LLM without paying for (or waiting on) a real one.
+"""
+import re
+import json
+import time
+import dspy
+from types import SimpleNamespace
+
+
+DEFAULT_CODE = '''def run(x):
+    """
+    Scale the input
+    """
+    # multiply by a constant
+    return 2*x'''
+
+DEFAULT_COMMANDS = ['df.describe()',
+                    'df.groupby("group")["score"].mean()',
+                    'df["score"].quantile([0.1, 0.5, 0.9])',
+                    'df.corr(numeric_only=True)',
+                    'df.groupby(["group", "experiment_index"]).size()']
+
+
+class ScriptedLM(dspy.BaseLM):
+    """
+    Mock LM that reads the output fields off the dspy ChatAdapter prompt and fills them in.
+
+    * ReAct agents call their first tool tool_calls times and then finish
+    * validate_code gets submitted `code`; pandas_query cycles through `commands`
+    * any field in `responses` is answered with that value
+    * if `replay` is a list of raw completions, those get returned in order first
+
+    Each call sleeps for latency + latency_per_token*completion_tokens seconds.
+    """
+    def __init__(self, model:str="mock/scripted", latency:float=0., latency_per_token:float=0.,
+                 tool_calls:int=3, code:str=DEFAULT_CODE, commands:list=None, responses:dict=None,
+                 replay:list=None):
+        super().__init__(model, temperature=0.)
+        self.latency = latency
+        self.latency_per_token = latency_per_token
+        self.tool_calls = tool_calls
+        self.code = code
+        self.commands = commands if commands is not None else DEFAULT_COMMANDS
+        self.responses = responses if responses is not None else {}
+        self.replay = list(replay) if replay is not None else []
+        self.num_calls = 0
+        self.sleep_time = 0.
+
+    def _tool_args(self, tool, system, n_obs):
+        if tool == "finish":
+            return {}
+        if tool == "validate_code":
+            return {"code":self.code}
+        if tool == "pandas_query":
+            return {"command":self.commands[n_obs % len(self.commands)]}
+        # anything else: fill in the first argument with some text
+        args = re.findall(r"\(\d+\) " + tool + r", whose .*?It takes arguments \{'(\w+)'", system, re.S)
+        return {args[0]:f"scripted input {n_obs}"} if len(args) > 0 else {}
+
+    def _complete(self, messages):
+        system = messages[0]["content"]
+        user = messages[-1]["content"]
+        outputs = system.split("Your output fields are:")[1].split("All interactions")[0]
+        fields = re.findall(r"\d+\. `(\w+)` \(([^)]*)\)", outputs)
+        tools = re.findall(r"\(\d+\) (\w+), whose description", system)
+        trajectory = user.split("[[ ## trajectory ## ]]")[-1]
+        n_obs = trajectory.count("[[ ## observation_")
+        values = {}
+        for field, dtype in fields:
+            if field in self.responses:
+                values[field] = self.responses[field]
+            elif field == "next_tool_name":
+                values[field] = tools[0] if n_obs < self.tool_calls else "finish"
+            elif field == "next_tool_args":
+                values[field] = json.dumps(self._tool_args(values["next_tool_name"], system, n_obs))
+            elif field == "code":
+                values[field] = self.code
+            elif dtype.startswith("list"):
+                values[field] = json.dumps([f"scripted {field} {i}" for i in range(3)])
+            elif dtype in ["int", "float"]:
+                values[field] = "5"
+            else:
+                values[field] = f"scripted {field}"
+        return "".join(f"[[ ## {k} ## ]]\n{v}\n\n" for k,v in values.items()) + "[[ ## completed ## ]]"
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        self.num_calls += 1
+        if len(self.replay) > 0:
+            content = self.replay.pop(0)
+        else:
+            content = self._complete(messages)
+        prompt_tokens = len(json.dumps(messages))//4
+        completion_tokens = len(content)//4
+        delay = self.latency + self.latency_per_token*completion_tokens
+        if delay > 0:
+            time.sleep(delay)
+            self.sleep_time += delay
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+            usage={"prompt_tokens":prompt_tokens, "completion_tokens":completion_tokens,
+                   "total_tokens":prompt_tokens+completion_tokens},
+            model=self.model)
@@ -1,4 +1,57 @@
+import importlib
+import typing
 
-from ._main import Laboratory
-from ._critic import LaboratoryWithIdeaCritic
-from ._noanalyst import LaboratoryWithNoAnalyst
\ No newline at end of file
+# public names are loaded on first access, so that `import bishop` (or importing one of the
+# lightweight helper modules) doesn't pull in dspy, mlflow and pandas
+_LAZY = {
+    "Laboratory":"._main",
+    "LaboratoryWithIdeaCritic":"._critic",
+    "LaboratoryWithNoAnalyst":"._noanalyst",
+    "MedianStoppingPruner":"._pruning",
+    "SuccessiveHalvingPruner":"._pruning",
+    "ExperimentPruned":"._pruning",
+    "Recorder":"._replay",
+    "JobQueue":"._queue",
+    "RateLimiter":"._ratelimit",
+    "ExperimentPool":"._pool",
+    "SqliteTracker":"._tracking",
+    "MLflowTracker":"._tracking",
+    "RunDataset":"._crossrun",
+    "compare_compiled":"._optimize",
+    "code_checker":"._scrub",
+    "get_runs_as_json":"._mlflow",
+    "get_dataframe_from_mlflow_artifact":"._mlflow",
+    "get_dataframes_from_mlflow_artifacts":"._mlflow",
+    "log_dataframe_artifact":"._mlflow",
+}
+
+__all__ = list(_LAZY.keys())
+
+if typing.TYPE_CHECKING:
+    from ._main import Laboratory
+    from ._critic import LaboratoryWithIdeaCritic
+    from ._noanalyst import LaboratoryWithNoAnalyst
+    from ._pruning import MedianStoppingPruner, SuccessiveHalvingPruner, ExperimentPruned
+    from ._replay import Recorder
+    from ._queue import JobQueue
+    from ._ratelimit import RateLimiter
+    from ._pool import ExperimentPool
+    from ._tracking import SqliteTracker, MLflowTracker
+    from ._crossrun import RunDataset
+    from ._optimize import compare_compiled
+    from ._scrub import code_checker
+    from ._mlflow import (get_runs_as_json, get_dataframe_from_mlflow_artifact,
+                          get_dataframes_from_mlflow_artifacts, log_dataframe_artifact)
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    # cache it so __getattr__ only runs once per name
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
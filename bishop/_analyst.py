@@ -9,10 +9,14 @@ All methods in the pandas.DataFrame object:
 df_functions = [name for name, obj in inspect.getmembers(df, predicate=inspect.ismethod)]
 len(df_functions)
 """
+import ast
+import numpy as np
 import pandas as pd
 import dspy
 import typing
 
+from ._react import CompactReAct, CircuitBreaker
+from ._digest import describe_dataframe
 
 
 PD_WHITELIST = ['array', 'bdate_range', 'concat', 'crosstab', 'cut', 'date_range',
@@ -53,14 +57,12 @@ foo = """
 
 
 
-def _pandas_query(command:str, df:pd.core.frame.DataFrame, strict:bool=True, maxlines:int=15) -> str:
+def _check_command(command:str, strict:bool=True) -> list:
     """
-    Query the dataset using pandas
+    Check a single-line pandas command against our rules; return a list of reasons it
+    isn't allowed (empty if it's fine)
     """
     failures = []
-    _ = df.describe() # still need this?
-    exec("import pandas as pd") # still need this?
-    print("\ncommand:", command)
     if "import" in command.lower():
         failures.append("import statements not allowed")
     if "lambda" in command.lower():
@@ -87,21 +89,220 @@ def _pandas_query(command:str, df:pd.core.frame.DataFrame, strict:bool=True, max
                 func = f.split("(")[0]
                 if func not in PD_WHITELIST+DF_WHITELIST:
                     failures.append(f"function {func} not permitted")
+    return failures
+
+
+def _truncation_warning(what:str) -> str:
+    return f"WARNING: result too long; {what}. Please try a different query (e.g. aggregate or filter first)."
+
+
+def _head(result, maxlines:int, maxcols:int) -> tuple:
+    """
+    Cut a query result down to at most maxlines rows/items (and maxcols columns) without
+    formatting the rest of it. Returns the bounded result and a note about what got cut, if anything.
+    """
+    if isinstance(result, pd.DataFrame):
+        rows, cols = result.shape
+        notes = []
+        if rows > maxlines:
+            result = result.iloc[:maxlines]
+            notes.append(f"the first {maxlines} of {rows:,} rows")
+        if cols > maxcols:
+            result = result.iloc[:, :maxcols]
+            notes.append(f"the first {maxcols} of {cols:,} columns")
+        return result, ("showing " + " and ".join(notes)) if len(notes) > 0 else ""
+    if isinstance(result, (pd.Series, pd.Index, np.ndarray, list, tuple)) and (np.ndim(result) > 0):
+        n = len(result)
+        if n > maxlines:
+            return result[:maxlines] if not isinstance(result, pd.Series) else result.iloc[:maxlines], \
+                   f"showing the first {maxlines} of {n:,} items"
+    elif isinstance(result, (dict, set)) and len(result) > maxlines:
+        n = len(result)
+        items = list(result.items() if isinstance(result, dict) else result)[:maxlines]
+        return (dict(items) if isinstance(result, dict) else items), f"showing the first {maxlines} of {n:,} items"
+    return result, ""
+
+
+def _render_result(result, maxlines:int=15, maxchars:int=3000, max_tokens:int=None, maxcols:int=30) -> str:
+    """
+    Turn a query result into text for the LLM, bounded by lines, characters and (roughly) tokens.
+    Checks the size of the result first and only formats the part that will be shown, so an
+    accidental query that returns millions of rows is cheap to reject.
+    """
+    result, note = _head(result, maxlines, maxcols)
+    text = str(result)
+    lines = text.split("\n")
+    # e.g. a short Series of very long strings
+    if len(lines) > maxlines + 2:
+        text = "\n".join(lines[:maxlines])
+        note = note or f"showing the first {maxlines} of {len(lines):,} lines"
+    if max_tokens is not None:
+        maxchars = min(maxchars, 4*max_tokens)
+    if len(text) > maxchars:
+        note = f"{note + ', ' if note else ''}cut to {maxchars:,} of {len(text):,} characters"
+        text = text[:maxchars]
+    if note:
+        return f"{_truncation_warning(note)}\n{text}"
+    return text
+
+
+def _format_failures(failures:list) -> str:
+    result = "Command failed for the following reasons:"
+    for f in failures:
+        result += f"\n* {f}"
+    result += "\n**Please reframe your query or ask a different question.**"
+    return result
+
+
+def _pandas_query(command:str, df:pd.core.frame.DataFrame, strict:bool=True, maxlines:int=15,
+                  max_tokens:int=None) -> str:
+    """
+    Query the dataset using pandas
+    """
+    print("\ncommand:", command)
+    failures = _check_command(command, strict)
     if len(failures) == 0:
         try:
             result = eval(command)
-            if len(str(result).split("\n")) > maxlines:
-                result = f"WARNING: result too long; truncating to {maxlines} lines. Please try a different query.\n{result.head(maxlines)}"
+            result = _render_result(result, maxlines, max_tokens=max_tokens)
         except Exception as e:
             failures.append(f"error: {e}")
     if len(failures) > 0:
-        result = "Command failed for the following reasons:"
-        for f in failures:
-            result += f"\n* {f}"
-        result += "\n**Please reframe your query or ask a different question.**"
+        result = _format_failures(failures)
     return result
 
 
+def _default_strata(df:pd.DataFrame, max_levels:int=20, max_columns:int=2) -> list:
+    """
+    Pick the low-cardinality categorical columns (plus experiment_index) to stratify on
+    """
+    candidates = []
+    for c in df.columns:
+        if (c == "experiment_index") or not pd.api.types.is_numeric_dtype(df[c]) or pd.api.types.is_bool_dtype(df[c]):
+            levels = df[c].nunique(dropna=False)
+            if levels <= max_levels:
+                candidates.append((levels, c))
+    return [c for _, c in sorted(candidates)[:max_columns]]
+
+
+def _stratified_sample(df:pd.DataFrame, n:int, strata:list=None, min_per_stratum:int=5,
+                       seed:int=0) -> pd.DataFrame:
+    """
+    Sample about n rows, allocated proportionally across the strata but with at least
+    min_per_stratum rows from every stratum (or all of them, for tiny strata), so rare
+    groups don't disappear from the sample.
+    """
+    if len(df) <= n:
+        return df
+    rng = np.random.default_rng(seed)
+    key = rng.random(len(df))
+    if strata is None:
+        strata = _default_strata(df)
+    if len(strata) == 0:
+        return df.iloc[np.sort(np.argsort(key)[:n])]
+    codes = df.groupby(strata, sort=False, observed=True, dropna=False).ngroup().to_numpy()
+    # rank every row within its stratum by its random key
+    order = np.lexsort((key, codes))
+    sizes = np.bincount(codes)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    position = np.empty(len(df), dtype=int)
+    position[order] = np.arange(len(df)) - starts[codes[order]]
+    quota = np.maximum(np.ceil(sizes*n/len(df)), np.minimum(sizes, min_per_stratum))
+    return df.iloc[np.flatnonzero(position < quota[codes])]
+
+
+def _sample_note(command:str, sample:pd.DataFrame, total:int, standard_errors:pd.Series,
+                 round_to:int=4, max_columns:int=5) -> str:
+    """
+    Annotation for a result computed on a sample: how big the sample was and how precise
+    column means are
+    """
+    n = len(sample)
+    note = (f"APPROXIMATE: computed on a stratified sample of {n:,} of {total:,} rows ({100*n/total:.2g}%). "
+            f"Counts and sums are NOT scaled up; multiply by {total/n:.3g} to estimate full-data values.")
+    columns = [c for c in standard_errors.index if str(c) in command][:max_columns]
+    if len(columns) == 0:
+        columns = list(standard_errors.index[:max_columns])
+    if len(columns) > 0:
+        errors = ", ".join([f"{c} ±{round(standard_errors[c], round_to)}" for c in columns])
+        note += f" Standard error of column means: {errors}."
+    note += " Re-run with exact=True for exact numbers."
+    return note
+
+
+def _share_groupbys(commands:list, df:pd.core.frame.DataFrame) -> tuple:
+    """
+    Find df.groupby(...) calls that appear in more than one command and evaluate each of them
+    once, so the commands share a single GroupBy object (and pandas only has to factorize the
+    grouping keys once). Returns the rewritten commands and a namespace to evaluate them in.
+    """
+    segments = []
+    for command in commands:
+        try:
+            tree = ast.parse(command, mode="eval")
+        except SyntaxError:
+            segments.append([])
+            continue
+        found = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and \
+                    (node.func.attr == "groupby") and isinstance(node.func.value, ast.Name) and \
+                    (node.func.value.id == "df"):
+                found.append(ast.get_source_segment(command, node))
+        segments.append(found)
+    counts = {}
+    for found in segments:
+        for seg in set(found):
+            counts[seg] = counts.get(seg, 0) + 1
+    namespace = {"pd":pd, "df":df}
+    names = {}
+    for seg in counts:
+        if counts[seg] > 1:
+            try:
+                names[seg] = f"_groupby_{len(names)}"
+                namespace[names[seg]] = eval(seg, {}, {"pd":pd, "df":df})
+            except Exception:
+                # let the individual commands report the error
+                names.pop(seg)
+    rewritten = []
+    for command, found in zip(commands, segments):
+        for seg in found:
+            if seg in names:
+                command = command.replace(seg, names[seg])
+        rewritten.append(command)
+    return rewritten, namespace
+
+
+def _pandas_batch_query(commands:list, df:pd.core.frame.DataFrame, strict:bool=True, maxlines:int=40,
+                        max_commands:int=10, max_tokens:int=None) -> str:
+    """
+    Run several single-line pandas commands at once and return one combined result. Each
+    command is checked separately; groupby() calls shared between commands are only computed once.
+    The line and token budgets are split between the commands.
+    """
+    if isinstance(commands, str):
+        commands = [commands]
+    if len(commands) > max_commands:
+        return _format_failures([f"too many commands in one batch; the limit is {max_commands}"])
+    lines_each = max(3, maxlines//max(len(commands), 1))
+    tokens_each = None if max_tokens is None else max(50, max_tokens//max(len(commands), 1))
+    checked = [_check_command(c, strict) for c in commands]
+    runnable = [c for c, f in zip(commands, checked) if len(f) == 0]
+    rewritten, namespace = _share_groupbys(runnable, df)
+    rewritten = dict(zip(runnable, rewritten))
+    outputs = []
+    for i, (command, failures) in enumerate(zip(commands, checked)):
+        if len(failures) == 0:
+            try:
+                result = _render_result(eval(rewritten[command], {}, namespace), lines_each, max_tokens=tokens_each)
+            except Exception as e:
+                failures.append(f"error: {e}")
+        if len(failures) > 0:
+            result = _format_failures(failures)
+        outputs.append(f"[{i}] {command}\n{result}")
+    return "\n\n".join(outputs)
+
+
 class AnalystSig(dspy.Signature):
     """
     You are a curious and rigorous AI scientist, specializing in data analysis. It is your
@@ -110,7 +311,15 @@ class AnalystSig(dspy.Signature):
     Input a question about a dataset along with the background/context for the question. Return 
     your best answer, including caveats and an explanation of your confidence in the 
     assessment. You can use your python skills to analyze the dataset using single-line calls
-    to the pandas API.
+    to the pandas API. When you have several independent questions about the data, send them
+    together with pandas_batch_query to save time.
+
+    For cross-run analysis, df holds the results of many experiments stacked together, with a
+    run_id column and run-level metadata in columns starting with "run_"; group by run_id to
+    compare experiments.
+
+    On very large datasets, queries run on a stratified sample unless you pass exact=True; the
+    result will say so and include error bars. Use exact=True for numbers in your final report.
 
     If you get a "Command failed" error, try asking a different question! Do not import anything,
     do not try to make multiple calls with a ";", don't create new columns, and do not use 
@@ -128,7 +337,7 @@ class AnalystSig(dspy.Signature):
     """
     background:str = dspy.InputField()
     question:str = dspy.InputField()
-    description:str = dspy.InputField(desc="df.describe()")
+    description:str = dspy.InputField(desc="statistical digest of the dataset df")
     report:str = dspy.OutputField()
     summary:str = dspy.OutputField()
     #answer:str = dspy.OutputField()
@@ -141,47 +350,159 @@ class Analyst(dspy.Module):
     """
     def __init__(self, max_iters:int=25, strict:bool=True,
                  df:typing.Union[None,pd.core.frame.DataFrame]=None,
-                 verbose:bool=False):
+                 verbose:bool=False, keep_last:int=4, max_trajectory_tokens:int=8000,
+                 max_repeats:int=3, batch:bool=True, digest:bool=True, digest_tokens:int=1500,
+                 sample_threshold:int=1000000, sample_size:int=100000, dataset=None,
+                 result_tokens:int=1000):
         """
         :max_iters: max number of ReAct iterations to query dataset for analysis
         :strict: if True, only permit explicitly whitelisted pandas functions
         :df: pandas DataFrame to use for analysis
         :verbose: if True, print out each stage of analysis
+        :keep_last: number of most recent query results to show the LLM verbatim; older ones get summarized
+        :max_trajectory_tokens: approximate token ceiling for the trajectory sent on each iteration
+        :max_repeats: end the analysis early if the LLM submits the same failing query this many times
+        :batch: if True, also give the LLM a tool for running several queries in one step
+        :digest: if True, describe the dataset with describe_dataframe() (types, missingness, categorical
+            levels, correlations, variation between replicates) instead of just df.describe()
+        :digest_tokens: approximate token budget for the digest
+        :sample_threshold: for datasets with more rows than this, exploratory queries run on a stratified
+            sample unless the LLM asks for exact=True
+        :sample_size: approximate number of rows in the sample
+        :dataset: optional RunDataset to analyze instead of a single DataFrame. Each query only loads
+            the columns it mentions.
+        :result_tokens: approximate token budget for each tool response; longer results get truncated
         """
         self.max_iters = max_iters
         self.strict = strict
+        self.digest = digest
+        self.digest_tokens = digest_tokens
+        self.result_tokens = result_tokens
+        self.sample_threshold = sample_threshold
+        self.sample_size = sample_size
+        self._samples = {}
+        self.dataset = dataset
+        self.breaker = CircuitBreaker("pandas_query", max_repeats=max_repeats)
+        self.recorder = None
         self.df = df
         self.verbose = verbose
         self.counter = 0
-        self.react = dspy.ReAct(AnalystSig, tools=[self.pandas_query], 
-                      max_iters=max_iters)
+        tools = [self.pandas_query]
+        if batch:
+            tools.append(self.pandas_batch_query)
+        self.react = CompactReAct(AnalystSig, tools=tools, 
+                      max_iters=max_iters, keep_last=keep_last,
+                      max_trajectory_tokens=max_trajectory_tokens)
         
     def set_dataframe(self, df=pd.core.frame.DataFrame):
         self.df = df
+        self.dataset = None
+        self._samples = {}
 
-    def pandas_query(self, command:str) -> str:
+    def set_dataset(self, dataset):
+        self.dataset = dataset
+        self.df = None
+        self._samples = {}
+
+    def _get_frame(self, exact:bool, command:str="") -> tuple:
         """
-        Use a single line of pandas code to probe the dataset
+        Dataframe to run a query on: the full one, or a cached stratified sample for exploratory
+        queries on huge datasets. For a RunDataset, only the columns the command needs get loaded,
+        or a sample of the runs if it doesn't name any. Returns the full frame and the one to query.
+        """
+        if self.dataset is not None:
+            columns = self.dataset.columns_for(command)
+            full = self.dataset.load(columns)
+            key = None if columns is None else tuple(sorted(columns))
+        else:
+            full = self.df
+            key = None
+        if exact or (self.sample_threshold is None) or (len(full) <= self.sample_threshold):
+            return full, full
+        if key not in self._samples:
+            sample = _stratified_sample(full, self.sample_size)
+            num = sample.select_dtypes(include="number")
+            # finite population correction, since we're sampling without replacement
+            fpc = np.sqrt(1 - len(sample)/len(full))
+            self._samples[key] = (sample, fpc*num.std()/np.sqrt(len(sample)))
+        return full, self._samples[key][0]
+
+    def _annotate(self, command:str, result, full:pd.core.frame.DataFrame, frame:pd.core.frame.DataFrame):
+        if frame is not full:
+            errors = [e for s,e in self._samples.values() if s is frame][0]
+            result = f"{_sample_note(command, frame, len(full), errors)}\n{result}"
+        if (self.dataset is not None) and (self.dataset.columns_for(command) is None):
+            result = f"{self.dataset.sample_note()}\n{result}"
+        return result
+
+    def pandas_query(self, command:str, exact:bool=False) -> str:
+        """
+        Use a single line of pandas code to probe the dataset. On very large datasets this runs on a
+        sample unless exact=True.
         """
         if self.verbose:
             print(f"({self.counter}) analyst command: {command}")
-        result = _pandas_query(command, self.df, strict=self.strict)
-        # this is where we could potentially change the output when the LLM
-        # keeps repeating a failed query
+        full, frame = self._get_frame(exact, command)
+        if self.recorder is not None:
+            result = self.recorder.tool("analyst.pandas_query", {"command":command, "exact":exact},
+                                        lambda: _pandas_query(command, frame, strict=self.strict, max_tokens=self.result_tokens))
+        else:
+            result = _pandas_query(command, frame, strict=self.strict, max_tokens=self.result_tokens)
+        # nudge the LLM if it keeps repeating a failed query, and give up if it won't stop
+        failed = isinstance(result, str) and result.startswith("Command failed")
+        if not failed:
+            result = self._annotate(command, result, full, frame)
+        result = self.breaker.check(command, result, failed)
+        if self.verbose:
+            print(f"({self.counter}) analyst response: {result}")
+        self.counter += 1
+        return result
+    
+    def pandas_batch_query(self, commands:typing.List[str], exact:bool=False) -> str:
+        """
+        Use a list of up to 10 single-line pandas commands to probe the dataset all at once. On very
+        large datasets this runs on a sample unless exact=True.
+        """
+        # LLMs sometimes pass a single command as a plain string
+        if isinstance(commands, str):
+            commands = [commands]
+        if self.verbose:
+            print(f"({self.counter}) analyst commands: {commands}")
+        full, frame = self._get_frame(exact, " ".join(commands))
+        if self.recorder is not None:
+            result = self.recorder.tool("analyst.pandas_batch_query", {"commands":commands, "exact":exact},
+                                        lambda: _pandas_batch_query(commands, frame, strict=self.strict,
+                                                                    max_tokens=self.result_tokens))
+        else:
+            result = _pandas_batch_query(commands, frame, strict=self.strict,
+                                                                    max_tokens=self.result_tokens)
+        failed = result.count("Command failed") >= len(commands)
+        if not failed:
+            result = self._annotate(" ".join(commands), result, full, frame)
+        result = self.breaker.check("\n".join(commands), result, failed)
         if self.verbose:
             print(f"({self.counter}) analyst response: {result}")
         self.counter += 1
         return result
     
     def forward(self, question:str, background:str="None", 
-                df:typing.Union[None,pd.core.frame.DataFrame]=None, **kwargs) -> dspy.Prediction:
+                df:typing.Union[None,pd.core.frame.DataFrame]=None, dataset=None, **kwargs) -> dspy.Prediction:
         """
         do analysis
         """
         self.counter = 0
+        self.breaker.reset()
         if df is not None:
             self.set_dataframe(df)
+        if dataset is not None:
+            self.set_dataset(dataset)
           
+        if self.dataset is not None:
+            description = self.dataset.describe(max_tokens=self.digest_tokens)
+        elif self.digest:
+            description = describe_dataframe(self.df, max_tokens=self.digest_tokens)
+        else:
+            description = self.df.describe().to_markdown()
         return self.react(question=question,
                           background=background, 
-                          description=self.df.describe().to_markdown())
+                          description=description)
@@ -1,7 +1,10 @@
 import dspy
 import warnings
+import threading
 
 from ._scrub import code_checker, _strip_markdown_from_code
+from ._react import CompactReAct, CircuitBreaker, ToolLoopFailure
+from ._parallel import run_in_threads
 
 class CoderSig(dspy.Signature):
     """
@@ -20,33 +23,163 @@ class CoderSig(dspy.Signature):
 class Coder(dspy.Module):
     """
     General-purpose coding agent
+
+    With num_candidates > 1 the coder drafts several implementations at once, each its own ReAct loop
+    running at a different temperature. Candidates are checked automatically (code_checker() plus the
+    smoke test, if there is one) and the first one to pass wins; the others stop before their next LM
+    call. Only the winner goes to the human for review. If the human rejects it, their feedback is added
+    to the constraints and the coder falls back to a single (human-in-the-loop) loop.
     """
     def __init__(self, max_iters:int=25, human_in_loop:bool=True,
-                 verbose:bool=False):
+                 verbose:bool=False, keep_last:int=2, max_trajectory_tokens:int=8000,
+                 max_repeats:int=3, num_candidates:int=1, temperatures:list=None, smoke_test=None):
         """
         :max_iters: max number of ReAct iterations to query dataset for analysis
         :human_in_loop: if True, pass to a human before marking complete
         :df: pandas DataFrame to use for analysis
         :verbose: if True, print out each stage of analysis
+        :keep_last: number of most recent code drafts to show the LLM verbatim; older ones get dropped
+        :max_trajectory_tokens: approximate token ceiling for the trajectory sent on each iteration
+        :max_repeats: give up if the LLM resubmits the same failing code this many times
+        :num_candidates: int; number of implementations to draft in parallel. 1 for a single loop
+        :temperatures: list of floats, one per candidate. Defaults to evenly spaced between 0 and 1
+        :smoke_test: optional function that inputs the code (as a string) and raises an exception if
+            it doesn't work, e.g. by running it on a tiny example. The error message goes back to the LLM.
         """
+        if temperatures is not None:
+            assert len(temperatures) == num_candidates, "need one temperature per candidate"
+        elif num_candidates > 1:
+            temperatures = [round(i/(num_candidates-1), 2) for i in range(num_candidates)]
         self.max_iters = max_iters
+        self.breaker = CircuitBreaker("validate_code", max_repeats=max_repeats)
+        self.recorder = None
         self.human_in_loop = human_in_loop
         self.verbose = verbose
-        self.react = dspy.ReAct(CoderSig, tools=[self.validate_code], 
-                      max_iters=max_iters)
-        
-    def validate_code(self, code:str) -> str:
+        self.num_candidates = num_candidates
+        self.temperatures = temperatures
+        self.smoke_test = smoke_test
+        self.react = CompactReAct(CoderSig, tools=[self.validate_code], 
+                      max_iters=max_iters, keep_last=keep_last,
+                      max_trajectory_tokens=max_trajectory_tokens,
+                      superseded_args=["code"])
+        # separate loops (and circuit breakers) for speculative drafting
+        self.candidates = []
+        self._breakers = []
+        if num_candidates > 1:
+            for i in range(num_candidates):
+                self._breakers.append(CircuitBreaker("validate_code", max_repeats=max_repeats))
+                self.candidates.append(CompactReAct(CoderSig, tools=[self._candidate_tool(i)],
+                                                    max_iters=max_iters, keep_last=keep_last,
+                                                    max_trajectory_tokens=max_trajectory_tokens,
+                                                    superseded_args=["code"]))
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._winner = None
+
+    @property
+    def last_call(self):
+        """
+        The ReAct call that produced the last code returned: the serial loop if it ran, otherwise
+        the winning candidate
+        """
+        if self.react.last_call is not None:
+            return self.react.last_call
+        if self._winner is not None:
+            return self.candidates[self._winner[0]].last_call
+        return None
+
+    def _smoke(self, code:str) -> str:
+        try:
+            self.smoke_test(_strip_markdown_from_code(code))
+        except Exception as e:
+            return (f"Code failed for the following reasons:\n* smoke test raised {type(e).__name__}: {e}"
+                    "\n**Please reframe your code to address these problems.**")
+        return "pass"
+
+    def _check(self, code:str, human_in_loop:bool) -> str:
         """
-        Use a single line of pandas code to probe the dataset
+        code_checker(), then the smoke test, then the human- so nobody gets asked about code that crashes
         """
+        if self.smoke_test is None:
+            return code_checker(code, human_in_loop=human_in_loop)
+        result = code_checker(code, human_in_loop=False)
+        if result == "pass":
+            result = self._smoke(code)
+        if (result == "pass") and human_in_loop:
+            result = code_checker(code, human_in_loop=True)
+        return result
+
+    def _run_check(self, stream:str, code:str, human_in_loop:bool) -> str:
         if self.verbose:
             print(f"code: {code}")
-        result = code_checker(code, human_in_loop=self.human_in_loop)
-        if result == "pass":
-            self._code_passed_check = code
+        if self.recorder is not None:
+            result = self.recorder.tool(stream, code, lambda: self._check(code, human_in_loop))
+        else:
+            result = self._check(code, human_in_loop)
         if self.verbose:
             print(f"code-checker result: {result}")
         return result
+
+    def validate_code(self, code:str) -> str:
+        """
+        Check that your code follows the rules (and runs, if there's a smoke test). Returns "pass" or a list of problems to fix
+        """
+        result = self._run_check("coder.validate_code", code, self.human_in_loop)
+        if result == "pass":
+            self._code_passed_check = code
+        return self.breaker.check(code, result, result != "pass")
+
+    def _candidate_tool(self, i:int):
+        breaker = self._breakers[i]
+
+        def validate_code(code:str) -> str:
+            """
+            Check that your code follows the rules (and runs, if there's a smoke test). Returns "pass" or a list of problems to fix
+            """
+            if self._cancel.is_set():
+                raise ToolLoopFailure("cancelled; another candidate already passed")
+            result = self._run_check(f"coder.validate_code.{i}", code, False)
+            if result == "pass":
+                with self._lock:
+                    if self._winner is None:
+                        self._winner = (i, code)
+                self._cancel.set()
+                # no need to wait for this loop to call finish()
+                raise ToolLoopFailure("pass")
+            return breaker.check(code, result, True)
+        return validate_code
+
+    def _speculate(self, **inputs):
+        """
+        Run every candidate loop at once; return the first code to pass the automated checks, or
+        None along with what went wrong with each candidate
+        """
+        self._cancel.clear()
+        self._winner = None
+        lm = dspy.settings.lm
+
+        def _candidate(i):
+            self._breakers[i].reset()
+            self.candidates[i].cancel_event = self._cancel
+            with dspy.context(lm=lm.copy(temperature=self.temperatures[i])):
+                return self.candidates[i](**inputs)
+
+        results = run_in_threads([lambda i=i: _candidate(i) for i in range(self.num_candidates)],
+                                 return_exceptions=True)
+        if self._winner is not None:
+            self.winning_candidate = self._winner[0]
+            call = self.candidates[self.winning_candidate].last_call
+            n = 0 if call is None else len(set(int(k.split("_")[-1]) for k in call["trajectory"]))
+            if (n > 0) and (call["trajectory"][f"observation_{n-1}"] == "pass"):
+                # the loop was stopped as soon as the code passed; record it the way a finished loop looks,
+                # so it can be used as a demo
+                call["trajectory"].update({f"thought_{n}":"The code passed.", f"tool_name_{n}":"finish",
+                                           f"tool_args_{n}":{}, f"observation_{n}":"Completed."})
+                call["failure"] = None
+            return self._winner[1], []
+        failures = [str(r) if isinstance(r, Exception) else r.get("failure", "ran out of iterations")
+                    for r in results]
+        return None, failures
     
     def forward(self, background:str, plan:str, function_name:str, 
                 constraints:str="None", **kwargs) -> dspy.Prediction:
@@ -54,6 +187,22 @@ class Coder(dspy.Module):
         write code and make sure it's OK to run
         """
         self._code_passed_check = False
+        self.breaker.reset()
+        self._winner = None
+        for react in [self.react] + self.candidates:
+            react.last_call = None
+        if self.num_candidates > 1:
+            code, failures = self._speculate(background=background, plan=plan,
+                                             function_name=function_name, constraints=constraints)
+            if code is None:
+                raise Exception("Coder failed to pass checks! No candidate passed:\n" +
+                                "\n".join(f"* candidate {i}: {f}" for i, f in enumerate(failures)))
+            if not self.human_in_loop:
+                return dspy.Prediction(code=code)
+            review = self._run_check("coder.review", code, True)
+            if review == "pass":
+                return dspy.Prediction(code=code)
+            constraints = f"{constraints}\n\nA reviewer rejected an earlier attempt:\n{code}\n\n{review}"
         code = self.react(background=background,
                           plan=plan,
                           function_name=function_name,
@@ -62,5 +211,7 @@ class Coder(dspy.Module):
             if _strip_markdown_from_code(code.code) != self._code_passed_check:
                 warnings.warn(f"why did the code change???\npassed check: {self._code_passed_check}\nreturned: {code.code}")
             return dspy.Prediction(code=self._code_passed_check)
+        elif "failure" in code:
+            raise Exception(f"Coder failed to pass checks! {code.failure}\n{code.code}")
         else:
             raise Exception(f"Coder failed to pass checks!\n{code.code}")
@@ -1,5 +1,4 @@
 import dspy
-import mlflow
 import json
 
 from ._main import Laboratory
@@ -17,10 +16,11 @@ class LaboratoryWithIdeaCritic(Laboratory):
     the workflow that the laboratory follows, subclass Laboratory and overwrite two functions:
 
     * setup() initializes all the agents and any other data structures you need
-    * run_one_experiment() runs a single end-to-end experiment.
+    * run_one_experiment() runs a single end-to-end experiment. By default this calls propose_experiment(),
+      run_experiment() and analyze_results(), so you can also just overwrite those.
 
-    For now assume we're using the same LLM for everything. Could potentially make that configurable in the
-    future, but would require changing a few things.
+    By default every agent uses the same LLM. Use agent_lms to route individual agents to different models,
+    or to give an agent a list of models to escalate through (cheapest first) when it fails or stalls.
 
     Before creating the Laboratory object:
     * initialize a dspy.LM object for the LLM you're using
@@ -30,6 +30,17 @@ class LaboratoryWithIdeaCritic(Laboratory):
     IN THIS VERSION: skip the Planner agent; not sure that was really helping. But allow the Ideator to interact
     with a critic agent to refine its hypothesis.
     """
+    def __init__(self, *args, parallel_critics:bool=False, ideator_iters:int=5, **kwargs):
+        """
+        Same arguments as Laboratory, plus:
+
+        :parallel_critics: bool; if True, the ideator gets simultaneous feedback from separate novelty,
+            feasibility and alignment critics on each turn instead of one general critic
+        :ideator_iters: int; max number of ideator/critic turns
+        """
+        self.parallel_critics = parallel_critics
+        self.ideator_iters = ideator_iters
+        super().__init__(*args, **kwargs)
 
     def setup(self):
         """
@@ -40,9 +51,11 @@ class LaboratoryWithIdeaCritic(Laboratory):
         This is also a good place to check the prompts the user passes to make sure the right stuff is included.
         """
         # create each agent we'll need
-        self.agents["ideator"] = ReActIdeator(verbose=self.verbose)
+        self.agents["ideator"] = ReActIdeator(max_iters=self.ideator_iters, verbose=self.verbose,
+                                              parallel_critics=self.parallel_critics)
         #self.agents["planner"] = dspy.ChainOfThought(PlannerSig)
-        self.agents["coder"] = Coder(human_in_loop=self.human_in_loop, verbose=self.verbose)
+        self.agents["coder"] = Coder(human_in_loop=self.human_in_loop, verbose=self.verbose,
+                                     num_candidates=self.coder_candidates, smoke_test=self.smoke_test)
         self.agents["analyst"] = Analyst(verbose=self.verbose)
         # identify the columns we'll need from mlflow to report on the history of the experiments
         self.mlflow_column_mapping = {
@@ -50,12 +63,13 @@ class LaboratoryWithIdeaCritic(Laboratory):
             #"params.planner.title":"title",
             "params.ideator.idea_title":"title",
             "params.ideator.idea_summary":"summary",
-            f"metrics.{self.metric_name}":f"{self.metric_name}",
             #"params.analyst.answer":"analysis",
             "params.analyst.summary":"analysis",
             "tags.status":"status",
             "tags.comment":"comment"
         }
+        for m in self.metric_names:
+            self.mlflow_column_mapping[f"metrics.{m}"] = m
         for k in ["background", "analysis_question", "function_name", "constraints"]:
             assert k in self.prompts, f"Missing prompt {k}"
 
@@ -69,13 +83,12 @@ class LaboratoryWithIdeaCritic(Laboratory):
         # Implementation Constraints
         {self.prompts["constraints"]}
         """
-        mlflow.set_experiment_tag("mlflow.note.content", description)
+        self.tracker.set_experiment_tag(self.experiment_name, "mlflow.note.content", description)
 
 
-    def run_one_experiment(self, **kwargs):
+    def propose_experiment(self, **kwargs):
         """
-        Run one full experiment. To customize the lab workflow, subclass Laboratory and overwrite this
-        function and setup().
+        Generate and refine an idea with the ideator/critic pair, then implement it as code.
 
         :idea: should be a dictionary with keys "title" and "summary"
         """
@@ -104,7 +117,9 @@ class LaboratoryWithIdeaCritic(Laboratory):
                 if k not in kwargs["idea"]:
                     assert False, f"missing key {k} from idea dictionary"
             #idea = {"idea":kwargs["idea"]}
-            mlflow.log_params({"ideator.idea_"+k:kwargs["idea"][k] for k in kwargs["idea"]})
+            self.tracker.log_params({"ideator.idea_"+k:kwargs["idea"][k] for k in kwargs["idea"]})
+            idea = {"idea_"+k:kwargs["idea"][k] for k in kwargs["idea"]}
+            outdict.update(idea)
         # implement plan as python code
         if "code" not in kwargs:
             code = self._call_agent("coder", background=p["background"],
@@ -113,16 +128,18 @@ class LaboratoryWithIdeaCritic(Laboratory):
                                     constraints=p["constraints"]).code
         else:
             code = kwargs["code"]
-            mlflow.log_param("coder.code", kwargs["code"])
+            self.tracker.log_param("coder.code", kwargs["code"])
         outdict["code"] = code
-        # run the experiment
-        results = self.experiment_fn(code)
-        mlflow.log_metric(self.metric_name, results[self.metric_name])
-        # write up an analysis of the results
+        return outdict
+
+    def analyze_results(self, results, outdict):
+        """
+        Write up an analysis of the experiment results
+        """
+        p = self.prompts
         analysis = self._call_agent("analyst", df=results["df"],
                                         question=p["analysis_question"],
                                         background=p["background"])
         #outdict["analysis"] = analysis.answer
-        outdict["analysis_report"] = analysis.report
-        outdict["analysis_summary"] = analysis.summary
-        return outdict
\ No newline at end of file
+        return {"analysis_report":analysis.report,
+                "analysis_summary":analysis.summary}
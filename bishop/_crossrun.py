@@ -0,0 +1,262 @@
+import re
+import ast
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ._mlflow import _fetch_artifact, _read
+from ._digest import _markdown, _truncate
+from ._react import _estimate_tokens
+
+
+def _artifact_columns(path:str, fmt:str) -> list:
+    """
+    Column names of a cached artifact, without reading the data
+    """
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        # leave out the index pandas saves alongside the data
+        return [c for c in pq.read_schema(path).names if not re.match(r"__index_level_\d+__", c)]
+    if fmt == "feather":
+        import pyarrow.ipc
+        with pyarrow.ipc.open_file(path) as reader:
+            return reader.schema.names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def _names_in(command:str) -> set:
+    """
+    Every identifier and string literal in a pandas command; used to guess which columns
+    it touches
+    """
+    names = set(re.findall(r"[A-Za-z_]\w*", command))
+    try:
+        for node in ast.walk(ast.parse(command)):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                names.add(node.value)
+    except SyntaxError:
+        pass
+    return names
+
+
+class RunDataset():
+    """
+    Results frames from many mlflow runs, treated as one dataset partitioned by run ID.
+
+    Nothing is read into memory until a query needs it: artifacts are downloaded into the
+    local cache on first use, and each query only loads the columns it mentions (from every
+    run, in parallel). Queries that don't mention any columns, like df.head(), only run on a
+    sample of the runs. Run-level metadata (metrics, titles, status...) shows up as extra columns
+    prefixed with "run_", broadcast onto every row of that run, so a single pandas command
+    can relate per-row results to how each experiment turned out.
+
+    Pass one to Analyst(dataset=...) or use Laboratory.analyze_history().
+    """
+    def __init__(self, run_ids:list, artifact_path:str="eval_results.parquet", runs:pd.DataFrame=None,
+                 cache_dir:str=None, max_workers:int=8, max_cached:int=4, sample_runs:int=5):
+        """
+        :run_ids: list of strings; mlflow runs to include
+        :artifact_path: string; path of the results artifact within each run
+        :runs: optional DataFrame of run-level metadata with a "run_id" column
+        :cache_dir: string; where to cache downloads
+        :max_workers: int; number of partitions to download/read at once
+        :max_cached: int; number of assembled column subsets to keep in memory
+        :sample_runs: int; number of runs to load every column from, for queries that don't
+            name any columns
+        """
+        self.run_ids = list(run_ids)
+        self.artifact_path = artifact_path
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.max_cached = max_cached
+        self.sample_runs = sample_runs
+        if runs is None:
+            runs = pd.DataFrame({"run_id":self.run_ids})
+        runs = runs.set_index("run_id")
+        self.runs = runs.rename(columns={c:f"run_{c}" for c in runs.columns})
+        self._files = None
+        self._rows = {}
+        self._cache = OrderedDict()
+
+    @classmethod
+    def from_experiment(cls, experiment_name:str, mapping:dict=None, status:str="complete",
+                        max_runs:int=None, **kwargs):
+        """
+        Build a dataset from the runs of an mlflow experiment.
+
+        :experiment_name: string; name of the mlflow experiment
+        :mapping: dictionary mapping mlflow columns (e.g. "metrics.accuracy") to names for
+            the run-level metadata. Defaults to the status tag plus every metric except the lab's
+            own bookkeeping (token counts, costs and per-agent stats).
+        :status: string; only include runs with this status tag. None for all runs
+        :max_runs: int; only include the most recent max_runs runs
+        :kwargs: passed to RunDataset()
+        """
+        import mlflow
+
+        runs = mlflow.search_runs(experiment_names=[experiment_name], order_by=["attributes.start_time DESC"])
+        if (status is not None) and ("tags.status" in runs.columns):
+            runs = runs[runs["tags.status"] == status]
+        if max_runs is not None:
+            runs = runs.head(max_runs)
+        if mapping is None:
+            bookkeeping = ["prompt_tokens", "completion_tokens", "cost"]
+            mapping = {c:c.replace("metrics.", "") for c in runs.columns if c.startswith("metrics.") and
+                       ("." not in c[8:]) and not any(c[8:].startswith(b) for b in bookkeeping)}
+            mapping["tags.status"] = "status"
+        meta = pd.DataFrame({"run_id":runs["run_id"]})
+        for k, v in mapping.items():
+            if k in runs.columns:
+                meta[v] = runs[k].values
+        return cls(list(runs["run_id"]), runs=meta, **kwargs)
+
+    def _fetch_all(self):
+        """
+        Make sure every partition is in the local cache and note its columns
+        """
+        if self._files is not None:
+            return
+
+        def _one(run_id):
+            try:
+                path, fmt = _fetch_artifact(run_id, self.artifact_path, self.cache_dir)
+                return run_id, (path, fmt, _artifact_columns(path, fmt))
+            except Exception:
+                return run_id, None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            found = [(r, f) for r, f in pool.map(_one, self.run_ids) if f is not None]
+        self._files = OrderedDict(found)
+        self.missing = [r for r in self.run_ids if r not in self._files]
+
+    @property
+    def row_columns(self) -> list:
+        self._fetch_all()
+        columns = []
+        for _, _, cols in self._files.values():
+            columns += [c for c in cols if c not in columns]
+        return columns
+
+    @property
+    def columns(self) -> list:
+        return ["run_id"] + self.row_columns + list(self.runs.columns)
+
+    def columns_for(self, command:str) -> list:
+        """
+        The columns a pandas command seems to need, or None if it doesn't mention any
+        """
+        names = _names_in(command)
+        needed = [c for c in self.columns[1:] if c in names]
+        if len(needed) == 0:
+            return None
+        return ["run_id"] + needed
+
+    def sampled_runs(self) -> list:
+        """
+        The runs that queries without any columns get run on: a fixed random sample of
+        sample_runs of them, so repeated queries see the same rows
+        """
+        self._fetch_all()
+        run_ids = list(self._files.keys())
+        if len(run_ids) <= self.sample_runs:
+            return run_ids
+        picked = np.random.default_rng(0).choice(len(run_ids), size=self.sample_runs, replace=False)
+        return [run_ids[i] for i in sorted(picked)]
+
+    def load(self, columns:list=None) -> pd.DataFrame:
+        """
+        Assemble the dataset from every run, with only the requested columns (plus run_id).
+        With columns=None, every column gets loaded but only from sampled_runs(); pass
+        self.columns to really load everything.
+        """
+        self._fetch_all()
+        if columns is None:
+            columns = self.columns
+            run_ids = self.sampled_runs()
+        else:
+            run_ids = list(self._files.keys())
+        key = (tuple(sorted(set(columns))), tuple(run_ids))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        row_columns = [c for c in self.row_columns if c in columns]
+        run_columns = [c for c in self.runs.columns if c in columns]
+
+        def _one(run_id):
+            path, fmt, cols = self._files[run_id]
+            wanted = [c for c in row_columns if c in cols]
+            if len(wanted) == 0:
+                # still need the right number of rows for run-level columns and missing values
+                return pd.DataFrame(index=pd.RangeIndex(self._num_rows(run_id)))
+            return _read(path, fmt, wanted)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            frames = list(pool.map(_one, run_ids))
+        lengths = [len(f) for f in frames]
+        if len(frames) > 0:
+            df = pd.concat(frames, ignore_index=True)
+        else:
+            df = pd.DataFrame(columns=row_columns)
+        df = df.reindex(columns=row_columns)
+        # categorical, since it's repeated on every row
+        df.insert(0, "run_id", pd.Categorical(np.repeat(run_ids, lengths), categories=run_ids))
+        for c in run_columns:
+            df[c] = self.runs[c].reindex(run_ids).repeat(lengths).values
+        self._cache[key] = df
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        return df
+
+    def __len__(self) -> int:
+        self._fetch_all()
+        return int(sum(self._num_rows(r) for r in self._files))
+
+    def _num_rows(self, run_id:str) -> int:
+        """
+        Number of rows in a run's results, from the file's metadata where the format has it,
+        otherwise by reading a single column
+        """
+        if run_id not in self._rows:
+            path, fmt, cols = self._files[run_id]
+            if fmt == "parquet":
+                import pyarrow.parquet as pq
+                rows = pq.read_metadata(path).num_rows
+            elif fmt == "feather":
+                import pyarrow.feather
+                rows = pyarrow.feather.read_table(path, columns=cols[:1], memory_map=True).num_rows
+            else:
+                rows = len(pd.read_csv(path, usecols=[0])) if len(cols) > 0 else 0
+            self._rows[run_id] = rows
+        return self._rows[run_id]
+
+    def sample_note(self) -> str:
+        """
+        Warning for the results of queries that only ran on sampled_runs()
+        """
+        return (f"Note: this query doesn't name any columns, so it only ran on {len(self.sampled_runs())} "
+                f"of the {len(self._files)} runs. Mention the columns you need to query every run.")
+
+    def describe(self, max_tokens:int=1500, round_to:int=3) -> str:
+        """
+        Markdown overview of the dataset for the Analyst: size, where each column comes from
+        and the run-level metadata. Doesn't load the per-row data.
+        """
+        self._fetch_all()
+        overview = (f"{len(self._files)} runs, {len(self)} rows in total, partitioned by run_id. "
+                    f"Columns starting with run_ hold run-level metadata, repeated on every row of that run.")
+        if len(self.missing) > 0:
+            overview += f" {len(self.missing)} runs had no {self.artifact_path} artifact and are left out."
+        present = {c:sum(c in cols for _, _, cols in self._files.values()) for c in self.row_columns}
+        table = pd.DataFrame({"level":["row"]*len(present) + ["run"]*self.runs.shape[1],
+                              "runs_with_column":list(present.values()) + [len(self._files)]*self.runs.shape[1]},
+                             index=list(present.keys()) + list(self.runs.columns))
+        runs = self.runs.reindex(list(self._files.keys())).round(round_to)
+        digest = ""
+        for title, text in [("Overview", overview), ("Columns", _markdown(table)), ("Runs", _markdown(runs))]:
+            remaining = max_tokens - _estimate_tokens(digest)
+            if remaining < 20:
+                break
+            digest += _truncate(f"## {title}\n{text}\n\n", remaining)
+        return digest.strip()
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+
+from ._react import _estimate_tokens
+
+
+def _markdown(df:pd.DataFrame) -> str:
+    return df.to_markdown()
+
+
+def _overview(df:pd.DataFrame) -> str:
+    text = f"{len(df)} rows x {df.shape[1]} columns"
+    if "experiment_index" in df.columns:
+        text += f"; results from {df['experiment_index'].nunique()} replicates (column experiment_index)"
+    return text
+
+
+def _hashable(col:pd.Series) -> tuple:
+    """
+    The column itself, or its string representation if it holds unhashable values like lists
+    or dicts, along with its number of distinct values
+    """
+    try:
+        return col, col.nunique()
+    except TypeError:
+        col = col.astype(str)
+        return col, col.nunique()
+
+
+def _columns(df:pd.DataFrame, nunique:pd.Series) -> str:
+    missing = df.isna().sum()
+    table = pd.DataFrame({"dtype":df.dtypes.astype(str),
+                          "missing":missing,
+                          "missing_pct":(100*missing/max(len(df), 1)).round(1),
+                          "unique":nunique})
+    return _markdown(table)
+
+
+def _numeric(num:pd.DataFrame, round_to:int) -> str:
+    stats = num.agg(["mean", "std", "min", "max"]).T
+    quantiles = num.quantile([0.25, 0.5, 0.75]).T
+    quantiles.columns = ["25%", "50%", "75%"]
+    table = pd.concat([stats, quantiles], axis=1)[["mean", "std", "min", "25%", "50%", "75%", "max"]]
+    # outliers by the 1.5*IQR rule
+    iqr = quantiles["75%"] - quantiles["25%"]
+    low = quantiles["25%"] - 1.5*iqr
+    high = quantiles["75%"] + 1.5*iqr
+    table["outliers"] = (num.lt(low, axis=1) | num.gt(high, axis=1)).sum()
+    return _markdown(table.round(round_to))
+
+
+def _categorical(columns:dict, max_levels:int) -> str:
+    lines = []
+    for c, col in columns.items():
+        counts = col.value_counts(dropna=False)
+        top = ", ".join([f"{k} ({v})" for k,v in counts.head(max_levels).items()])
+        more = f", ... {len(counts)-max_levels} more" if len(counts) > max_levels else ""
+        lines.append(f"* {c}: {len(counts)} levels; {top}{more}")
+    return "\n".join(lines)
+
+
+def _correlations(num:pd.DataFrame, max_pairs:int, round_to:int) -> str:
+    corr = num.corr().to_numpy()
+    i, j = np.triu_indices(corr.shape[0], k=1)
+    r = corr[i, j]
+    keep = ~np.isnan(r)
+    i, j, r = i[keep], j[keep], r[keep]
+    order = np.argsort(-np.abs(r))[:max_pairs]
+    cols = num.columns
+    return "\n".join([f"* {cols[i[k]]} ~ {cols[j[k]]}: {round(r[k], round_to)}" for k in order])
+
+
+def _replicates(df:pd.DataFrame, num:pd.DataFrame, round_to:int) -> str:
+    means = df.groupby("experiment_index")[list(num.columns)].mean()
+    table = pd.DataFrame({"mean_across_replicates":means.mean(),
+                          "std_across_replicates":means.std(),
+                          "min_replicate":means.min(),
+                          "max_replicate":means.max()})
+    return _markdown(table.round(round_to))
+
+
+def _truncate(text:str, max_tokens:int) -> str:
+    if _estimate_tokens(text) <= max_tokens:
+        return text
+    lines = text.split("\n")
+    kept = []
+    for line in lines:
+        if _estimate_tokens("\n".join(kept + [line])) > max_tokens:
+            break
+        kept.append(line)
+    return "\n".join(kept + [f"... ({len(lines)-len(kept)} more lines omitted)"])
+
+
+def describe_dataframe(df:pd.DataFrame, max_tokens:int=1500, max_levels:int=5, max_pairs:int=10,
+                       max_categories:int=50, round_to:int=3) -> str:
+    """
+    Compact statistical digest of a results frame, to hand the Analyst up front so it doesn't spend
+    tool calls rediscovering the basics: column types and missingness, numeric summaries with outlier
+    counts, levels of categorical columns, the strongest pairwise correlations, and (if the frame has
+    an experiment_index column) how much each numeric column varies between replicates.
+
+    Sections are added in that order until the token budget runs out.
+
+    :df: pandas DataFrame
+    :max_tokens: int; approximate token budget for the whole digest
+    :max_levels: int; number of most common values to show for each categorical column
+    :max_pairs: int; number of correlated column pairs to show
+    :max_categories: int; columns with more distinct values than this aren't treated as categorical
+    :round_to: int; decimal places for numbers
+    """
+    num = df.select_dtypes(include="number")
+    # experiment_index is an identifier, not a measurement
+    num = num.loc[:, [c for c in num.columns if (not pd.api.types.is_bool_dtype(num[c])) and (c != "experiment_index")]]
+    hashable = {c:_hashable(df[c]) for c in df.columns}
+    nunique = pd.Series({c:n for c, (_, n) in hashable.items()}, dtype=int)
+    categorical = [c for c in df.columns if (c not in num.columns) and (c != "experiment_index") and
+                   (nunique[c] <= max_categories)]
+
+    sections = [("Overview", lambda: _overview(df)),
+                ("Columns", lambda: _columns(df, nunique))]
+    if num.shape[1] > 0:
+        sections.append(("Numeric columns", lambda: _numeric(num, round_to)))
+    if len(categorical) > 0:
+        sections.append(("Categorical columns", lambda: _categorical({c:hashable[c][0] for c in categorical}, max_levels)))
+    if num.shape[1] > 1:
+        sections.append(("Strongest correlations", lambda: _correlations(num, max_pairs, round_to)))
+    if ("experiment_index" in df.columns) and (nunique["experiment_index"] > 1) and (num.shape[1] > 0):
+        sections.append(("Variation between replicates", lambda: _replicates(df, num, round_to)))
+
+    digest = ""
+    for title, fn in sections:
+        remaining = max_tokens - _estimate_tokens(digest)
+        if remaining < 20:
+            break
+        digest += _truncate(f"## {title}\n{fn()}\n\n", remaining)
+    return digest.strip()
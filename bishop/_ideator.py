@@ -2,6 +2,9 @@ import dspy
 import typing
 import json
 
+from ._parallel import run_in_threads
+from ._react import CompactReAct
+
 class IdeatorSig(dspy.Signature):
     """
     You are a curious and rigorous AI scientist, specializing in data analysis. It is your
@@ -79,6 +82,54 @@ class CriticSig(dspy.Signature):
     feedback:str = dspy.OutputField()
 
 
+# specialized critics for ReActIdeator(parallel_critics=True); each one only looks at one aspect
+# of the idea, and all of them run at once
+
+class NoveltyCriticSig(dspy.Signature):
+    """
+    You are a lead scientist at a top research institution, reviewing your colleague's idea for the
+    next experiment. Your ONLY job is to judge novelty: is the idea genuinely different from the
+    experiments in the history, or a minor variation on one of them? Call out the specific previous
+    experiments it overlaps with and what would make it distinct. Be harsh but fair.
+
+    DO NOT suggest additional experiments, hyperparameter tuning, or literature review.
+    """
+    background:str = dspy.InputField()
+    history:str = dspy.InputField()
+    idea:str = dspy.InputField()
+    feedback:str = dspy.OutputField(desc="Criticism of the idea's novelty relative to previous experiments")
+
+
+class FeasibilityCriticSig(dspy.Signature):
+    """
+    You are a lead scientist at a top research institution, reviewing your colleague's idea for the
+    next experiment. Your ONLY job is to judge feasibility: is the idea detailed enough to implement,
+    and does it respect the constraints laid out in the background? Point out anything ambiguous,
+    missing, or impossible under those constraints. Be harsh but fair.
+
+    DO NOT suggest additional experiments, hyperparameter tuning, or literature review.
+    """
+    background:str = dspy.InputField()
+    history:str = dspy.InputField()
+    idea:str = dspy.InputField()
+    feedback:str = dspy.OutputField(desc="Criticism of how implementable the idea is")
+
+
+class AlignmentCriticSig(dspy.Signature):
+    """
+    You are a lead scientist at a top research institution, reviewing your colleague's idea for the
+    next experiment. Your ONLY job is to judge alignment with the evidence: does the idea respond to
+    the patterns found in the analysis of previous results? Call out specific previous experiments and
+    analysis that support or undercut it. Be harsh but fair.
+
+    DO NOT suggest additional experiments, hyperparameter tuning, or literature review.
+    """
+    background:str = dspy.InputField()
+    history:str = dspy.InputField()
+    idea:str = dspy.InputField()
+    feedback:str = dspy.OutputField(desc="Criticism of how well the idea follows from previous results")
+
+
 class ReActIdeatorSig(dspy.Signature):
     """
     You are scientist at a top research instution and are currently planning the next experiment
@@ -109,20 +160,50 @@ class ReActIdeator(dspy.Module):
     dspy Module that attempts to generate better hypotheses by simulating a conversation
     between an "ideator" agent and a "critic" agent.
     """
-    def __init__(self, max_iters:int=5, verbose:bool=False):
+    def __init__(self, max_iters:int=5, verbose:bool=False, parallel_critics:bool=False):
         """
         :max_iters: int; maximum number of times to iterate between ideator and critic
         :verbose: bool; whether to print out the interactions as they happen
+        :parallel_critics: bool; if True, send each idea to separate novelty, feasibility and alignment
+            critics at the same time and merge their feedback into one response. Gives more feedback per
+            round trip, so fewer iterations (a smaller max_iters) are usually needed.
         """
         self.counter = 0
         self.verbose=verbose
-        self.critic = dspy.ChainOfThought(CriticSig)
-        self.ideator = dspy.ReAct(ReActIdeatorSig, tools=[self._get_criticism], max_iters=max_iters)
+        self.recorder = None
+        self.parallel_critics = parallel_critics
+        if parallel_critics:
+            self.critics = {"novelty":dspy.ChainOfThought(NoveltyCriticSig),
+                            "feasibility":dspy.ChainOfThought(FeasibilityCriticSig),
+                            "alignment":dspy.ChainOfThought(AlignmentCriticSig)}
+        else:
+            self.critic = dspy.ChainOfThought(CriticSig)
+        # keep every step verbatim; CompactReAct just records the trajectory for compile_agents()
+        self.ideator = CompactReAct(ReActIdeatorSig, tools=[self._get_criticism], max_iters=max_iters,
+                                    keep_last=max_iters)
+
+    def _criticize(self, idea) -> str:
+        if not self.parallel_critics:
+            return self.critic(background=self.background, history=self._history, idea=idea).feedback
+        names = list(self.critics.keys())
+        results = run_in_threads([lambda c=self.critics[n]: c(background=self.background, history=self._history, idea=idea)
+                                  for n in names], return_exceptions=True)
+        sections = []
+        for n, r in zip(names, results):
+            feedback = f"(no feedback: {r})" if isinstance(r, Exception) else r.feedback
+            sections.append(f"## {n.capitalize()}\n{feedback}")
+        return "\n\n".join(sections)
 
     def _get_criticism(self, idea):
+        """
+        Submit your idea to your colleagues for criticism
+        """
         if self.verbose:
             print(f"({self.counter}) idea:", idea)
-        criticism = self.critic(background=self.background, history=self._history, idea=idea).feedback
+        if self.recorder is not None:
+            criticism = self.recorder.tool("ideator._get_criticism", idea, lambda: self._criticize(idea))
+        else:
+            criticism = self._criticize(idea)
         if self.verbose:
             print(f"({self.counter}) criticism:", criticism)
         self.counter += 1
@@ -1,7 +1,9 @@
 import dspy
-import mlflow
 import logging
 import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 import numpy as np
 import pandas as pd
@@ -14,7 +16,16 @@ from ._ideator import IdeatorSig
 from ._analyst import Analyst
 from ._planner import PlannerSig
 from ._coder import Coder
-from ._mlflow import get_runs_as_json
+from ._mlflow import get_runs_as_json, log_dataframe_artifact
+from ._react import CompactReAct
+from ._pruning import ExperimentPruned
+from ._queue import default_worker_name
+from ._crossrun import RunDataset
+from ._pool import ExperimentPool
+from ._telemetry import ResourceMonitor
+from ._tracking import MLflowTracker
+from ._optimize import (_reacts, _last_call, harvest_trajectories, compile_agent, save_compiled_agent,
+                        load_compiled_agent)
 
 MLFLOW_PARAM_TOKEN_LIMIT = 6000
 
@@ -26,6 +37,23 @@ PRICING = {
 }
 
 
+def _lookup_price(model:str):
+    """
+    Find the PRICING entry for a model string like "openai/gpt-4.1"; returns None if
+    we don't know what the model costs. Add entries to PRICING for other models.
+
+    Names have to match exactly (ignoring the provider prefix, case, punctuation and a dated
+    snapshot suffix like "-2025-04-14"), so e.g. "gpt-4.1-mini" doesn't get gpt-4.1's price.
+    """
+    def _normalize(x):
+        return re.sub(r"[^a-z0-9]", "", x.lower())
+    model = re.sub(r"-\d{4}-\d{2}-\d{2}$", "", model.split("/")[-1])
+    matches = [p for p in PRICING if _normalize(p) == _normalize(model)]
+    if len(matches) == 0:
+        return None
+    return PRICING[matches[0]]
+
+
 class Laboratory(dspy.Module):
     """
     This class runs fully automated in silico research.
@@ -34,10 +62,11 @@ class Laboratory(dspy.Module):
     the workflow that the laboratory follows, subclass Laboratory and overwrite two functions:
 
     * setup() initializes all the agents and any other data structures you need
-    * run_one_experiment() runs a single end-to-end experiment.
+    * run_one_experiment() runs a single end-to-end experiment. By default this calls propose_experiment(),
+      run_experiment() and analyze_results(), so you can also just overwrite those.
 
-    For now assume we're using the same LLM for everything. Could potentially make that configurable in the
-    future, but would require changing a few things.
+    By default every agent uses the same LLM. Use agent_lms to route individual agents to different models,
+    or to give an agent a list of models to escalate through (cheapest first) when it fails or stalls.
 
     Before creating the Laboratory object:
     * initialize a dspy.LM object for the LLM you're using
@@ -45,13 +74,16 @@ class Laboratory(dspy.Module):
     * configure MLFlow with mlflow.set_tracking_uri() and mlflow.set_experiment()
     """
     def __init__(self, lm, experiment_fn, experiment_name, metric_names, prompts, human_in_loop:True, verbose=False,
-                 round_to=2, max_runs=25, num_experiment_averages=1):
+                 round_to=2, max_runs=25, num_experiment_averages=1, pruner=None,
+                 agent_lms=None, recorder=None, results_artifact=None, coder_candidates=1, smoke_test=None,
+                 rate_limiter=None, resource_history=False, tracker=None):
         """
         :lm: dspy.LM object; the language model used by the agents in this experiment
         :experiment_fn: python function that handles all the details of running the actual experiment.
             * It should input a string containing the LLM-written python function for this run
             * It should output a dictionary containing the output metric and "df", a pandas dataframe of results to send
                 to the analyst agent
+            * Or pass an ExperimentPool wrapping it, to run experiments in warm worker processes with shared fixtures
         :experiment_name: string; name of the mlflow experiment
         :metric_names: list of strings; name of the performance metrics to be maximized/minimized
         :prompts: dictionary of contextual prompts for the different agents. By default this should include things like
@@ -61,6 +93,30 @@ class Laboratory(dspy.Module):
         :round_to:
         :max_runs:
         :num_experiment_averages:int; number of times to run the experiment code
+        :pruner: optional Pruner object (e.g. MedianStoppingPruner) for stopping clearly losing experiments
+            early. If this is set, experiment_fn is called as experiment_fn(code, report=report), where 
+            report(step, metrics) should be called periodically with a dictionary of intermediate metrics.
+            report() raises ExperimentPruned when the run should stop- just let it propagate.
+        :agent_lms: optional dictionary mapping agent names (e.g. "analyst", "coder") to a dspy.LM or a list
+            of dspy.LMs. Agents not in the dictionary use lm. For a list, the first model is tried first and
+            the agent escalates to the next one whenever it raises an exception or its ReAct loop stalls
+            (runs out of iterations without calling finish).
+        :recorder: optional Recorder object. In "record" mode every LM call and tool observation is logged
+            to disk; in "replay" mode the whole campaign is re-run from that log with no LM calls.
+        :results_artifact: optional string, e.g. "eval_results.parquet"; if set, log each run's results
+            dataframe as an artifact with this name (format given by the extension), so analyze_history()
+            can look for patterns across runs
+        :coder_candidates: int; if more than 1, the coder drafts this many implementations in parallel (at
+            different temperatures) and keeps the first one to pass its checks
+        :smoke_test: optional function that inputs the generated code and raises an exception if it's broken,
+            e.g. by running it on a tiny example. Failures go back to the coder before anything reaches a human.
+        :rate_limiter: optional RateLimiter object; every agent's LM calls wait on it (at the agent's priority)
+            and rate-limit errors get retried. Share one between labs using the same API key.
+        :resource_history: bool; if True, include each run's wall time, CPU time and peak memory in the history
+            the agents see (e.g. so the background prompt can ask for experiments that are cheaper to run).
+            They're logged as metrics either way.
+        :tracker: optional Tracker for logging runs and reading the history back. Defaults to MLflowTracker();
+            use a SqliteTracker for long campaigns and export_to_mlflow() afterwards
         """
         self.lm = lm
         self.model = lm.model
@@ -73,11 +129,26 @@ class Laboratory(dspy.Module):
         self.round_to = round_to
         self.max_runs = max_runs
         self.num_experiment_averages = num_experiment_averages
+        self.pruner = pruner
+        self.agent_lms = agent_lms if agent_lms is not None else {}
+        self.recorder = recorder
+        self.results_artifact = results_artifact
+        self.coder_candidates = coder_candidates
+        self.smoke_test = smoke_test
+        self.rate_limiter = rate_limiter
+        self.compiled_versions = {}
+        self.resource_history = resource_history
+        self._resources = []
+        self.tracker = tracker if tracker is not None else MLflowTracker()
 
         # set up all our agents
         self.agents = {}
         self.usage = {}
         self.setup()
+        # agents with tools record their observations too
+        for agent in self.agents.values():
+            if hasattr(agent, "recorder"):
+                agent.recorder = recorder
 
     def setup(self):
         """
@@ -90,14 +161,15 @@ class Laboratory(dspy.Module):
         # create each agent we'll need
         self.agents["ideator"] = dspy.ChainOfThought(IdeatorSig)
         self.agents["planner"] = dspy.ChainOfThought(PlannerSig)
-        self.agents["coder"] = Coder(human_in_loop=self.human_in_loop, verbose=self.verbose)
+        self.agents["coder"] = Coder(human_in_loop=self.human_in_loop, verbose=self.verbose,
+                                     num_candidates=self.coder_candidates, smoke_test=self.smoke_test)
         self.agents["analyst"] = Analyst(verbose=self.verbose)
         # identify the columns we'll need from mlflow to report on the history of the experiments
         self.mlflow_column_mapping = {
             "params.planner.final_hypothesis":"hypothesis",
             "params.planner.title":"title",
             #f"metrics.{self.metric_name}":f"{self.metric_name}",
-            "params.analyst.answer":"analysis",
+            "params.analyst.summary":"analysis",
             "tags.status":"status",
             "tags.comment":"comment"
         }
@@ -116,27 +188,106 @@ class Laboratory(dspy.Module):
         # Implementation Constraints
         {self.prompts["constraints"]}
         """
-        mlflow.set_experiment_tag("mlflow.note.content", description)
+        self.tracker.set_experiment_tag(self.experiment_name, "mlflow.note.content", description)
 
     def _get_history(self, **kwargs):
         """
         Get run history as a json formatted string.
         """
         history = get_runs_as_json(self.experiment_name, self.mlflow_column_mapping, 
-                                           round_to=self.round_to, max_runs=self.max_runs, **kwargs)
+                                           round_to=self.round_to, max_runs=self.max_runs,
+                                           resources=self.resource_history, tracker=self.tracker, **kwargs)
         return json.dumps(history)
     
-    def _run_experiments_and_return_average(self, code):
-        if self.num_experiment_averages == 1:
-            return self.experiment_fn(code)
+    def _report_progress(self, step:int, metrics:dict):
+        """
+        Progress callback handed to experiment_fn when a pruner is configured. Logs the
+        intermediate metrics to mlflow and raises ExperimentPruned if the run looks hopeless.
+        """
+        for k in metrics:
+            self.tracker.log_metric(f"intermediate.{k}", metrics[k], step=step)
+        if self.pruner.metric_name in metrics:
+            value = self.pruner.report(step, metrics[self.pruner.metric_name])
+            if self.pruner.should_prune(step, value):
+                raise ExperimentPruned(step, value, 
+                                       f"{self.pruner.metric_name} worse than previous runs at the same step")
+
+    def _run_experiment_fn(self, code, budget=None):
+        """
+        Call experiment_fn once, passing the progress callback if we're pruning and the
+        budget if we're running under a multi-fidelity schedule
+        """
+        kwargs = {}
+        if self.pruner is not None:
+            kwargs["report"] = self._report_progress
+        if budget is not None:
+            kwargs["budget"] = budget
+        monitor = ResourceMonitor()
+        results = None
+        try:
+            with monitor:
+                results = self.experiment_fn(code, **kwargs)
+            return results
+        finally:
+            # an ExperimentPool measures inside its worker, where the work actually happens
+            resources = results.pop("_resources", None) if isinstance(results, dict) else None
+            self._resources.append(resources or monitor.resources)
+
+    def _run_experiments_and_return_average(self, code, budget=None, replicates=None):
+        """
+        Run the experiment code (possibly several times) and average the results.
+
+        :code: string; the LLM-written function
+        :budget: optional fidelity to pass to experiment_fn (e.g. number of epochs or data fraction)
+        :replicates: int; number of times to run the experiment. Defaults to num_experiment_averages
+        """
+        if replicates is None:
+            replicates = self.num_experiment_averages
+        if self.pruner is not None:
+            self.pruner.start_run()
+        self._resources = []
+        tic = time.perf_counter()
+        try:
+            return self._average_experiments(code, budget, replicates)
+        finally:
+            if self.pruner is not None:
+                self.pruner.finish_run()
+            self._log_resources(time.perf_counter() - tic)
+
+    def _log_resources(self, elapsed:float):
+        """
+        Log what the experiment cost to run: totals over the replicates (peak memory is the max),
+        plus each replicate's numbers as steps of resources.replicate.* metrics
+        """
+        if len(self._resources) == 0:
+            return
+        totals = {"resources.elapsed_time":elapsed}
+        for i, r in enumerate(self._resources):
+            self.tracker.log_metrics({f"resources.replicate.{k}":v for k,v in r.items()}, step=i)
+            for k, v in r.items():
+                if k == "peak_rss_mb":
+                    totals[f"resources.{k}"] = max(v, totals.get(f"resources.{k}", 0))
+                else:
+                    totals[f"resources.{k}"] = v + totals.get(f"resources.{k}", 0)
+        self.tracker.log_metrics(totals)
+
+    def _average_experiments(self, code, budget, replicates):
+        if replicates == 1:
+            return self._run_experiment_fn(code, budget)
         else:
-            single_results = [self.experiment_fn(code) for _ in range(self.num_experiment_averages)]
+            workers = self.experiment_fn.num_workers if isinstance(self.experiment_fn, ExperimentPool) else 1
+            if (workers > 1) and (self.pruner is None):
+                # warm workers to spare; run the replicates side by side
+                with ThreadPoolExecutor(max_workers=min(workers, replicates)) as pool:
+                    single_results = list(pool.map(lambda _: self._run_experiment_fn(code, budget), range(replicates)))
+            else:
+                single_results = [self._run_experiment_fn(code, budget) for _ in range(replicates)]
             results = {}
             # add a variable tracking which results came from which experiment, then concatenate
             # the dataframe results
             if "df" in single_results[0]:
                 df = []
-                for i in range(self.num_experiment_averages):
+                for i in range(replicates):
                     df.append(single_results[i]["df"])
                     df[-1]["experiment_index"] = i
                 results["df"] = pd.concat(df)
@@ -146,11 +297,11 @@ class Laboratory(dspy.Module):
             return results
         
 
-
-    def run_one_experiment(self, **kwargs):
+    def propose_experiment(self, **kwargs) -> dict:
         """
-        Run one full experiment. To customize the lab workflow, subclass Laboratory and overwrite this
-        function and setup().
+        Come up with the next experiment and implement it as code. Returns a dictionary of outputs
+        that includes the key "code". Any of the LLM-generated stages can be skipped by passing
+        their output as a keyword argument ("plan" or "code").
         """
         p = self.prompts
         outdict = {}
@@ -176,7 +327,7 @@ class Laboratory(dspy.Module):
                 print(plan.plan)
         else:
             plan = {"plan":kwargs["plan"]}
-            mlflow.log_param("planner.plan", kwargs["plan"])
+            self.tracker.log_param("planner.plan", kwargs["plan"])
         for k in plan.keys():
             outdict[k] = plan[k]
 
@@ -188,67 +339,225 @@ class Laboratory(dspy.Module):
                                     constraints=p["constraints"]).code
         else:
             code = kwargs["code"]
-            mlflow.log_param("coder.code", kwargs["code"])
+            self.tracker.log_param("coder.code", kwargs["code"])
         outdict["code"] = code
-        # run the experiment
-        #results = self.experiment_fn(code)
-        results = self._run_experiments_and_return_average(code)
+        return outdict
+
+    def run_experiment(self, outdict:dict, budget=None, replicates=None, step=None) -> dict:
+        """
+        Run the code from propose_experiment() and log the metrics to mlflow. Returns the
+        results dictionary from experiment_fn (averaged over replicates).
+
+        :outdict: dictionary from propose_experiment()
+        :budget: optional fidelity to pass to experiment_fn
+        :replicates: int; number of times to run the experiment. Defaults to num_experiment_averages
+        :step: int; mlflow step to log metrics under, for runs that get re-evaluated at
+            increasing budgets
+        """
+        if budget is not None:
+            self.tracker.set_tag("budget", budget)
+        results = self._run_experiments_and_return_average(outdict["code"], budget=budget,
+                                                           replicates=replicates)
         for m in self.metric_names:
-            mlflow.log_metric(m, results[m])
-        # write up an analysis of the results
+            self.tracker.log_metric(m, results[m], step=step)
+        if (self.results_artifact is not None) and ("df" in results):
+            log_dataframe_artifact(results["df"], self.results_artifact, tracker=self.tracker)
+        return results
+
+    def analyze_results(self, results:dict, outdict:dict) -> dict:
+        """
+        Write up an analysis of the experiment results. Returns a dictionary of outputs
+        to add to the ones from propose_experiment().
+        """
+        p = self.prompts
         analysis = self._call_agent("analyst", df=results["df"],
                                         question=p["analysis_question"],
                                         background=p["background"])
-        outdict["analysis"] = analysis.answer
+        return {"analysis":analysis.report}
+
+    def run_one_experiment(self, **kwargs):
+        """
+        Run one full experiment. To customize the lab workflow, subclass Laboratory and overwrite this
+        function and setup()- or, to keep the workflow compatible with successive_halving(), overwrite
+        propose_experiment() and analyze_results() instead.
+        """
+        outdict = self.propose_experiment(**kwargs)
+        # run the experiment
+        results = self.run_experiment(outdict)
+        # write up an analysis of the results
+        outdict.update(self.analyze_results(results, outdict))
         return outdict
 
 
+    def _get_lms(self, name) -> list:
+        """
+        List of LMs to try for an agent, in escalation order
+        """
+        lms = self.agent_lms.get(name, self.lm)
+        if not isinstance(lms, (list, tuple)):
+            lms = [lms]
+        return list(lms)
+
+    @staticmethod
+    def _stalled(outputs) -> bool:
+        """
+        Check whether a ReAct agent ran out of iterations without ever calling finish
+        """
+        trajectory = outputs.get("trajectory", None)
+        if not trajectory:
+            return False
+        return "finish" not in [v for k,v in trajectory.items() if k.startswith("tool_name")]
+
     def _call_agent(self, name, **kwargs):
         """
         Wrapper function for calling an agent; handles some additional logging and stuff
         """
-        # run inputs through the agent
+        lms = self._get_lms(name)
+        for react in _reacts(self.agents[name]):
+            react.last_call = None
+        # run inputs through the agent, escalating to the next model if the agent
+        # fails or stalls
         with track_usage() as usage_tracker:
-            outputs = self.agents[name](**kwargs)
+            for i, lm in enumerate(lms):
+                last = i == len(lms)-1
+                if self.rate_limiter is not None:
+                    lm = self.rate_limiter.wrap_lm(lm, name)
+                if self.recorder is not None:
+                    lm = self.recorder.wrap_lm(lm)
+                try:
+                    with dspy.context(lm=lm):
+                        outputs = self.agents[name](**kwargs)
+                except Exception as e:
+                    if last:
+                        raise
+                    logging.warning(f"{name} failed using {lm.model}; escalating to {lms[i+1].model}: {e}")
+                    continue
+                finally:
+                    self._log_tool_failures(name)
+                if last or not self._stalled(outputs):
+                    break
+                logging.warning(f"{name} stalled using {lm.model}; escalating to {lms[i+1].model}")
         self.usage[name] = usage_tracker.get_total_tokens()
+        self._log_trajectory_tokens(name)
+        self._log_trajectory(name)
+        if self.recorder is not None:
+            self.recorder.agent(name, outputs)
+        if len(lms) > 1:
+            self.log_param(f"{name}.model", lm.model)
         # log every output to MLflow
         for k in outputs.keys():
             if k != "trajectory":
                 self.log_param(f"{name}.{k}", outputs[k])
         return outputs
 
+    def _log_trajectory_tokens(self, name):
+        """
+        For agents using CompactReAct, log how big the trajectory was on each iteration
+        and how much compaction saved
+        """
+        react = getattr(self.agents[name], "react", None)
+        if isinstance(react, CompactReAct) and len(react.trajectory_tokens) > 0:
+            self.tracker.log_dict({"compacted":react.trajectory_tokens, "raw":react.raw_trajectory_tokens},
+                            f"trajectory_tokens/{name}.json")
+            self.tracker.log_metric(f"{name}.trajectory_tokens", sum(react.trajectory_tokens))
+            self.tracker.log_metric(f"{name}.trajectory_tokens_saved",
+                              sum(react.raw_trajectory_tokens)-sum(react.trajectory_tokens))
+
+    def _log_trajectory(self, name):
+        """
+        Log the inputs and trajectory of an agent's last ReAct loop, so compile_agents() can
+        learn from it later
+        """
+        call = _last_call(self.agents[name])
+        if call is not None:
+            self.tracker.log_text(json.dumps(call, default=str), f"trajectories/{name}.json")
+
+    def _log_tool_failures(self, name):
+        """
+        For agents with a circuit breaker on their tool, log how often the tool calls failed
+        """
+        breaker = getattr(self.agents[name], "breaker", None)
+        if breaker is not None:
+            self.tracker.log_metric(f"{name}.tool_calls", breaker.num_calls)
+            self.tracker.log_metric(f"{name}.tool_failures", breaker.num_failures)
+            self.tracker.log_metric(f"{name}.tool_failure_rate", breaker.failure_rate())
+
     def _log_usage(self):
         """
         Log total token usage as mlflow metrics and usage broken out by agent as an artifact.
-        Also make some estimates of what it would cost to run this through several hosted APIs.
+        Also make some estimates of what it would cost to run this through several hosted APIs,
+        and the actual cost for any model we have pricing for.
         """
         completion_tokens = 0
         prompt_tokens = 0
+        by_model = {}
         for agent in self.usage:
             for k in self.usage[agent]:
                 completion_tokens += self.usage[agent][k]['completion_tokens']
                 prompt_tokens += self.usage[agent][k]['prompt_tokens']
+                if k not in by_model:
+                    by_model[k] = [0, 0]
+                by_model[k][0] += self.usage[agent][k]['prompt_tokens']
+                by_model[k][1] += self.usage[agent][k]['completion_tokens']
         
-        mlflow.log_metric("completion_tokens", completion_tokens)
-        mlflow.log_metric("prompt_tokens", prompt_tokens)
-        mlflow.log_dict(self.usage, "ml_usage.yaml")
+        self.tracker.log_metric("completion_tokens", completion_tokens)
+        self.tracker.log_metric("prompt_tokens", prompt_tokens)
+        self.tracker.log_dict(self.usage, "ml_usage.yaml")
         for p in PRICING:
             cost = PRICING[p][0]*prompt_tokens/1e6 + PRICING[p][1]*completion_tokens/1e6
-            mlflow.log_metric(f"cost_estimate_{p}", cost)
+            self.tracker.log_metric(f"cost_estimate_{p}", cost)
+        # per-model usage, for when agents are routed to different models
+        total_cost = None
+        for model in by_model:
+            key = re.sub(r"[^\w\-\. /]", "_", model)
+            self.tracker.log_metric(f"prompt_tokens.{key}", by_model[model][0])
+            self.tracker.log_metric(f"completion_tokens.{key}", by_model[model][1])
+            price = _lookup_price(model)
+            if price is not None:
+                cost = price[0]*by_model[model][0]/1e6 + price[1]*by_model[model][1]/1e6
+                self.tracker.log_metric(f"cost.{key}", cost)
+                total_cost = cost + (total_cost or 0)
+        # a cost of 0 would read as "free"; leave it out if we couldn't price anything
+        if total_cost is not None:
+            self.tracker.log_metric("cost", total_cost)
+        for agent in self.usage:
+            self.tracker.log_metric(f"{agent}.tokens", sum(u.get("prompt_tokens", 0) + u.get("completion_tokens", 0)
+                                                     for u in self.usage[agent].values()))
+        # time spent waiting on the rate limiter
+        if self.rate_limiter is not None:
+            wait = {agent:sum(u.get("rate_limit_wait", 0) for u in self.usage[agent].values()) for agent in self.usage}
+            for agent in wait:
+                self.tracker.log_metric(f"{agent}.rate_limit_wait", wait[agent])
+            self.tracker.log_metric("rate_limit_wait", sum(wait.values()))
+
 
+    def _tag_new_run(self):
+        """
+        Standard tags and params for a freshly-started mlflow run
+        """
+        self.tracker.set_tag("status", "incomplete")
+        self.tracker.set_tag("comment", "none")
+        self.tracker.log_param("model", self.model)
+        self.tracker.log_param("temperature", self.lm.kwargs["temperature"])
+        if len(self.agent_lms) > 0:
+            self.tracker.log_param("agent_models", {a:[lm.model for lm in self._get_lms(a)] for a in self.agent_lms})
+        for a, v in self.compiled_versions.items():
+            self.tracker.log_param(f"compiled.{a}", v)
 
     def forward(self, **kwargs):
-        with mlflow.start_run():
-            mlflow.set_tag("status", "incomplete")
-            mlflow.set_tag("comment", "none")
-            mlflow.log_param("model", self.model)
-            mlflow.log_param("temperature", self.lm.kwargs["temperature"])
+        with self.tracker.start_run(self.experiment_name):
+            self._tag_new_run()
             try:
                 outputs = self.run_one_experiment(**kwargs)
-                mlflow.set_tag("status", "complete")
+                self.tracker.set_tag("status", "complete")
+            except ExperimentPruned as e:
+                # not an error- the experiment just wasn't worth finishing
+                self.tracker.set_tag("status", "pruned")
+                self.tracker.set_tag("comment", str(e))
+                outputs = {"status":"pruned", "pruned_step":e.step}
             except Exception as e:
-                mlflow.set_tag("status", "error")
-                mlflow.log_param("error_msg", e)
+                self.tracker.set_tag("status", "error")
+                self.tracker.log_param("error_msg", e)
                 assert False, e
 
             
@@ -263,7 +572,7 @@ class Laboratory(dspy.Module):
             value = str(value)
         if len(value) > MLFLOW_PARAM_TOKEN_LIMIT:
             logging.warning(f"parameter {key} is above the max token limit for MLFlow. Recording only the first {MLFLOW_PARAM_TOKEN_LIMIT} characters.")
-        mlflow.log_param(key, value[:MLFLOW_PARAM_TOKEN_LIMIT])
+        self.tracker.log_param(key, value[:MLFLOW_PARAM_TOKEN_LIMIT])
 
 
 
@@ -282,3 +591,269 @@ class Laboratory(dspy.Module):
                 print(f"Experiment failed: {e}")
         return results
 
+
+    def successive_halving(self, N:int=9, budgets:list=None, eta:int=3, replicates:list=None,
+                           rank_by:str=None, maximize:bool=True, **kwargs):
+        """
+        Multi-fidelity version of experiment_loop(). Propose and code up N experiments, run all of them
+        at the smallest budget, and only promote the best 1/eta to the next budget. Each experiment keeps
+        a single mlflow run; metrics from each budget are logged as successive steps.
+
+        experiment_fn is called as experiment_fn(code, budget=budget), so it needs to accept a budget
+        keyword argument (e.g. number of epochs or a fraction of the training data).
+
+        Experiments that don't get promoted are analyzed and tagged status="pruned"; the ones that
+        make it through the last budget are tagged status="complete".
+
+        :N: int; number of experiments to propose
+        :budgets: list; increasing fidelity levels to pass to experiment_fn. Defaults to [1, 3, 9]
+        :eta: int; keep the top 1/eta experiments at each level
+        :replicates: list of ints; number of replicates to average at each budget. Defaults to one
+            replicate for every level except the last, which gets num_experiment_averages.
+        :rank_by: string; metric to rank experiments by. Defaults to the first of metric_names
+        :maximize: bool; whether larger values of rank_by are better
+        :kwargs: passed to propose_experiment() for the first experiment, like experiment_loop()
+        """
+        if budgets is None:
+            budgets = [1, 3, 9]
+        if replicates is None:
+            replicates = [1]*(len(budgets)-1) + [self.num_experiment_averages]
+        assert len(replicates) == len(budgets), "need one replicate count for each budget"
+        if rank_by is None:
+            rank_by = self.metric_names[0]
+        # propose and code every experiment up front
+        candidates = []
+        for n in tqdm(range(N)):
+            self.usage = {}
+            with self.tracker.start_run(self.experiment_name) as run_id:
+                self._tag_new_run()
+                try:
+                    if n == 0:
+                        outdict = self.propose_experiment(**kwargs)
+                    else:
+                        outdict = self.propose_experiment()
+                    candidates.append({"run_id":run_id, "outdict":outdict, "usage":self.usage})
+                except Exception as e:
+                    self.tracker.set_tag("status", "error")
+                    self.tracker.log_param("error_msg", e)
+                    self._log_usage()
+                    print(f"Experiment failed: {e}")
+
+        finished = []
+        for rung, (budget, reps) in enumerate(zip(budgets, replicates)):
+            last_rung = rung == len(budgets)-1
+            scored = []
+            for c in candidates:
+                self.usage = c["usage"]
+                with self.tracker.start_run(self.experiment_name, run_id=c["run_id"]):
+                    try:
+                        results = self.run_experiment(c["outdict"], budget=budget, replicates=reps, step=rung)
+                        scored.append((c, results))
+                    except ExperimentPruned as e:
+                        self.tracker.set_tag("status", "pruned")
+                        self.tracker.set_tag("comment", str(e))
+                        self._log_usage()
+                    except Exception as e:
+                        self.tracker.set_tag("status", "error")
+                        self.tracker.log_param("error_msg", e)
+                        self._log_usage()
+                        print(f"Experiment failed: {e}")
+            scored = sorted(scored, key=lambda x: x[1][rank_by], reverse=maximize)
+            num_promoted = 0 if last_rung else max(1, len(scored)//eta)
+            candidates = [c for c,_ in scored[:num_promoted]]
+            # everything that isn't moving on gets analyzed and closed out
+            for c, results in scored[num_promoted:]:
+                self.usage = c["usage"]
+                with self.tracker.start_run(self.experiment_name, run_id=c["run_id"]):
+                    try:
+                        c["outdict"].update(self.analyze_results(results, c["outdict"]))
+                        if last_rung:
+                            self.tracker.set_tag("status", "complete")
+                        else:
+                            self.tracker.set_tag("status", "pruned")
+                            self.tracker.set_tag("comment", f"not promoted past budget {budget} by successive halving")
+                        finished.append(dspy.Prediction(**c["outdict"]))
+                    except Exception as e:
+                        self.tracker.set_tag("status", "error")
+                        self.tracker.log_param("error_msg", e)
+                        print(f"Experiment failed: {e}")
+                    self._log_usage()
+        return finished
+
+
+    def _check_mlflow(self, method:str):
+        # these read runs and artifacts straight from mlflow
+        assert isinstance(self.tracker, MLflowTracker), \
+            f"{method}() reads from mlflow; call tracker.export_to_mlflow() and use a lab with the default tracker"
+
+    def analyze_history(self, question:str=None, max_runs:int=None, status:str="complete", **kwargs):
+        """
+        Cross-run meta-analysis: point an Analyst at the results dataframes from all the previous runs
+        in this experiment (needs results_artifact to have been set while they ran), stacked into
+        one dataset keyed by run ID with each run's metrics alongside. Data is only loaded as queries
+        need it. Runs in its own mlflow run, tagged status="meta_analysis".
+
+        :question: string; what to look for. Defaults to the analysis_question prompt, asked across runs
+        :max_runs: int; only use the most recent max_runs runs
+        :status: string; only use runs with this status. None for all of them
+        :kwargs: passed to RunDataset()
+        """
+        assert self.results_artifact is not None, "set results_artifact to log results for cross-run analysis"
+        self._check_mlflow("analyze_history")
+        p = self.prompts
+        if question is None:
+            question = f"Across all of these experiments: {p['analysis_question']}"
+        if "meta_analyst" not in self.agents:
+            self.agents["meta_analyst"] = Analyst(verbose=self.verbose)
+            self.agents["meta_analyst"].recorder = self.recorder
+        # metrics and experiment titles/hypotheses; earlier analyses are too long to repeat on every row
+        mapping = {k:v for k,v in self.mlflow_column_mapping.items()
+                   if k.startswith("metrics.") or (k.startswith("params.") and not k.startswith("params.analyst"))}
+        dataset = RunDataset.from_experiment(self.experiment_name, mapping=mapping, status=status,
+                                             max_runs=max_runs, artifact_path=self.results_artifact, **kwargs)
+        self.usage = {}
+        with self.tracker.start_run(self.experiment_name):
+            self._tag_new_run()
+            self.tracker.set_tag("status", "meta_analysis")
+            self.tracker.log_param("meta_analyst.num_runs", len(dataset.run_ids))
+            try:
+                analysis = self._call_agent("meta_analyst", dataset=dataset, question=question,
+                                            background=p["background"])
+            finally:
+                self._log_usage()
+        return analysis
+
+    def compile_agents(self, agents:list=None, max_runs:int=None, max_demos:int=3, optimizer=None) -> dict:
+        """
+        Compile the lab's ReAct agents with few-shot demos harvested from successful trajectories in
+        previous runs of this experiment, so they waste fewer iterations on formatting mistakes and
+        rejected commands. Each compiled agent is saved as a new version (see load_compiled_agents())
+        and later runs log which version they used. Returns a dictionary of agent names to versions.
+
+        :agents: list of agent names. Defaults to every agent with a ReAct loop
+        :max_runs: int; only harvest from the most recent max_runs runs
+        :max_demos: int; number of demos per agent
+        :optimizer: optional dspy teleprompter to use instead of dspy.LabeledFewShot
+        """
+        self._check_mlflow("compile_agents")
+        if agents is None:
+            agents = [a for a in self.agents if len(_reacts(self.agents[a])) > 0]
+        versions = {}
+        for a in agents:
+            calls = harvest_trajectories(self.experiment_name, a, max_runs=max_runs)
+            num_demos = compile_agent(self.agents[a], calls, max_demos=max_demos, optimizer=optimizer)
+            if num_demos == 0:
+                logging.warning(f"no successful trajectories logged for {a}; leaving it uncompiled")
+                continue
+            versions[a] = save_compiled_agent(self.agents[a], a, self.experiment_name,
+                                              {"trajectories":len(calls), "demos":num_demos})
+        self.compiled_versions.update(versions)
+        return versions
+
+    def load_compiled_agents(self, versions:dict=None) -> dict:
+        """
+        Load agents compiled by compile_agents(). Returns a dictionary of agent names to the versions loaded.
+
+        :versions: dictionary mapping agent names to version numbers. Defaults to the latest version of
+            every agent that has one
+        """
+        if versions is None:
+            versions = {a:None for a in self.agents if len(_reacts(self.agents[a])) > 0}
+        loaded = {}
+        for a, v in versions.items():
+            version = load_compiled_agent(self.agents[a], a, self.experiment_name, version=v)
+            if version is not None:
+                loaded[a] = version
+        self.compiled_versions.update(loaded)
+        return loaded
+
+    def enqueue_experiments(self, queue, N:int=10, **kwargs) -> list:
+        """
+        Coordinator half of a distributed lab: propose and code up N experiments and push them
+        onto a JobQueue for run_worker() processes to run and analyze. Each experiment gets its
+        own mlflow run (tagged status="queued" until a worker picks it up). Returns the list of
+        run IDs that were queued.
+
+        :queue: JobQueue object
+        :N: int; number of experiments to propose
+        :kwargs: passed to propose_experiment() for the first experiment, like experiment_loop()
+        """
+        run_ids = []
+        for n in tqdm(range(N)):
+            self.usage = {}
+            with self.tracker.start_run(self.experiment_name) as run_id:
+                self._tag_new_run()
+                try:
+                    if n == 0:
+                        outdict = self.propose_experiment(**kwargs)
+                    else:
+                        outdict = self.propose_experiment()
+                    self.tracker.set_tag("status", "queued")
+                    # the worker picks up the token count where we left off
+                    queue.put(self.experiment_name, run_id, {"outdict":outdict, "usage":self.usage})
+                    run_ids.append(run_id)
+                except Exception as e:
+                    self.tracker.set_tag("status", "error")
+                    self.tracker.log_param("error_msg", e)
+                    print(f"Experiment failed: {e}")
+                self._log_usage()
+        return run_ids
+
+    def run_worker(self, queue, max_jobs:int=None, poll_interval:float=5., idle_timeout:float=None,
+                   worker:str=None) -> int:
+        """
+        Worker half of a distributed lab: pull coded experiments for this lab's experiment off a
+        JobQueue, run them, analyze the results and log everything to the original mlflow run.
+        Start any number of these (on any node that can reach the queue and the mlflow tracking
+        server), each with a Laboratory configured like the coordinator's. Returns the number of
+        jobs processed.
+
+        :queue: JobQueue object
+        :max_jobs: int; stop after this many jobs. None to keep going
+        :poll_interval: float; seconds to wait between checks of an empty queue
+        :idle_timeout: float; stop once the queue has been empty for this many seconds. None to
+            wait forever
+        :worker: string; name to record for this worker. Defaults to hostname:pid
+        """
+        worker = worker if worker is not None else default_worker_name()
+        num_jobs = 0
+        idle_since = time.time()
+        while (max_jobs is None) or (num_jobs < max_jobs):
+            job = queue.claim(self.experiment_name, worker=worker)
+            if job is None:
+                if (idle_timeout is not None) and (time.time() - idle_since > idle_timeout):
+                    break
+                time.sleep(poll_interval)
+                continue
+            outdict = job["payload"]["outdict"]
+            self.usage = job["payload"]["usage"]
+            with self.tracker.start_run(self.experiment_name, run_id=job["run_id"]):
+                self.tracker.set_tag("status", "running")
+                self.tracker.set_tag("worker", worker)
+                error = None
+                with queue.keep_alive(job):
+                    try:
+                        results = self.run_experiment(outdict)
+                        outdict.update(self.analyze_results(results, outdict))
+                    except Exception as e:
+                        error = e
+                # only record an outcome if the job is still ours
+                if (error is None) or isinstance(error, ExperimentPruned):
+                    owned = queue.complete(job["id"], attempt=job["attempts"])
+                else:
+                    owned = queue.fail(job["id"], error, attempt=job["attempts"])
+                if not owned:
+                    logging.warning(f"job {job['id']} was handed to another worker; not recording this attempt")
+                elif error is None:
+                    self.tracker.set_tag("status", "complete")
+                elif isinstance(error, ExperimentPruned):
+                    self.tracker.set_tag("status", "pruned")
+                    self.tracker.set_tag("comment", str(error))
+                else:
+                    self.tracker.set_tag("status", "error")
+                    self.tracker.log_param("error_msg", error)
+                    print(f"Experiment failed: {error}")
+                self._log_usage()
+            num_jobs += 1
+            idle_since = time.time()
+        return num_jobs
@@ -1,9 +1,15 @@
-import numpy as np
-import pandas as pd
-import mlflow
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+from ._telemetry import RESOURCE_COLUMNS
+from ._tracking import MLflowTracker
 
-def get_runs_as_json(experiment, mapping, round_to=None, max_runs=25, **kwargs):
+
+def get_runs_as_json(experiment, mapping, round_to=None, max_runs=25, resources=False, tracker=None, **kwargs):
     """
     Query all the runs from an MLFlow experiment and return them as
     a JSON for in-context learning.
@@ -12,16 +18,32 @@ def get_runs_as_json(experiment, mapping, round_to=None, max_runs=25, **kwargs):
     :mapping: dict where keys and values are strings; which columns to use from the MLFlow results
         and what to rename them
     :round_to: int or None; round numerical metrics to this many decimal places
-    :max_runs: int; if more runs than this are returned, take a random sample of this size
-    :kwargs: use to filter results
+    :max_runs: int; if more runs than this match, take a random sample of this size
+    :resources: bool; if True, also include how long each experiment took to run and how much
+        memory it needed (see RESOURCE_COLUMNS)
+    :tracker: optional Tracker to read the runs from. Defaults to mlflow
+    :kwargs: use to filter results, by the names in mapping. Filters on tags and params are run by the tracker
 
     """
+    # deferred, so that importing this module stays cheap for short-lived tools
+    import numpy as np
+
+    if tracker is None:
+        tracker = MLflowTracker()
+    if resources:
+        mapping = {**mapping, **RESOURCE_COLUMNS}
+
     def _round(x):
         if round_to is not None:
             if isinstance(x, float):
                 return round(x, round_to)
         return x
-    df = mlflow.search_runs(experiment_names=[experiment])
+    # let the tracker do the filtering and sampling where it can, instead of loading every run
+    columns = {v:k for k,v in mapping.items()}
+    filters = {columns[k]:v for k,v in kwargs.items() if columns.get(k, "").startswith(("tags.", "params."))}
+    kwargs = {k:v for k,v in kwargs.items() if columns.get(k) not in filters}
+    df = tracker.search_runs(experiment, columns=list(mapping) + ["tags.mlflow.parentRunId"], filters=filters,
+                             max_results=max_runs if len(kwargs) == 0 else None, sample=len(kwargs) == 0)
     output = []
     for e,r in df.iterrows():
         if r.get('tags.mlflow.parentRunId', None) is None:
@@ -35,12 +57,155 @@ def get_runs_as_json(experiment, mapping, round_to=None, max_runs=25, **kwargs):
         output = np.random.choice(output, size=max_runs, replace=False).tolist()
     return output
 
-def get_dataframe_from_mlflow_artifact(run_id=None, artifact_path=None):
+
+def _cache_dir(cache_dir:str=None) -> str:
+    if cache_dir is None:
+        cache_dir = os.environ.get("BISHOP_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "bishop"))
+    return os.path.join(cache_dir, "artifacts")
+
+
+def _file_sha(path:str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1<<20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _format(artifact_path:str) -> str:
+    ext = os.path.splitext(artifact_path)[1].lower()
+    if ext in [".parquet", ".pq"]:
+        return "parquet"
+    if ext in [".feather", ".arrow"]:
+        return "feather"
+    if ext == ".csv":
+        return "csv"
+    raise Exception(f"don't know how to read {artifact_path}; use .csv, .parquet or .feather")
+
+
+def _read(path:str, fmt:str, columns:list=None):
+    import pandas as pd
+
+    if fmt == "parquet":
+        return pd.read_parquet(path, columns=columns)
+    if fmt == "feather":
+        return pd.read_feather(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def _fetch_artifact(run_id:str, artifact_path:str, cache_dir:str) -> tuple:
+    """
+    Return the local path and format of an artifact, downloading it into the cache the
+    first time. Files are stored by content hash, so identical artifacts from different
+    runs are only stored once; CSVs also get a parquet copy so later reads are fast and can
+    skip columns.
     """
-    Download a CSV file from an MLFlow artifact and return as a pandas DataFrame
+    import mlflow
+
+    root = _cache_dir(cache_dir)
+    uri = mlflow.get_tracking_uri()
+    key = hashlib.sha256(f"{uri}|{run_id}|{artifact_path}".encode("utf-8")).hexdigest()
+    index = os.path.join(root, "index", key)
+    if os.path.exists(index):
+        with open(index) as f:
+            entry = f.read().split()
+        path = os.path.join(root, "objects", entry[0])
+        if os.path.exists(path):
+            return path, entry[1]
+
+    fmt = _format(artifact_path)
+    os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+    os.makedirs(os.path.join(root, "index"), exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=root) as tmp:
+        downloaded = mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path=artifact_path, dst_path=tmp)
+        sha = _file_sha(downloaded)
+        if fmt == "csv":
+            try:
+                _read(downloaded, "csv").to_parquet(os.path.join(tmp, "converted"))
+                downloaded, sha, fmt = os.path.join(tmp, "converted"), f"{sha}.parquet", "parquet"
+            except Exception:
+                # no pyarrow, or columns arrow can't type; keep the CSV
+                pass
+        path = os.path.join(root, "objects", sha)
+        if not os.path.exists(path):
+            # atomic, so concurrent downloads of the same content don't step on each other
+            os.replace(downloaded, path)
+    tmp_index = f"{index}.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_index, "w") as f:
+        f.write(f"{sha} {fmt}")
+    os.replace(tmp_index, index)
+    return path, fmt
+
+
+def get_dataframe_from_mlflow_artifact(run_id=None, artifact_path="eval_results.csv", columns=None,
+                                       cache_dir=None):
+    """
+    Download a table (CSV, Parquet or Feather, by file extension) from an MLFlow artifact and
+    return it as a pandas DataFrame. Downloads go through a local content-addressed cache, so
+    each artifact is only fetched once.
 
     :run_id: string; ID of the run to pull from
-    :
+    :artifact_path: string; path of the artifact within the run
+    :columns: list of strings; only load these columns
+    :cache_dir: string; where to cache downloads. Defaults to $BISHOP_CACHE_DIR or ~/.cache/bishop
+    """
+    path, fmt = _fetch_artifact(run_id, artifact_path, cache_dir)
+    return _read(path, fmt, columns)
+
+
+def get_dataframes_from_mlflow_artifacts(run_ids, artifact_path="eval_results.csv", columns=None,
+                                         cache_dir=None, max_workers=8, concat=True):
+    """
+    Bulk version of get_dataframe_from_mlflow_artifact() for cross-run analysis: download the
+    same artifact from many runs in parallel. Runs that are missing the artifact are skipped
+    with a warning.
+
+    :run_ids: list of strings; IDs of the runs to pull from
+    :artifact_path: string; path of the artifact within each run
+    :columns: list of strings; only load these columns
+    :cache_dir: string; where to cache downloads
+    :max_workers: int; number of simultaneous downloads
+    :concat: bool; if True, return one DataFrame with a "run_id" column. Otherwise return a
+        dictionary mapping run IDs to DataFrames
+    """
+    import pandas as pd
+
+    def _load(run_id):
+        try:
+            return run_id, get_dataframe_from_mlflow_artifact(run_id, artifact_path, columns, cache_dir)
+        except Exception as e:
+            logging.warning(f"couldn't load {artifact_path} from run {run_id}: {e}")
+            return run_id, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        frames = {r:df for r,df in pool.map(_load, run_ids) if df is not None}
+    if not concat:
+        return frames
+    if len(frames) == 0:
+        return pd.DataFrame()
+    return pd.concat([df.assign(run_id=r) for r,df in frames.items()], ignore_index=True)
+
+
+def log_dataframe_artifact(df, artifact_path="eval_results.parquet", tracker=None):
+    """
+    Log a DataFrame to the active MLFlow run, in the format given by the file extension.
+    Parquet (the default) is much faster to load than CSV and supports reading a subset of
+    the columns.
+
+    :df: pandas DataFrame
+    :artifact_path: string; file name for the artifact, optionally inside a directory
+    :tracker: optional Tracker with the active run. Defaults to mlflow
     """
-    path = mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path="eval_results.csv")
-    eval_results = pd.read_csv(path)
\ No newline at end of file
+    if tracker is None:
+        tracker = MLflowTracker()
+    fmt = _format(artifact_path)
+    directory, filename = os.path.split(artifact_path)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, filename)
+        if fmt == "parquet":
+            df.to_parquet(path)
+        elif fmt == "feather":
+            df.reset_index(drop=True).to_feather(path)
+        else:
+            df.to_csv(path, index=False)
+        tracker.log_artifact(path, artifact_path=directory if len(directory) > 0 else None)
@@ -1,5 +1,4 @@
 import dspy
-import mlflow
 import json
 
 from ._main import Laboratory
@@ -17,10 +16,11 @@ class LaboratoryWithNoAnalyst(Laboratory):
     the workflow that the laboratory follows, subclass Laboratory and overwrite two functions:
 
     * setup() initializes all the agents and any other data structures you need
-    * run_one_experiment() runs a single end-to-end experiment.
+    * run_one_experiment() runs a single end-to-end experiment. By default this calls propose_experiment(),
+      run_experiment() and analyze_results(), so you can also just overwrite those.
 
-    For now assume we're using the same LLM for everything. Could potentially make that configurable in the
-    future, but would require changing a few things.
+    By default every agent uses the same LLM. Use agent_lms to route individual agents to different models,
+    or to give an agent a list of models to escalate through (cheapest first) when it fails or stalls.
 
     Before creating the Laboratory object:
     * initialize a dspy.LM object for the LLM you're using
@@ -41,7 +41,8 @@ class LaboratoryWithNoAnalyst(Laboratory):
         # create each agent we'll need
         self.agents["ideator"] = dspy.Predict(AIScientistIdeatorSig)
         #self.agents["planner"] = dspy.ChainOfThought(PlannerSig)
-        self.agents["coder"] = Coder(human_in_loop=self.human_in_loop, verbose=self.verbose)
+        self.agents["coder"] = Coder(human_in_loop=self.human_in_loop, verbose=self.verbose,
+                                     num_candidates=self.coder_candidates, smoke_test=self.smoke_test)
         # identify the columns we'll need from mlflow to report on the history of the experiments
         self.mlflow_column_mapping = {
             "params.ideator.experiment":"experiment",
@@ -62,15 +63,14 @@ class LaboratoryWithNoAnalyst(Laboratory):
         # Implementation Constraints
         {self.prompts["constraints"]}
         """
-        mlflow.set_experiment_tag("mlflow.note.content", description)
+        self.tracker.set_experiment_tag(self.experiment_name, "mlflow.note.content", description)
 
 
-    def run_one_experiment(self, **kwargs):
+    def propose_experiment(self, **kwargs):
         """
-        Run one full experiment. To customize the lab workflow, subclass Laboratory and overwrite this
-        function and setup().
+        Generate an idea with the AI Scientist ideator, then implement it as code.
 
-        :idea: should be a dictionary with keys "title" and "summary"
+        :idea: should be a dictionary with keys "title", "name", and "experiment"
         """
         p = self.prompts
         outdict = {}
@@ -91,7 +91,8 @@ class LaboratoryWithNoAnalyst(Laboratory):
                 if k not in kwargs["idea"]:
                     assert False, f"missing key {k} from idea dictionary"
             #idea = {"idea":kwargs["idea"]}
-            mlflow.log_params({"ideator."+k:kwargs["idea"][k] for k in kwargs["idea"]})
+            self.tracker.log_params({"ideator."+k:kwargs["idea"][k] for k in kwargs["idea"]})
+            idea = kwargs["idea"]
         # implement plan as python code
         if "code" not in kwargs:
             code = self._call_agent("coder", background=p["background"],
@@ -100,10 +101,12 @@ class LaboratoryWithNoAnalyst(Laboratory):
                                     constraints=p["constraints"]).code
         else:
             code = kwargs["code"]
-            mlflow.log_param("coder.code", kwargs["code"])
+            self.tracker.log_param("coder.code", kwargs["code"])
         outdict["code"] = code
-        # run the experiment
-        results = self.experiment_fn(code)
-        for m in self.metric_names:
-            mlflow.log_metric(m, results[m])
-        return outdict
\ No newline at end of file
+        return outdict
+
+    def analyze_results(self, results, outdict):
+        """
+        No analyst in this version
+        """
+        return {}
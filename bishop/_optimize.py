@@ -0,0 +1,238 @@
+import os
+import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import dspy
+
+from ._react import CompactReAct
+from ._digest import _truncate
+
+
+_FAILURES = ("fail", "command failed", "code failed", "execution error")
+
+
+def _reacts(agent) -> list:
+    """
+    Every CompactReAct loop inside an agent (the agent itself counts), main loop first
+    """
+    if isinstance(agent, CompactReAct):
+        return [agent]
+    return [m for _, m in agent.named_sub_modules() if isinstance(m, CompactReAct)]
+
+
+def _last_call(agent):
+    """
+    The agent's most recent ReAct call: its own last_call if it picks one (e.g. the Coder's winning
+    candidate), otherwise its main loop's
+    """
+    if hasattr(agent, "last_call"):
+        return agent.last_call
+    reacts = _reacts(agent)
+    return reacts[0].last_call if len(reacts) > 0 else None
+
+
+def _failed(observation) -> bool:
+    lines = str(observation).strip().split("\n")
+    return lines[0].lower().startswith(_FAILURES)
+
+
+def _step(key:str) -> int:
+    return int(key.split("_")[-1])
+
+
+def harvest_trajectories(experiment_name:str, agent:str, status:str="complete", max_runs:int=None,
+                         max_workers:int=8) -> list:
+    """
+    Load the trajectories an agent logged (as trajectories/<agent>.json) in past runs of
+    an experiment, most recent first.
+
+    :experiment_name: string; name of the mlflow experiment
+    :agent: string; name of the agent, e.g. "analyst"
+    :status: string; only use runs with this status tag. None for all runs
+    :max_runs: int; only look at the most recent max_runs runs
+    :max_workers: int; number of artifacts to download at once
+    """
+    import mlflow
+
+    runs = mlflow.search_runs(experiment_names=[experiment_name], order_by=["attributes.start_time DESC"])
+    if (status is not None) and ("tags.status" in runs.columns):
+        runs = runs[runs["tags.status"] == status]
+    if max_runs is not None:
+        runs = runs.head(max_runs)
+
+    def _one(run_id):
+        try:
+            return mlflow.artifacts.load_dict(f"runs:/{run_id}/trajectories/{agent}.json")
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        calls = list(pool.map(_one, runs["run_id"]))
+    return [c for c in calls if c is not None]
+
+
+def trajectory_demos(react:CompactReAct, calls:list, max_input_tokens:int=300) -> list:
+    """
+    Turn logged trajectories into few-shot demos for a ReAct loop's tool-selection step.
+
+    Each call that finished without a failure contributes one demo: its first tool call that
+    didn't fail, shown with the (short) trajectory leading up to it. That's the part the agents
+    tend to get wrong- output format and which commands are allowed- without paying for long
+    trajectories in every prompt. Long inputs are truncated for the same reason.
+
+    :react: CompactReAct the demos are for
+    :calls: list of dictionaries from harvest_trajectories() (or CompactReAct.last_call)
+    :max_input_tokens: int; approximate length limit for each input field in a demo
+    """
+    demos = []
+    for call in calls:
+        trajectory = call["trajectory"]
+        tools = [v for k,v in trajectory.items() if k.startswith("tool_name")]
+        if (call.get("failure") is not None) or ("finish" not in tools):
+            continue
+        inputs = {k:_truncate(str(v), max_input_tokens) for k,v in call["inputs"].items()}
+        for i in sorted(set(_step(k) for k in trajectory)):
+            name = trajectory[f"tool_name_{i}"]
+            if (name != "finish") and _failed(trajectory.get(f"observation_{i}", "")):
+                continue
+            previous = {k:v for k,v in trajectory.items() if _step(k) < i}
+            formatted = react._format_trajectory(react._compact(previous)) if len(previous) > 0 else ""
+            demo = dspy.Example(**inputs, trajectory=formatted, next_thought=trajectory[f"thought_{i}"],
+                                next_tool_name=name, next_tool_args=trajectory[f"tool_args_{i}"])
+            demos.append(demo.with_inputs(*inputs.keys(), "trajectory"))
+            break
+    return demos
+
+
+def compile_agent(agent, calls:list, max_demos:int=3, optimizer=None, max_input_tokens:int=300) -> int:
+    """
+    Compile an agent's ReAct loop with few-shot demos from successful past trajectories. Returns
+    the number of demos it had to choose from; if that's 0 the agent is left as it was.
+
+    :agent: dspy Module containing a CompactReAct loop (Analyst, Coder, ReActIdeator...)
+    :calls: list of logged trajectories, e.g. from harvest_trajectories()
+    :max_demos: int; number of demos to keep
+    :optimizer: optional dspy teleprompter; compiled against the tool-selection predictor with the
+        demos as its trainset. Defaults to dspy.LabeledFewShot, keeping the most recent max_demos.
+    :max_input_tokens: int; approximate length limit for each input field in a demo
+    """
+    reacts = _reacts(agent)
+    assert len(reacts) > 0, f"{type(agent).__name__} doesn't have a ReAct loop to compile"
+    demos = trajectory_demos(reacts[0], calls, max_input_tokens=max_input_tokens)
+    if len(demos) == 0:
+        # don't wipe out demos loaded from an earlier compiled version
+        return 0
+    if optimizer is None:
+        compiled = dspy.LabeledFewShot(k=max_demos).compile(reacts[0].react, trainset=demos, sample=False)
+    else:
+        compiled = optimizer.compile(reacts[0].react, trainset=demos)
+    # e.g. the Coder's speculative candidates all share the same demos
+    for react in reacts:
+        react.react.demos = list(compiled.demos)
+    return len(demos)
+
+
+def _compiled_experiment(experiment_name:str) -> str:
+    """
+    Get (or create) the mlflow experiment holding compiled agents, kept separate so they
+    don't show up in the experiment history
+    """
+    import mlflow
+
+    name = f"{experiment_name}.compiled"
+    experiment = mlflow.get_experiment_by_name(name)
+    if experiment is None:
+        return mlflow.create_experiment(name)
+    return experiment.experiment_id
+
+
+def save_compiled_agent(agent, agent_name:str, experiment_name:str, metrics:dict=None) -> int:
+    """
+    Save a compiled agent's demos and instructions as a new version, in an mlflow run under
+    the "<experiment_name>.compiled" experiment. Returns the version number.
+
+    :agent: compiled dspy Module
+    :agent_name: string; name of the agent, e.g. "analyst"
+    :experiment_name: string; name of the lab's mlflow experiment
+    :metrics: optional dictionary of metrics to log with it (e.g. number of demos)
+    """
+    from mlflow.tracking import MlflowClient
+
+    client = MlflowClient()
+    experiment_id = _compiled_experiment(experiment_name)
+    previous = client.search_runs([experiment_id], filter_string=f"tags.agent = '{agent_name}'")
+    version = max([int(r.data.tags["version"]) for r in previous], default=0) + 1
+    run = client.create_run(experiment_id, run_name=f"{agent_name}-v{version}",
+                            tags={"agent":agent_name, "version":str(version), "status":"compiled"})
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"{agent_name}.json")
+        with open(path, "w") as f:
+            json.dump(_reacts(agent)[0].react.dump_state(), f)
+        client.log_artifact(run.info.run_id, path)
+    for k, v in (metrics or {}).items():
+        client.log_metric(run.info.run_id, k, v)
+    client.set_terminated(run.info.run_id)
+    return version
+
+
+def load_compiled_agent(agent, agent_name:str, experiment_name:str, version:int=None) -> int:
+    """
+    Load a compiled version of an agent saved with save_compiled_agent(). Returns the version
+    number, or None if nothing has been saved for this agent.
+
+    :agent: dspy Module to load into
+    :agent_name: string; name of the agent, e.g. "analyst"
+    :experiment_name: string; name of the lab's mlflow experiment
+    :version: int; version to load. Defaults to the latest
+    """
+    import mlflow
+    from mlflow.tracking import MlflowClient
+
+    client = MlflowClient()
+    experiment = mlflow.get_experiment_by_name(f"{experiment_name}.compiled")
+    if experiment is None:
+        return None
+    runs = client.search_runs([experiment.experiment_id], filter_string=f"tags.agent = '{agent_name}'")
+    if version is not None:
+        runs = [r for r in runs if int(r.data.tags["version"]) == version]
+    if len(runs) == 0:
+        assert version is None, f"no version {version} of {agent_name} in {experiment_name}.compiled"
+        return None
+    run = max(runs, key=lambda r: int(r.data.tags["version"]))
+    with tempfile.TemporaryDirectory() as directory:
+        path = mlflow.artifacts.download_artifacts(run_id=run.info.run_id, artifact_path=f"{agent_name}.json",
+                                                   dst_path=directory)
+        with open(path) as f:
+            state = json.load(f)
+    for react in _reacts(agent):
+        react.react.load_state(state)
+    return int(run.data.tags["version"])
+
+
+def compare_compiled(experiment_name:str, agent:str, status:str="complete"):
+    """
+    Average tool calls, tool failures and tokens per invocation of an agent, grouped by which
+    compiled version (if any) it was running. Use it on a replayed benchmark to check that
+    compiling actually helped.
+
+    :experiment_name: string; name of the mlflow experiment
+    :agent: string; name of the agent, e.g. "analyst"
+    :status: string; only use runs with this status tag. None for all runs
+    """
+    import mlflow
+    import pandas as pd
+
+    runs = mlflow.search_runs(experiment_names=[experiment_name])
+    if (status is not None) and ("tags.status" in runs.columns):
+        runs = runs[runs["tags.status"] == status]
+    column = f"params.compiled.{agent}"
+    if column in runs.columns:
+        version = runs[column].fillna("uncompiled")
+    else:
+        version = pd.Series("uncompiled", index=runs.index)
+    metrics = [f"metrics.{agent}.{m}" for m in ["tool_calls", "tool_failures", "tokens"]]
+    metrics = [m for m in metrics if m in runs.columns]
+    summary = runs[metrics].groupby(version.rename("version")).mean()
+    summary.columns = [m.split(".")[-1] for m in metrics]
+    return summary
@@ -0,0 +1,51 @@
+import dspy
+from concurrent.futures import ThreadPoolExecutor
+
+from dspy.utils.usage_tracker import UsageTracker
+
+
+def run_in_threads(functions:list, max_workers:int=None, return_exceptions:bool=False) -> list:
+    """
+    Call several no-argument functions (e.g. dspy modules with their inputs bound) concurrently
+    and return their results in order.
+
+    Like dspy's ParallelExecutor, each thread inherits the caller's dspy settings (so
+    dspy.context(lm=...) still applies). Unlike it, LM usage from the threads is rolled back into
+    the caller's usage tracker, so track_usage() still sees every token.
+
+    :functions: list of functions with no arguments
+    :max_workers: int; size of the thread pool. Defaults to one thread per function
+    :return_exceptions: bool; if True, an exception raised by a function is returned in its place
+        instead of being re-raised
+    """
+    if len(functions) == 0:
+        return []
+    # the caller's settings, including any dspy.context() it's inside of
+    parent_settings = dict(dspy.settings.copy())
+    parent_tracker = parent_settings.get("usage_tracker", None)
+
+    def _worker(fn):
+        overrides = dict(parent_settings)
+        tracker = UsageTracker() if parent_tracker is not None else None
+        if tracker is not None:
+            overrides["usage_tracker"] = tracker
+        with dspy.context(**overrides):
+            try:
+                return fn(), None, tracker
+            except Exception as e:
+                return None, e, tracker
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(functions)) as pool:
+        outcomes = list(pool.map(_worker, functions))
+
+    results = []
+    for result, error, tracker in outcomes:
+        if tracker is not None:
+            for lm, entries in tracker.usage_data.items():
+                parent_tracker.usage_data[lm].extend(entries)
+        if error is not None:
+            if not return_exceptions:
+                raise error
+            result = error
+        results.append(result)
+    return results
@@ -0,0 +1,239 @@
+import os
+import time
+import queue
+import logging
+import shutil
+import tempfile
+import traceback
+import multiprocessing
+
+import numpy as np
+
+from ._telemetry import ResourceMonitor
+
+
+def _share_fixtures(fixtures:dict, directory:str):
+    """
+    Write numpy arrays to .npy files that workers can memory-map; everything else gets pickled
+    to each worker once
+    """
+    shared = {}
+    other = {}
+    for k, v in fixtures.items():
+        if isinstance(v, np.ndarray) and (v.dtype != object):
+            path = os.path.join(directory, f"{len(shared)}.npy")
+            np.save(path, v)
+            shared[k] = path
+        else:
+            other[k] = v
+    return shared, other
+
+
+def _worker_main(conn, experiment_fn, shared:dict, other:dict, worker_init):
+    """
+    Long-lived worker process: open the fixtures once, then run experiments as they come in
+    """
+    try:
+        fixtures = {k:np.load(path, mmap_mode="r") for k, path in shared.items()}
+        fixtures.update(other)
+        if worker_init is not None:
+            fixtures.update(worker_init(fixtures) or {})
+        conn.send(("ready", None))
+    except Exception as e:
+        conn.send(("error", (e, traceback.format_exc())))
+        return
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        code, kwargs, reporting = message
+        if reporting:
+            def report(step, metrics):
+                # the pruner lives in the parent; it answers None or an exception to raise here
+                conn.send(("report", (step, metrics)))
+                reply = conn.recv()
+                if reply is not None:
+                    raise reply
+            kwargs["report"] = report
+        try:
+            with ResourceMonitor() as monitor:
+                result = experiment_fn(code, fixtures=fixtures, **kwargs)
+            if isinstance(result, dict):
+                # the Laboratory logs these instead of measuring the parent process
+                result["_resources"] = monitor.resources
+            conn.send(("result", result))
+        except Exception as e:
+            try:
+                conn.send(("error", (e, traceback.format_exc())))
+            except Exception:
+                # e.g. an exception that can't be pickled
+                conn.send(("error", (Exception(f"{type(e).__name__}: {e}"), traceback.format_exc())))
+
+
+class ExperimentPool():
+    """
+    Pool of long-lived worker processes for running experiment_fn, so expensive setup (loading
+    datasets, importing and initializing libraries, loading models) happens once instead of on
+    every replicate of every experiment.
+
+    setup() runs once, in this process, and returns a dictionary of fixtures. Numpy arrays are
+    saved to disk and memory-mapped read-only by every worker, so they're shared through the
+    page cache instead of being copied into each process; anything else is pickled to each worker
+    once. worker_init(fixtures), if given, runs once in each worker for state that can't be
+    shared (e.g. a model on a GPU) and can return more fixtures.
+
+    The pool is called just like experiment_fn- so pass it to Laboratory in its place- and calls
+    experiment_fn(code, fixtures=fixtures, **kwargs) in a worker. Progress reports for a pruner
+    are relayed back to this process. With num_workers > 1, the Laboratory runs replicates in
+    parallel (unless it's pruning). A worker that crashes or runs past the timeout is replaced.
+
+    Workers are started with multiprocessing's "spawn" method by default, so experiment_fn, setup
+    and worker_init need to be importable (defined at module level, not in a notebook cell or a
+    lambda), and scripts need an `if __name__ == "__main__":` guard. Call close() when finished.
+
+    If a replacement worker fails to start, the pool carries on with the workers it has left; once
+    none are left, every call raises.
+    """
+    def __init__(self, experiment_fn, setup=None, worker_init=None, num_workers:int=1, timeout:float=None,
+                 start_method:str="spawn"):
+        """
+        :experiment_fn: function with the same signature Laboratory expects, plus a "fixtures" keyword
+            argument: a dictionary of read-only arrays (and anything else setup() returns)
+        :setup: optional function with no arguments that returns a dictionary of fixtures
+        :worker_init: optional function run once in each worker; inputs the fixtures dictionary and
+            can return a dictionary of additional fixtures
+        :num_workers: int; number of worker processes
+        :timeout: float; seconds before a running experiment is killed (and its worker replaced).
+            None for no limit
+        :start_method: string; multiprocessing start method
+        """
+        self.experiment_fn = experiment_fn
+        self.worker_init = worker_init
+        self.num_workers = num_workers
+        self.timeout = timeout
+        self._context = multiprocessing.get_context(start_method)
+        self._directory = tempfile.mkdtemp(prefix="bishop_fixtures_")
+        self._shared, self._other = _share_fixtures(setup() if setup is not None else {}, self._directory)
+        self._idle = queue.Queue()
+        self._workers = []
+        self._broken = None
+        try:
+            for _ in range(num_workers):
+                self._idle.put(self._start_worker())
+        except Exception:
+            self.close()
+            raise
+
+    def _start_worker(self):
+        conn, child = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, daemon=True,
+                                        args=(child, self.experiment_fn, self._shared, self._other,
+                                              self.worker_init))
+        process.start()
+        child.close()
+        worker = (process, conn)
+        self._workers.append(worker)
+        try:
+            status, payload = conn.recv()
+        except EOFError:
+            status, payload = "error", (Exception("experiment worker died during setup"), "")
+        if status == "error":
+            self._stop_worker(worker)
+            error, tb = payload
+            raise Exception(f"experiment worker setup failed: {error}\n{tb}")
+        return worker
+
+    def _stop_worker(self, worker):
+        process, conn = worker
+        if process.is_alive():
+            process.kill()
+        process.join()
+        conn.close()
+        self._workers.remove(worker)
+
+    def _replace_worker(self, error:BaseException=None):
+        """
+        Start a worker to replace one that was stopped. If that fails, note it on the error that
+        killed the old worker and carry on with one worker fewer.
+        """
+        try:
+            self._idle.put(self._start_worker())
+        except Exception as e:
+            logging.warning(f"couldn't replace an experiment worker: {e}")
+            if error is not None:
+                error.add_note(f"and its replacement failed to start: {e}")
+            if len(self._workers) == 0:
+                self._broken = e
+                # wake up every call waiting for a worker
+                self._idle.put(None)
+
+    def __call__(self, code:str, report=None, **kwargs) -> dict:
+        """
+        Run experiment_fn(code, fixtures=..., **kwargs) in the next free worker and return its results
+        """
+        worker = self._idle.get()
+        if worker is None:
+            self._idle.put(None)
+            raise Exception("experiment pool has no workers left") from self._broken
+        process, conn = worker
+        healthy = False
+        error = None
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        try:
+            conn.send((code, kwargs, report is not None))
+            while True:
+                remaining = None if deadline is None else max(0, deadline - time.monotonic())
+                if not conn.poll(remaining):
+                    raise TimeoutError(f"experiment ran longer than {self.timeout} seconds")
+                status, payload = conn.recv()
+                if status == "report":
+                    try:
+                        report(*payload)
+                        conn.send(None)
+                    except Exception as e:
+                        # e.g. ExperimentPruned; raise it inside the experiment so it stops
+                        conn.send(e)
+                elif status == "result":
+                    healthy = True
+                    return payload
+                else:
+                    healthy = True
+                    error, tb = payload
+                    error.add_note(f"in experiment worker:\n{tb}")
+                    raise error
+        except (EOFError, OSError) as e:
+            error = Exception(f"experiment worker died (exit code {process.exitcode})")
+            raise error from e
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if healthy:
+                self._idle.put(worker)
+            else:
+                self._stop_worker(worker)
+                self._replace_worker(error)
+
+    def close(self):
+        """
+        Stop the workers and delete the shared fixture files
+        """
+        for process, conn in list(self._workers):
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for worker in list(self._workers):
+            worker[0].join(timeout=5)
+            self._stop_worker(worker)
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,169 @@
+import numpy as np
+
+
+class ExperimentPruned(Exception):
+    """
+    Raised from the progress callback handed to experiment_fn when the pruner decides
+    a run is hopeless. The Laboratory catches it and marks the run with status="pruned".
+    """
+    def __init__(self, step, value, reason=""):
+        self.step = step
+        self.value = value
+        self.reason = reason
+        super().__init__(f"pruned at step {step} ({value}): {reason}")
+
+    def __reduce__(self):
+        # so it survives the trip to and from an ExperimentPool worker
+        return (ExperimentPruned, (self.step, self.value, self.reason))
+
+
+class Pruner():
+    """
+    Base class for early-stopping policies. A pruner watches one metric, keeps the
+    intermediate values reported by every run it has seen, and decides whether the
+    current run is worth finishing.
+
+    Subclasses only need to implement should_prune().
+    """
+    def __init__(self, metric_name:str, maximize:bool=True, min_runs:int=3):
+        """
+        :metric_name: string; which of the reported metrics to make decisions on
+        :maximize: bool; whether larger values of the metric are better
+        :min_runs: int; don't prune anything until at least this many previous runs have
+            reported a value at the same step
+        """
+        self.metric_name = metric_name
+        self.maximize = maximize
+        self.min_runs = min_runs
+        # one dictionary of {step:value} for each finished (or pruned) run
+        self.curves = []
+        self.current = {}
+
+    def start_run(self):
+        """
+        Reset the curve for the current run
+        """
+        self.current = {}
+
+    def report(self, step:int, value:float) -> float:
+        """
+        Record an intermediate value for the current run. If several replicates report the
+        same step (num_experiment_averages > 1) the values are averaged. Returns the
+        value the pruner will use for this step.
+        """
+        self.current.setdefault(step, []).append(value)
+        return float(np.mean(self.current[step]))
+
+    def finish_run(self):
+        """
+        Store the curve for the current run so later runs can be compared against it.
+        """
+        if len(self.current) > 0:
+            self.curves.append({s:float(np.mean(v)) for s,v in self.current.items()})
+        self.current = {}
+
+    def _values_at_step(self, step:int) -> np.ndarray:
+        """
+        Values previous runs reported at exactly this step. Runs that stopped (or were pruned)
+        before reaching it don't count, so their early values can't drag the comparison down.
+        """
+        return np.array([c[step] for c in self.curves if step in c], dtype=float)
+
+    def should_prune(self, step:int, value:float) -> bool:
+        raise NotImplementedError
+
+    def load_history(self, experiment_name:str, key:str=None, max_runs:int=100, tracker=None):
+        """
+        Seed the pruner with intermediate values logged by previous runs of an MLFlow experiment.
+
+        :experiment_name: string; name of the mlflow experiment
+        :key: string; name of the mlflow metric holding the intermediate values. Defaults to
+            the name the Laboratory logs them under.
+        :max_runs: int; only look at the most recent runs
+        :tracker: optional Tracker to read the runs from (e.g. the lab's SqliteTracker). Defaults to mlflow
+        """
+        from ._tracking import MLflowTracker
+        if key is None:
+            key = f"intermediate.{self.metric_name}"
+        if tracker is None:
+            tracker = MLflowTracker()
+        runs = tracker.search_runs(experiment_name, columns=[], max_results=max_runs)
+        for run_id in runs.get("run_id", []):
+            history = tracker.get_metric_history(run_id, key)
+            if len(history) > 0:
+                self.curves.append(history)
+        return self
+
+
+class MedianStoppingPruner(Pruner):
+    """
+    Median stopping rule: stop a run if its intermediate value is worse than the median
+    (or some other percentile) of what previous runs had reported by the same step.
+    """
+    def __init__(self, metric_name:str, maximize:bool=True, min_runs:int=3,
+                 percentile:float=50., warmup_steps:int=0):
+        """
+        :metric_name: string; which of the reported metrics to make decisions on
+        :maximize: bool; whether larger values of the metric are better
+        :min_runs: int; don't prune anything until at least this many previous runs have
+            reported a value at the same step
+        :percentile: float; prune runs that are worse than this percentile of previous runs.
+            50 is the classic median rule; lower values prune more conservatively.
+        :warmup_steps: int; never prune before this step
+        """
+        super().__init__(metric_name, maximize=maximize, min_runs=min_runs)
+        self.percentile = percentile
+        self.warmup_steps = warmup_steps
+
+    def should_prune(self, step:int, value:float) -> bool:
+        if step < self.warmup_steps:
+            return False
+        values = self._values_at_step(step)
+        if len(values) < self.min_runs:
+            return False
+        if self.maximize:
+            return value < np.percentile(values, self.percentile)
+        else:
+            return value > np.percentile(values, 100-self.percentile)
+
+
+class SuccessiveHalvingPruner(Pruner):
+    """
+    Asynchronous successive halving: runs are only checked at "rungs" (steps min_resource,
+    min_resource*eta, min_resource*eta**2, ...) and survive a rung only if they're in the
+    top 1/eta of everything previously reported at that rung.
+    """
+    def __init__(self, metric_name:str, maximize:bool=True, min_runs:int=3,
+                 min_resource:int=1, reduction_factor:int=3):
+        """
+        :metric_name: string; which of the reported metrics to make decisions on
+        :maximize: bool; whether larger values of the metric are better
+        :min_runs: int; don't prune anything until at least this many previous runs have
+            reported a value at the same rung
+        :min_resource: int; step of the first rung
+        :reduction_factor: int; only the top 1/reduction_factor of runs survive each rung
+        """
+        assert min_resource >= 1, "min_resource must be at least 1"
+        assert reduction_factor >= 2, "reduction_factor must be at least 2"
+        super().__init__(metric_name, maximize=maximize, min_runs=min_runs)
+        self.min_resource = min_resource
+        self.reduction_factor = reduction_factor
+
+    def _is_rung(self, step:int) -> bool:
+        rung = self.min_resource
+        while rung < step:
+            rung *= self.reduction_factor
+        return rung == step
+
+    def should_prune(self, step:int, value:float) -> bool:
+        if not self._is_rung(step):
+            return False
+        values = self._values_at_step(step)
+        if len(values) < self.min_runs:
+            return False
+        # how many previous runs would still survive this rung
+        k = max(1, int(np.ceil(len(values)/self.reduction_factor)))
+        if self.maximize:
+            return value < np.sort(values)[::-1][k-1]
+        else:
+            return value > np.sort(values)[k-1]
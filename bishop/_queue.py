@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import socket
+import logging
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    experiment_name TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (experiment_name, status, id);
+"""
+
+
+def default_worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue():
+    """
+    Durable job queue backed by a single SQLite file, for splitting a Laboratory into one
+    coordinator (ideation, planning and coding) and any number of workers (running
+    experiment_fn and the Analyst).
+
+    Each job is a coded experiment attached to an existing mlflow run. Jobs move from "queued"
+    to "running" to "done" or "failed"; claiming a job is a single write transaction, so two
+    workers never get the same one. If lease is set, a job whose worker hasn't sent a heartbeat()
+    for that long is assumed to belong to a dead worker and handed out again, up to max_attempts
+    times. The attempt number works as a fencing token: heartbeat(), complete() and fail() only
+    take effect for the latest claim, so a slow worker that lost its job can tell.
+
+    For workers on several nodes, put the file on a shared filesystem with working POSIX
+    locks- SQLite's locking is unreliable on some NFS setups.
+    """
+    def __init__(self, path:str, lease:float=None, max_attempts:int=3, timeout:float=60.):
+        """
+        :path: string; location of the SQLite file (created if it doesn't exist)
+        :lease: float; seconds after which a running job can be reclaimed by another worker. None
+            to never reclaim jobs.
+        :max_attempts: int; give up on a job (mark it failed) after this many claims
+        :timeout: float; seconds to wait on a locked database before raising
+        """
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        with closing(self._connect()) as con:
+            con.executescript(_SCHEMA)
+            # queues created before heartbeats existed
+            if "heartbeat_at" not in [c[1] for c in con.execute("PRAGMA table_info(jobs)")]:
+                con.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+
+    def _connect(self):
+        # autocommit mode, so we can control transactions explicitly
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    def put(self, experiment_name:str, run_id:str, payload:dict) -> int:
+        """
+        Add a job to the queue and return its ID
+
+        :experiment_name: string; mlflow experiment the run belongs to
+        :run_id: string; mlflow run the worker should log to
+        :payload: JSON-serializable dictionary
+        """
+        with closing(self._connect()) as con:
+            cursor = con.execute("INSERT INTO jobs (experiment_name, run_id, payload, enqueued_at) VALUES (?, ?, ?, ?)",
+                                 (experiment_name, run_id, json.dumps(payload, default=str), time.time()))
+            return cursor.lastrowid
+
+    def claim(self, experiment_name:str, worker:str=None):
+        """
+        Take the oldest available job for an experiment. Returns a dictionary with keys "id",
+        "run_id", "payload" and "attempts", or None if there's nothing to do.
+        """
+        worker = worker if worker is not None else default_worker_name()
+        now = time.time()
+        con = self._connect()
+        try:
+            # take the write lock up front so no other worker can claim the same job
+            con.execute("BEGIN IMMEDIATE")
+            if self.lease is not None:
+                con.execute("UPDATE jobs SET status='failed', error='too many attempts', finished_at=? "
+                            "WHERE experiment_name=? AND status='running' AND COALESCE(heartbeat_at, started_at)<? "
+                            "AND attempts>=?", (now, experiment_name, now-self.lease, self.max_attempts))
+                row = con.execute("SELECT id, run_id, payload, attempts FROM jobs WHERE experiment_name=? AND "
+                                  "(status='queued' OR (status='running' AND COALESCE(heartbeat_at, started_at)<?)) "
+                                  "ORDER BY id LIMIT 1", (experiment_name, now-self.lease)).fetchone()
+            else:
+                row = con.execute("SELECT id, run_id, payload, attempts FROM jobs WHERE experiment_name=? AND "
+                                  "status='queued' ORDER BY id LIMIT 1", (experiment_name,)).fetchone()
+            if row is None:
+                con.execute("COMMIT")
+                return None
+            con.execute("UPDATE jobs SET status='running', worker=?, started_at=?, heartbeat_at=?, "
+                        "attempts=attempts+1 WHERE id=?", (worker, now, now, row[0]))
+            con.execute("COMMIT")
+        except Exception:
+            # e.g. BEGIN IMMEDIATE timed out, in which case there's nothing to roll back
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            raise
+        finally:
+            con.close()
+        return {"id":row[0], "run_id":row[1], "payload":json.loads(row[2]), "attempts":row[3]+1}
+
+    @staticmethod
+    def _fence(query:str, args:tuple, attempt:int):
+        if attempt is None:
+            return query, args
+        return query + " AND status='running' AND attempts=?", args + (attempt,)
+
+    def heartbeat(self, job_id:int, attempt:int) -> bool:
+        """
+        Renew the lease on a running job. Returns False if the job has been handed to another
+        worker (or finished) since this attempt claimed it.
+
+        :job_id: int; "id" from claim()
+        :attempt: int; "attempts" from claim()
+        """
+        query, args = self._fence("UPDATE jobs SET heartbeat_at=? WHERE id=?", (time.time(), job_id), attempt)
+        with closing(self._connect()) as con:
+            return con.execute(query, args).rowcount > 0
+
+    @contextmanager
+    def keep_alive(self, job:dict):
+        """
+        Send heartbeats for a claimed job from a background thread while the block runs (a few per
+        lease period), so a slow job isn't mistaken for a dead worker. Does nothing if lease is None.
+
+        :job: dictionary from claim()
+        """
+        if self.lease is None:
+            yield
+            return
+        stop = threading.Event()
+
+        def _beat():
+            while not stop.wait(self.lease/3):
+                if not self.heartbeat(job["id"], job["attempts"]):
+                    logging.warning(f"job {job['id']} was handed to another worker")
+                    return
+
+        thread = threading.Thread(target=_beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def _finish(self, job_id:int, status:str, error:str=None, attempt:int=None) -> bool:
+        query, args = self._fence("UPDATE jobs SET status=?, error=?, finished_at=? WHERE id=?",
+                                  (status, error, time.time(), job_id), attempt)
+        with closing(self._connect()) as con:
+            return con.execute(query, args).rowcount > 0
+
+    def complete(self, job_id:int, attempt:int=None) -> bool:
+        """
+        Mark a job done. If attempt is given, only if it's still the latest claim; returns whether
+        the job was updated.
+        """
+        return self._finish(job_id, "done", attempt=attempt)
+
+    def fail(self, job_id:int, error, attempt:int=None) -> bool:
+        """
+        Mark a job failed. If attempt is given, only if it's still the latest claim; returns whether
+        the job was updated.
+        """
+        return self._finish(job_id, "failed", str(error), attempt=attempt)
+
+    def counts(self, experiment_name:str=None) -> dict:
+        """
+        Number of jobs in each status
+        """
+        query = "SELECT status, COUNT(*) FROM jobs"
+        args = ()
+        if experiment_name is not None:
+            query += " WHERE experiment_name=?"
+            args = (experiment_name,)
+        with closing(self._connect()) as con:
+            return dict(con.execute(query + " GROUP BY status", args).fetchall())
+
+    def wait(self, experiment_name:str, poll_interval:float=5., timeout:float=None) -> bool:
+        """
+        Block until no jobs for this experiment are queued or running. Returns False if
+        the timeout runs out first.
+        """
+        start = time.time()
+        while True:
+            counts = self.counts(experiment_name)
+            if counts.get("queued", 0) + counts.get("running", 0) == 0:
+                return True
+            if (timeout is not None) and (time.time() - start > timeout):
+                return False
+            time.sleep(poll_interval)
@@ -0,0 +1,242 @@
+import dspy
+import json
+import time
+import heapq
+import random
+import sqlite3
+import logging
+import threading
+import itertools
+from contextlib import contextmanager
+
+from ._react import _estimate_tokens
+
+
+# lower numbers go first. ideation is on the critical path for every experiment; the
+# analyst's probing can wait a few seconds
+PRIORITIES = {"ideator":0, "planner":1, "coder":1, "analyst":2, "meta_analyst":3}
+
+_RETRY_STATUS = [408, 429, 500, 502, 503, 504, 529]
+_RETRY_ERRORS = ["RateLimitError", "LMRateLimitError", "LMServerError", "LMTimeoutError", "LMTransportError",
+                 "ServiceUnavailableError", "InternalServerError", "APIConnectionError", "Timeout"]
+
+
+def _is_retryable(e:Exception) -> bool:
+    """
+    Rate limits and transient provider errors are worth retrying; anything else (bad requests,
+    auth problems, context overflow) would just fail again
+    """
+    if type(e).__name__ in _RETRY_ERRORS:
+        return True
+    status = getattr(e, "status_code", getattr(e, "status", None))
+    return status in _RETRY_STATUS
+
+
+class _RateLimitedLM(dspy.BaseLM):
+    """
+    Pass requests through to a real LM, waiting on the rate limiter first and retrying
+    rate-limit errors. Time spent waiting shows up in the response's usage.
+    """
+    def __init__(self, lm, limiter, priority:int):
+        super().__init__(lm.model, model_type=lm.model_type, cache=lm.cache, **lm.kwargs)
+        self.lm = lm
+        self.limiter = limiter
+        self.priority = priority
+
+    def copy(self, **kwargs):
+        new = super().copy(**kwargs)
+        # the inner LM is the one that makes the request, so it needs the new settings too
+        new.lm = self.lm.copy(**kwargs)
+        return new
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        estimate = _estimate_tokens(json.dumps(messages) if messages is not None else str(prompt))
+        waited = 0.
+        for attempt in range(self.limiter.max_retries+1):
+            waited += self.limiter.acquire(estimate, self.priority)
+            try:
+                response = self.lm.forward(prompt=prompt, messages=messages, **kwargs)
+                break
+            except Exception as e:
+                # the tokens set aside for this attempt were never used
+                self.limiter.debit(-estimate)
+                if (attempt == self.limiter.max_retries) or not _is_retryable(e):
+                    raise
+                delay = self.limiter.backoff(attempt, getattr(e, "retry_after", None))
+                logging.warning(f"{self.model}: {type(e).__name__}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+                waited += delay
+        usage = getattr(response, "usage", None)
+        used = None
+        if usage is not None:
+            used = dict(usage).get("total_tokens", None)
+            extra = {"rate_limit_wait":waited, "rate_limit_retries":attempt}
+            if isinstance(usage, dict):
+                usage.update(extra)
+            else:
+                for k, v in extra.items():
+                    setattr(usage, k, v)
+        # we only had an estimate of the tokens up front; settle up now that we know
+        if used is not None:
+            self.limiter.debit(used - estimate)
+        return response
+
+
+class RateLimiter():
+    """
+    Token-bucket limiter for requests and tokens per minute, shared by every agent (and
+    every Laboratory) it's passed to. Pass one to Laboratory(rate_limiter=...).
+
+    Callers wait in priority order (see PRIORITIES; lower goes first), so ideation isn't stuck
+    behind a burst of analyst queries. Token counts are estimated from the prompt before each call
+    and corrected once the response reports its actual usage; attempts that fail get their estimate
+    back. Calls that still hit a provider rate
+    limit (or another transient error) are retried with jittered exponential backoff, respecting
+    any Retry-After the provider sends.
+
+    To share the budget across processes (e.g. several workers on one API key), give each process
+    a RateLimiter with the same path: the bucket levels live in a small SQLite file. Priority ordering
+    only applies within a process.
+    """
+    def __init__(self, requests_per_minute:float=None, tokens_per_minute:float=None, path:str=None,
+                 max_retries:int=5, base_delay:float=1., max_delay:float=60., priorities:dict=None):
+        """
+        :requests_per_minute: float; request budget. None for no limit
+        :tokens_per_minute: float; token budget (prompt plus completion). None for no limit
+        :path: optional string; SQLite file for sharing the buckets across processes
+        :max_retries: int; number of times to retry a call that fails with a retryable error
+        :base_delay: float; backoff before the first retry, in seconds. Doubles on each attempt
+        :max_delay: float; longest backoff, in seconds
+        :priorities: dictionary mapping agent names to priority classes; defaults to PRIORITIES
+        """
+        self.limits = {}
+        if requests_per_minute is not None:
+            self.limits["requests"] = requests_per_minute
+        if tokens_per_minute is not None:
+            self.limits["tokens"] = tokens_per_minute
+        self.path = path
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.priorities = priorities if priorities is not None else PRIORITIES
+        self.total_wait = 0.
+        # buckets start full
+        self._levels = {k:[v, time.time()] for k,v in self.limits.items()}
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._counter = itertools.count()
+        if path is not None:
+            with self._connect() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL, updated REAL)")
+                conn.executemany("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)",
+                                 [(k, v, t) for k, (v, t) in self._levels.items()])
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @contextmanager
+    def _buckets(self):
+        """
+        Current bucket levels (refilled up to now) as a dictionary of name -> level; changes are
+        saved on exit. Call with self._cond held.
+        """
+        if self.path is None:
+            levels = {k:v for k, (v, _) in self._levels.items()}
+            updated = {k:t for k, (_, t) in self._levels.items()}
+        else:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute("SELECT name, level, updated FROM buckets").fetchall()
+            levels = {r[0]:r[1] for r in rows if r[0] in self.limits}
+            updated = {r[0]:r[2] for r in rows if r[0] in self.limits}
+        now = time.time()
+        for k in levels:
+            levels[k] = min(self.limits[k], levels[k] + self.limits[k]*(now - updated[k])/60)
+        try:
+            yield levels
+        except Exception:
+            if self.path is not None:
+                conn.execute("ROLLBACK")
+                conn.close()
+            raise
+        if self.path is None:
+            self._levels = {k:[v, now] for k,v in levels.items()}
+        else:
+            conn.executemany("UPDATE buckets SET level=?, updated=? WHERE name=?",
+                             [(v, now, k) for k,v in levels.items()])
+            conn.execute("COMMIT")
+            conn.close()
+
+    def _take(self, tokens:int) -> float:
+        """
+        Try to take one request and some tokens from the buckets. Return 0 on success, otherwise
+        how long to wait before there should be enough
+        """
+        # a single call bigger than the whole budget goes through once the bucket is full
+        wanted = {"requests":1, "tokens":min(tokens, self.limits.get("tokens", 0))}
+        with self._buckets() as levels:
+            short = {k:wanted[k] - levels[k] for k in levels if levels[k] < wanted[k]}
+            if len(short) == 0:
+                for k in levels:
+                    levels[k] -= wanted[k]
+                return 0.
+        return max(60*v/self.limits[k] for k,v in short.items())
+
+    def acquire(self, tokens:int=0, priority:int=1) -> float:
+        """
+        Block until a request of about this many tokens fits in the budget, behind any waiting
+        requests with a lower priority number. Returns the time spent waiting, in seconds.
+        """
+        if len(self.limits) == 0:
+            return 0.
+        tic = time.perf_counter()
+        ticket = (priority, next(self._counter))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if self._waiting[0] == ticket:
+                        delay = self._take(tokens)
+                        if delay == 0:
+                            break
+                        # something more urgent might show up while we wait
+                        self._cond.wait(min(delay, 1.))
+                    else:
+                        self._cond.wait()
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+        waited = time.perf_counter() - tic
+        self.total_wait += waited
+        return waited
+
+    def debit(self, tokens:int):
+        """
+        Correct the token bucket after a call used more (or fewer) tokens than estimated
+        """
+        if ("tokens" not in self.limits) or (tokens == 0):
+            return
+        with self._cond:
+            with self._buckets() as levels:
+                levels["tokens"] = min(self.limits["tokens"], levels["tokens"] - tokens)
+            self._cond.notify_all()
+
+    def backoff(self, attempt:int, retry_after:float=None) -> float:
+        """
+        Jittered exponential backoff for the given retry attempt (starting at 0)
+        """
+        delay = min(self.max_delay, self.base_delay*2**attempt)
+        delay = random.uniform(delay/2, delay)
+        if retry_after is not None:
+            delay = max(delay, float(retry_after))
+        return delay
+
+    def wrap_lm(self, lm, agent:str=None):
+        """
+        Return a version of a dspy.LM whose calls go through this limiter, at the agent's priority
+        """
+        # wrappers don't hold any state of their own, so there's nothing to gain by caching them
+        return _RateLimitedLM(lm, self, self.priorities.get(agent, 1))
@@ -0,0 +1,291 @@
+import dspy
+import hashlib
+import logging
+
+from dspy.utils.exceptions import ContextWindowExceededError, format_error_for_lm
+
+
+def _estimate_tokens(text:str) -> int:
+    """
+    Rough token count; about four characters per token for English text and code
+    """
+    return len(text)//4
+
+
+def _digest(text:str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:8]
+
+
+def _summarize_observation(observation, max_chars:int=200) -> str:
+    """
+    Replace a (possibly long) tool observation with its first line plus enough
+    information for the LLM to recognize a repeat
+    """
+    text = str(observation)
+    if len(text) <= max_chars:
+        return text
+    lines = text.split("\n")
+    return f"[compacted: {len(lines)} lines, {len(text)} chars, sha1 {_digest(text)}] {lines[0][:max_chars]}"
+
+
+class ToolLoopFailure(Exception):
+    """
+    Raised from a tool to end a ReAct loop early, e.g. when the circuit breaker trips
+    """
+    pass
+
+
+class CircuitBreaker():
+    """
+    Keeps track of failing tool calls in a ReAct loop. When the LLM keeps resubmitting the same
+    failing call (same arguments up to whitespace, failing with the same message), append increasingly
+    pointed guidance to the tool's response, and after max_repeats attempts raise ToolLoopFailure to
+    end the loop instead of paying for round trips until max_iters.
+
+    Calls that differ in anything but whitespace- e.g. successive small fixes to a draft- are attempts
+    at a repair, not repeats, and never trip the breaker.
+
+    num_calls and num_failures count tool calls since the last reset().
+    """
+    def __init__(self, name:str, max_repeats:int=3):
+        """
+        :name: string; name of the tool, for error messages
+        :max_repeats: int; terminate the loop after this many identical failing calls
+        """
+        self.name = name
+        self.max_repeats = max_repeats
+        self.reset()
+
+    def reset(self):
+        self.num_calls = 0
+        self.num_failures = 0
+        self._failed = {}
+
+    @staticmethod
+    def _normalize(text) -> str:
+        return "".join(str(text).split())
+
+    def failure_rate(self) -> float:
+        if self.num_calls == 0:
+            return 0.
+        return self.num_failures/self.num_calls
+
+    def check(self, call:str, result, failed:bool):
+        """
+        Record a tool call and return the (possibly annotated) result
+
+        :call: string; the tool input, e.g. the pandas command or the code
+        :result: whatever the tool returned
+        :failed: bool; whether the call failed
+        """
+        self.num_calls += 1
+        if not failed:
+            return result
+        self.num_failures += 1
+        key = (self._normalize(call), self._normalize(result))
+        repeats = self._failed.get(key, 0) + 1
+        self._failed[key] = repeats
+        if repeats >= self.max_repeats:
+            raise ToolLoopFailure(f"{self.name}: giving up after {repeats} identical failing calls")
+        remaining = self.max_repeats - repeats
+        if remaining == 1:
+            result = f"{result}\nWARNING: this is attempt {repeats} of the same failing call. The next repeat will end the session."
+        elif repeats >= 2:
+            result = f"{result}\nNOTE: you already tried this {repeats - 1} time(s) and it failed the same way. Try a substantially different approach."
+        return result
+
+
+class CompactReAct(dspy.ReAct):
+    """
+    dspy.ReAct re-sends the whole trajectory on every iteration, so prompt size grows quadratically
+    over a long tool loop. This version only shows the last few steps verbatim; older observations
+    are replaced by a short summary and older drafts of "superseded" arguments (e.g. code that was
+    later resubmitted) are replaced by a hash. An optional token ceiling drops the oldest steps
+    entirely when the trajectory is still too long.
+
+    The extract step at the end still sees the full trajectory. If a tool raises ToolLoopFailure, the
+    loop stops immediately and the returned prediction includes a "failure" field explaining why.
+
+    After each call, trajectory_tokens holds the estimated size of the trajectory sent on each
+    iteration and raw_trajectory_tokens what it would have been without compaction.
+
+    last_call holds the inputs, full trajectory and failure (if any) of the most recent call, so
+    successful trajectories can be logged and reused as few-shot demos.
+
+    If cancel_event (a threading.Event) is set while the loop is running, the loop stops before its
+    next LM call and skips the extract step, returning a prediction with failure="cancelled".
+    """
+    def __init__(self, signature, tools, max_iters:int=20, keep_last:int=3, max_observation_chars:int=200,
+                 max_trajectory_tokens:int=None, superseded_args:list=None):
+        """
+        :signature: dspy Signature for the agent
+        :tools: list of tool functions
+        :max_iters: int; max number of ReAct iterations
+        :keep_last: int; number of most recent steps to show verbatim
+        :max_observation_chars: int; older observations longer than this get summarized
+        :max_trajectory_tokens: int; if the compacted trajectory is estimated to be longer than this,
+            drop the oldest steps until it fits
+        :superseded_args: list of strings; tool arguments (like "code") whose older values aren't worth
+            re-sending once the agent has moved on
+        """
+        super().__init__(signature, tools=tools, max_iters=max_iters)
+        self.keep_last = keep_last
+        self.max_observation_chars = max_observation_chars
+        self.max_trajectory_tokens = max_trajectory_tokens
+        self.superseded_args = superseded_args if superseded_args is not None else []
+        self.trajectory_tokens = []
+        self.raw_trajectory_tokens = []
+        self._compacting = False
+        self.cancel_event = None
+        self.last_call = None
+
+    @staticmethod
+    def _step(key:str) -> int:
+        return int(key.split("_")[-1])
+
+    def _compact(self, trajectory:dict) -> dict:
+        steps = sorted(set(self._step(k) for k in trajectory))
+        recent = steps[-self.keep_last:] if self.keep_last > 0 else []
+        compacted = {}
+        for k, v in trajectory.items():
+            if self._step(k) in recent:
+                compacted[k] = v
+            elif k.startswith("observation"):
+                compacted[k] = _summarize_observation(v, self.max_observation_chars)
+            elif k.startswith("tool_args") and isinstance(v, dict):
+                compacted[k] = {a:(f"<superseded by a later call; {len(str(x))} chars, sha1 {_digest(str(x))}>"
+                                   if a in self.superseded_args else x) for a,x in v.items()}
+            else:
+                compacted[k] = v
+        # enforce the token ceiling by dropping the oldest steps
+        if self.max_trajectory_tokens is not None:
+            old = [s for s in steps if s not in recent]
+            while (len(old) > 0) and (_estimate_tokens(str(compacted)) > self.max_trajectory_tokens):
+                s = old.pop(0)
+                compacted = {k:v for k,v in compacted.items() if self._step(k) != s}
+        return compacted
+
+    def _format_trajectory(self, trajectory:dict):
+        raw = super()._format_trajectory(trajectory)
+        if not self._compacting:
+            return raw
+        formatted = super()._format_trajectory(self._compact(trajectory))
+        self.raw_trajectory_tokens.append(_estimate_tokens(raw))
+        self.trajectory_tokens.append(_estimate_tokens(formatted))
+        return formatted
+
+    def _call_with_potential_trajectory_truncation(self, module, trajectory, **input_args):
+        # only compact for the tool-selection calls; extract gets everything
+        self._compacting = module is self.react
+        try:
+            return super()._call_with_potential_trajectory_truncation(module, trajectory, **input_args)
+        finally:
+            self._compacting = False
+
+    async def _async_call_with_potential_trajectory_truncation(self, module, trajectory, **input_args):
+        self._compacting = module is self.react
+        try:
+            return await super()._async_call_with_potential_trajectory_truncation(module, trajectory, **input_args)
+        finally:
+            self._compacting = False
+
+    def _cancelled(self) -> bool:
+        return (self.cancel_event is not None) and self.cancel_event.is_set()
+
+    def _start(self, input_args:dict) -> int:
+        self.trajectory_tokens = []
+        self.raw_trajectory_tokens = []
+        return input_args.pop("max_iters", self.max_iters)
+
+    def _record_selection(self, trajectory:dict, idx:int, pred):
+        trajectory[f"thought_{idx}"] = pred.next_thought
+        trajectory[f"tool_name_{idx}"] = pred.next_tool_name
+        trajectory[f"tool_args_{idx}"] = pred.next_tool_args
+
+    def _finish(self, trajectory:dict, failure:str, input_args:dict):
+        """
+        Record last_call; returns the final prediction if the loop was cancelled (so extract is skipped)
+        """
+        self.last_call = {"inputs":dict(input_args), "trajectory":trajectory, "failure":failure}
+        if self._cancelled():
+            self.last_call["failure"] = "cancelled"
+            return dspy.Prediction(trajectory=trajectory, failure="cancelled")
+        return None
+
+    @staticmethod
+    def _prediction(trajectory:dict, failure:str, extract):
+        if failure is not None:
+            return dspy.Prediction(trajectory=trajectory, failure=failure, **extract)
+        return dspy.Prediction(trajectory=trajectory, **extract)
+
+    def forward(self, **input_args):
+        # same loop as dspy.ReAct.forward(), except that a ToolLoopFailure ends it early
+        failure = None
+        trajectory = {}
+        max_iters = self._start(input_args)
+        for idx in range(max_iters):
+            if self._cancelled():
+                break
+            try:
+                pred = self._call_with_potential_trajectory_truncation(self.react, trajectory, **input_args)
+            except ContextWindowExceededError as err:
+                logging.warning(f"Ending the trajectory: {format_error_for_lm(err, traceback_frames=5)}")
+                break
+            except ValueError as err:
+                logging.warning(f"Ending the trajectory: Agent failed to select a valid tool: {format_error_for_lm(err, traceback_frames=5)}")
+                break
+
+            self._record_selection(trajectory, idx, pred)
+            try:
+                trajectory[f"observation_{idx}"] = self.tools[pred.next_tool_name](**pred.next_tool_args)
+            except ToolLoopFailure as err:
+                trajectory[f"observation_{idx}"] = str(err)
+                failure = str(err)
+                break
+            except Exception as err:
+                trajectory[f"observation_{idx}"] = f"Execution error in {pred.next_tool_name}: {format_error_for_lm(err, traceback_frames=5)}"
+
+            if pred.next_tool_name == "finish":
+                break
+
+        cancelled = self._finish(trajectory, failure, input_args)
+        if cancelled is not None:
+            return cancelled
+        extract = self._call_with_potential_trajectory_truncation(self.extract, trajectory, **input_args)
+        return self._prediction(trajectory, failure, extract)
+
+    async def aforward(self, **input_args):
+        # async version of forward()
+        failure = None
+        trajectory = {}
+        max_iters = self._start(input_args)
+        for idx in range(max_iters):
+            if self._cancelled():
+                break
+            try:
+                pred = await self._async_call_with_potential_trajectory_truncation(self.react, trajectory, **input_args)
+            except ContextWindowExceededError as err:
+                logging.warning(f"Ending the trajectory: {format_error_for_lm(err, traceback_frames=5)}")
+                break
+            except ValueError as err:
+                logging.warning(f"Ending the trajectory: Agent failed to select a valid tool: {format_error_for_lm(err, traceback_frames=5)}")
+                break
+
+            self._record_selection(trajectory, idx, pred)
+            try:
+                trajectory[f"observation_{idx}"] = await self.tools[pred.next_tool_name].acall(**pred.next_tool_args)
+            except ToolLoopFailure as err:
+                trajectory[f"observation_{idx}"] = str(err)
+                failure = str(err)
+                break
+            except Exception as err:
+                trajectory[f"observation_{idx}"] = f"Execution error in {pred.next_tool_name}: {format_error_for_lm(err, traceback_frames=5)}"
+
+            if pred.next_tool_name == "finish":
+                break
+
+        cancelled = self._finish(trajectory, failure, input_args)
+        if cancelled is not None:
+            return cancelled
+        extract = await self._async_call_with_potential_trajectory_truncation(self.extract, trajectory, **input_args)
+        return self._prediction(trajectory, failure, extract)
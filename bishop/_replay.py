@@ -0,0 +1,227 @@
+import dspy
+import json
+import gzip
+import hashlib
+import logging
+import threading
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
+
+def _sha(text:str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _open(path:str, mode:str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode+"t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class _RecordingLM(dspy.BaseLM):
+    """
+    Pass requests through to a real LM and write each request/response pair to the recorder
+    """
+    def __init__(self, lm, recorder):
+        super().__init__(lm.model, model_type=lm.model_type, cache=lm.cache, **lm.kwargs)
+        self.lm = lm
+        self.recorder = recorder
+
+    def copy(self, **kwargs):
+        new = super().copy(**kwargs)
+        # the inner LM is the one that makes the request, so it needs the new settings too
+        new.lm = self.lm.copy(**kwargs)
+        return new
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        response = self.lm.forward(prompt=prompt, messages=messages, **kwargs)
+        self.recorder._record_lm(self.model, prompt, messages, response)
+        return response
+
+
+class _ReplayLM(dspy.BaseLM):
+    """
+    Answer requests from the recorder's log without touching the network
+    """
+    def __init__(self, lm, recorder):
+        super().__init__(lm.model, model_type=lm.model_type, cache=False, **lm.kwargs)
+        self.recorder = recorder
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        return self.recorder._replay_lm(self.model, prompt, messages)
+
+
+class Recorder():
+    """
+    Record-and-replay of LLM traffic for deterministic reruns.
+
+    In "record" mode, every LM request/response made by the lab's agents and every tool observation
+    (Analyst.pandas_query, Coder.validate_code, ReActIdeator._get_criticism) is appended to a local
+    JSONL log (gzipped if the path ends in .gz). Message text is stored once and referenced by hash,
+    since agents re-send the same instructions over and over.
+
+    In "replay" mode, LM requests are answered from the log with zero network calls; requests are
+    matched by content hash first and fall back to recorded order if the prompt has drifted (e.g.
+    because experiment_fn isn't deterministic). Tools are re-run for real by default, so the non-LLM
+    parts of the lab can be profiled at full speed; set replay_tools=True to return the recorded
+    observations instead. Tool observations are matched by tool and input, so tools called from
+    several threads at once (parallel critics, coder candidates) replay the same way whatever
+    order the threads run in. Divergences from the recording are logged as warnings.
+
+    Pass the Recorder to Laboratory(recorder=...).
+    """
+    def __init__(self, path:str, mode:str="record", replay_tools:bool=False, strict:bool=False):
+        """
+        :path: string; where to write (or read) the log
+        :mode: "record" or "replay"
+        :replay_tools: bool; in replay mode, return recorded tool observations instead of re-running the tools
+        :strict: bool; in replay mode, raise an exception instead of warning when the run diverges
+            from the recording
+        """
+        assert mode in ["record", "replay"], f"unknown mode {mode}"
+        self.path = path
+        self.mode = mode
+        self.replay_tools = replay_tools
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._blobs = {}
+        if mode == "record":
+            self._file = _open(path, "a")
+        else:
+            self._file = None
+            self._load()
+
+    def _write(self, event:dict):
+        with self._lock:
+            self._file.write(json.dumps(event, separators=(",", ":")) + "\n")
+            self._file.flush()
+
+    def _intern(self, text:str) -> str:
+        """
+        Write a blob of text to the log the first time we see it; return its hash
+        """
+        text = str(text)
+        key = _sha(text)
+        if key not in self._blobs:
+            self._blobs[key] = text
+            self._write({"type":"blob", "sha":key, "text":text})
+        return key
+
+    def _request_key(self, model, prompt, messages) -> list:
+        if messages is None:
+            messages = [{"role":"user", "content":prompt}]
+        return [model] + [[m["role"], _sha(str(m["content"]))] for m in messages]
+
+    def _load(self):
+        self._lm_by_request = defaultdict(deque)
+        self._lm_in_order = []
+        self._tools = defaultdict(deque)
+        self._agents = defaultdict(deque)
+        with _open(self.path, "r") as f:
+            for line in f:
+                event = json.loads(line)
+                if event["type"] == "blob":
+                    self._blobs[event["sha"]] = event["text"]
+                elif event["type"] == "lm":
+                    event["used"] = False
+                    self._lm_by_request[json.dumps(event["request"])].append(event)
+                    self._lm_in_order.append(event)
+                elif event["type"] == "tool":
+                    self._tools[(event["stream"], event["call"])].append(event)
+                elif event["type"] == "agent":
+                    self._agents[event["name"]].append(event)
+        self._lm_position = 0
+
+    def _diverged(self, message:str):
+        if self.strict:
+            raise Exception(f"replay diverged from recording: {message}")
+        logging.warning(f"replay diverged from recording: {message}")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    #### LM traffic
+
+    def wrap_lm(self, lm):
+        """
+        Return a version of a dspy.LM that records to (or replays from) this log
+        """
+        # wrappers don't hold any state, so there's nothing to gain by caching them
+        if self.mode == "record":
+            return _RecordingLM(lm, self)
+        return _ReplayLM(lm, self)
+
+    def _record_lm(self, model, prompt, messages, response):
+        if messages is None:
+            messages = [{"role":"user", "content":prompt}]
+        request = [model] + [[m["role"], self._intern(m["content"])] for m in messages]
+        choices = [self._intern(c.message.content) for c in response.choices]
+        usage = dict(getattr(response, "usage", {}) or {})
+        usage = {k:v for k,v in usage.items() if isinstance(v, (int, float))}
+        self._write({"type":"lm", "request":request, "choices":choices, "usage":usage,
+                     "model":getattr(response, "model", model)})
+
+    def _replay_lm(self, model, prompt, messages):
+        with self._lock:
+            request = self._request_key(model, prompt, messages)
+            candidates = self._lm_by_request.get(json.dumps(request), deque())
+            while len(candidates) > 0 and candidates[0]["used"]:
+                candidates.popleft()
+            if len(candidates) > 0:
+                event = candidates.popleft()
+            else:
+                # prompt drifted; take the next unused response in recorded order
+                while (self._lm_position < len(self._lm_in_order)) and self._lm_in_order[self._lm_position]["used"]:
+                    self._lm_position += 1
+                if self._lm_position >= len(self._lm_in_order):
+                    raise Exception("replay log has no more recorded LM responses")
+                event = self._lm_in_order[self._lm_position]
+                self._diverged(f"no recorded response matches this {model} request; using the next one in order")
+            event["used"] = True
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self._blobs[c]), finish_reason="stop")
+                     for c in event["choices"]],
+            usage=event["usage"], model=event["model"])
+
+    #### tool observations and agent outputs
+
+    def tool(self, stream:str, call, fn):
+        """
+        Run (or replay) a tool call.
+
+        :stream: string; name of the tool, e.g. "analyst.pandas_query"
+        :call: the tool's input, including any options that change the result
+        :fn: function with no arguments that runs the tool
+        """
+        if self.mode == "record":
+            result = fn()
+            self._write({"type":"tool", "stream":stream, "call":self._intern(call), "result":self._intern(result)})
+            return result
+        with self._lock:
+            recorded = self._tools.get((stream, _sha(str(call))))
+            recorded = recorded.popleft() if recorded else None
+        if recorded is None:
+            self._diverged(f"{stream} called with input that wasn't recorded (or more often than recorded)")
+        if self.replay_tools and (recorded is not None):
+            return self._blobs[recorded["result"]]
+        result = fn()
+        if (recorded is not None) and (recorded["result"] != _sha(str(result))):
+            self._diverged(f"{stream} returned something different than recorded")
+        return result
+
+    def agent(self, name:str, outputs):
+        """
+        Record an agent's outputs; in replay mode, check them against the recording
+        """
+        outputs = {k:str(outputs[k]) for k in outputs.keys() if k != "trajectory"}
+        if self.mode == "record":
+            self._write({"type":"agent", "name":name, "outputs":{k:self._intern(v) for k,v in outputs.items()}})
+            return
+        with self._lock:
+            recorded = self._agents[name].popleft() if len(self._agents[name]) > 0 else None
+        if recorded is None:
+            self._diverged(f"unexpected extra call to agent {name}")
+        elif recorded["outputs"] != {k:_sha(v) for k,v in outputs.items()}:
+            self._diverged(f"agent {name} produced different outputs than recorded")
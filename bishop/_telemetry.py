@@ -0,0 +1,132 @@
+import os
+import time
+import threading
+
+
+# history columns for get_runs_as_json(resources=True)
+RESOURCE_COLUMNS = {
+    "metrics.resources.wall_time":"wall_time_s",
+    "metrics.resources.cpu_time":"cpu_time_s",
+    "metrics.resources.peak_rss_mb":"peak_memory_mb",
+}
+
+
+def _proc(name:str) -> dict:
+    """
+    Parse one of the "key: value" files in /proc/self; empty if we're not on Linux
+    """
+    try:
+        with open(f"/proc/self/{name}") as f:
+            lines = [l.split(":", 1) for l in f if ":" in l]
+    except OSError:
+        return {}
+    return {k.strip():v.strip() for k, v in lines}
+
+
+def _cpu_time() -> float:
+    # include child processes the experiment waited on
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def _io() -> dict:
+    """
+    Bytes read from and written to storage by this process so far
+    """
+    io = _proc("io")
+    if "read_bytes" in io:
+        return {"read":int(io["read_bytes"]), "write":int(io["write_bytes"])}
+    try:
+        import psutil
+        counters = psutil.Process().io_counters()
+        return {"read":counters.read_bytes, "write":counters.write_bytes}
+    except Exception:
+        return {}
+
+
+def _rss() -> float:
+    """
+    Current resident memory in MB, or None if we can't tell
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1])*os.sysconf("SC_PAGE_SIZE")/2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss/2**20
+    except Exception:
+        return None
+
+
+def _reset_peak_rss() -> bool:
+    """
+    Reset the kernel's high-water mark for this process's memory (Linux only), so VmHWM
+    measures the peak from now on
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return "VmHWM" in _proc("status")
+    except OSError:
+        return False
+
+
+class ResourceMonitor():
+    """
+    Measure what a block of code costs in compute:
+
+        with ResourceMonitor() as monitor:
+            results = experiment_fn(code)
+        monitor.resources  # {"wall_time":..., "cpu_time":..., "peak_rss_mb":..., "read_mb":..., "write_mb":...}
+
+    CPU time includes child processes that have exited. Peak memory is exact on Linux (from the
+    kernel's high-water mark); elsewhere it's sampled every `interval` seconds (which needs psutil).
+    Storage I/O comes from /proc/self/io or psutil. Anything that can't be measured on this platform
+    is left out.
+
+    The measurements cover the whole process, so nested or concurrent monitors in the same process
+    see each other's work.
+    """
+    def __init__(self, interval:float=0.05):
+        """
+        :interval: float; seconds between memory samples, when peak memory has to be sampled
+        """
+        self.interval = interval
+        self.resources = {}
+        self._sampler = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = _rss()
+            if rss is not None:
+                self._peak = max(self._peak, rss)
+
+    def __enter__(self):
+        self._exact_peak = _reset_peak_rss()
+        if not self._exact_peak:
+            self._peak = _rss() or 0.
+            if self._peak > 0:
+                self._stop = threading.Event()
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+        self._io = _io()
+        self._cpu = _cpu_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.resources = {"wall_time":time.perf_counter() - self._wall,
+                          "cpu_time":_cpu_time() - self._cpu}
+        if self._exact_peak:
+            self.resources["peak_rss_mb"] = int(_proc("status")["VmHWM"].split()[0])/1024
+        elif self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self.resources["peak_rss_mb"] = max(self._peak, _rss() or 0.)
+        io = _io()
+        if len(io) > 0 and len(self._io) > 0:
+            self.resources["read_mb"] = (io["read"] - self._io["read"])/2**20
+            self.resources["write_mb"] = (io["write"] - self._io["write"])/2**20
+        return False
@@ -0,0 +1,405 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+
+class Tracker(ABC):
+    """
+    Where a Laboratory logs its runs and reads its history from. The interface mirrors the
+    parts of mlflow's fluent API the lab uses.
+
+    Runs are started with start_run(experiment_name) as a context manager that yields the run
+    ID; the logging methods apply to the innermost active run in the current thread.
+    """
+    @abstractmethod
+    def start_run(self, experiment_name:str, run_id:str=None):
+        pass
+
+    @abstractmethod
+    def set_tag(self, key:str, value):
+        pass
+
+    @abstractmethod
+    def log_param(self, key:str, value):
+        pass
+
+    def log_params(self, params:dict):
+        for k, v in params.items():
+            self.log_param(k, v)
+
+    @abstractmethod
+    def log_metric(self, key:str, value:float, step:int=None):
+        pass
+
+    def log_metrics(self, metrics:dict, step:int=None):
+        for k, v in metrics.items():
+            self.log_metric(k, v, step=step)
+
+    @abstractmethod
+    def log_dict(self, dictionary:dict, artifact_file:str):
+        pass
+
+    @abstractmethod
+    def log_text(self, text:str, artifact_file:str):
+        pass
+
+    @abstractmethod
+    def log_artifact(self, local_path:str, artifact_path:str=None):
+        pass
+
+    @abstractmethod
+    def set_experiment_tag(self, experiment_name:str, key:str, value):
+        pass
+
+    @abstractmethod
+    def search_runs(self, experiment_name:str, columns:list=None, status:str=None, filters:dict=None,
+                    max_results:int=None, sample:bool=False, order_by:str=None, ascending:bool=False):
+        """
+        Runs from an experiment as a DataFrame laid out like mlflow.search_runs(): run_id, start_time,
+        end_time, then "tags.*", "params.*" and "metrics.*" columns (latest value of each metric).
+
+        :experiment_name: string; name of the experiment
+        :columns: list of "tags.*", "params.*" or "metrics.*" columns to return. None for all of them
+        :status: string; only return runs with this status tag
+        :filters: dictionary of "tags.*" or "params.*" columns to values; only return runs that match all of them
+        :max_results: int; return at most this many runs
+        :sample: bool; if there are more than max_results runs, return a random sample instead of the first ones
+        :order_by: string; "metrics.<name>" to sort by, for top-k queries. Defaults to most recent first
+        :ascending: bool; sort order for order_by
+        """
+        pass
+
+    @abstractmethod
+    def get_metric_history(self, run_id:str, key:str) -> dict:
+        """
+        Every value logged for a metric in a run, as a dictionary of step -> value
+        """
+        pass
+
+
+class MLflowTracker(Tracker):
+    """
+    Log to mlflow, exactly as Laboratory always has. Runs go to mlflow's active experiment, so
+    call mlflow.set_experiment() with the lab's experiment name first.
+    """
+    @contextmanager
+    def start_run(self, experiment_name:str, run_id:str=None):
+        import mlflow
+        with mlflow.start_run(run_id=run_id) as run:
+            yield run.info.run_id
+
+    def set_tag(self, key:str, value):
+        import mlflow
+        mlflow.set_tag(key, value)
+
+    def log_param(self, key:str, value):
+        import mlflow
+        mlflow.log_param(key, value)
+
+    def log_params(self, params:dict):
+        import mlflow
+        mlflow.log_params(params)
+
+    def log_metric(self, key:str, value:float, step:int=None):
+        import mlflow
+        mlflow.log_metric(key, value, step=step)
+
+    def log_metrics(self, metrics:dict, step:int=None):
+        import mlflow
+        mlflow.log_metrics(metrics, step=step)
+
+    def log_dict(self, dictionary:dict, artifact_file:str):
+        import mlflow
+        mlflow.log_dict(dictionary, artifact_file)
+
+    def log_text(self, text:str, artifact_file:str):
+        import mlflow
+        mlflow.log_text(text, artifact_file)
+
+    def log_artifact(self, local_path:str, artifact_path:str=None):
+        import mlflow
+        mlflow.log_artifact(local_path, artifact_path=artifact_path)
+
+    def set_experiment_tag(self, experiment_name:str, key:str, value):
+        import mlflow
+        mlflow.set_experiment_tag(key, value)
+
+    def search_runs(self, experiment_name:str, columns:list=None, status:str=None, filters:dict=None,
+                    max_results:int=None, sample:bool=False, order_by:str=None, ascending:bool=False):
+        import mlflow
+        filters = dict(filters or {})
+        if status is not None:
+            filters["tags.status"] = status
+        kwargs = {}
+        if len(filters) > 0:
+            kwargs["filter_string"] = " AND ".join(f"{k.split('.', 1)[0]}.`{k.split('.', 1)[1]}` = '{v}'"
+                                                   for k, v in filters.items())
+        if (max_results is not None) and not sample:
+            kwargs["max_results"] = max_results
+        if order_by is not None:
+            kwargs["order_by"] = [f"{order_by} {'ASC' if ascending else 'DESC'}"]
+        runs = mlflow.search_runs(experiment_names=[experiment_name], **kwargs)
+        if sample and (max_results is not None) and (len(runs) > max_results):
+            # mlflow can't sample on the server
+            runs = runs.sample(max_results).reset_index(drop=True)
+        if columns is not None:
+            runs = runs[[c for c in ["run_id", "start_time", "end_time"] + list(columns) if c in runs.columns]]
+        return runs
+
+    def get_metric_history(self, run_id:str, key:str) -> dict:
+        import mlflow
+        return {m.step:m.value for m in mlflow.MlflowClient().get_metric_history(run_id, key)}
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiment_tags (experiment TEXT, key TEXT, value TEXT, PRIMARY KEY (experiment, key));
+CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, experiment TEXT, status TEXT, start_time REAL, end_time REAL);
+CREATE INDEX IF NOT EXISTS runs_by_start ON runs (experiment, start_time);
+CREATE INDEX IF NOT EXISTS runs_by_status ON runs (experiment, status, start_time);
+CREATE TABLE IF NOT EXISTS params (run_id TEXT, key TEXT, value TEXT, PRIMARY KEY (run_id, key)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tags (run_id TEXT, key TEXT, value TEXT, PRIMARY KEY (run_id, key)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS metrics (run_id TEXT, key TEXT, value REAL, step INTEGER, PRIMARY KEY (run_id, key)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS metrics_by_value ON metrics (key, value);
+CREATE TABLE IF NOT EXISTS metric_history (run_id TEXT, key TEXT, value REAL, step INTEGER, timestamp REAL);
+CREATE INDEX IF NOT EXISTS metric_history_by_run ON metric_history (run_id, key, step);
+CREATE TABLE IF NOT EXISTS exported (run_id TEXT PRIMARY KEY, mlflow_run_id TEXT);
+"""
+
+
+class SqliteTracker(Tracker):
+    """
+    Embedded run store in a single SQLite file, for campaigns that log too many runs for an
+    mlflow file store to keep up with. Runs, params, tags and metrics live in indexed tables
+    (by experiment, status, start time and metric value), so history lookups and top-k queries
+    don't slow down as the experiment grows. Writes are buffered per run and inserted in bulk when
+    the run ends. Artifacts are written to artifact_dir/<run_id>/.
+
+    Call export_to_mlflow() afterwards to copy everything into the active mlflow tracking server.
+    Parts of the lab that read mlflow directly (analyze_history(), compile_agents(), RunDataset)
+    need the runs exported first.
+    """
+    def __init__(self, path:str, artifact_dir:str=None, batch_size:int=1000):
+        """
+        :path: string; SQLite file to store runs in (created if needed)
+        :artifact_dir: string; where to write artifacts. Defaults to path + ".artifacts"
+        :batch_size: int; flush buffered writes to disk after this many
+        """
+        self.path = path
+        self.artifact_dir = artifact_dir if artifact_dir is not None else f"{path}.artifacts"
+        self.batch_size = batch_size
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=60)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @property
+    def _conn(self):
+        # one connection per thread
+        if getattr(self._local, "conn", None) is None:
+            self._local.conn = self._connect()
+        return self._local.conn
+
+    @property
+    def _runs(self) -> list:
+        # stack of active runs in this thread: (run_id, buffered writes)
+        if not hasattr(self._local, "runs"):
+            self._local.runs = []
+        return self._local.runs
+
+    def _active(self) -> dict:
+        assert len(self._runs) > 0, "no active run; use tracker.start_run()"
+        return self._runs[-1]
+
+    def _buffer(self, table:str, row:tuple):
+        run = self._active()
+        run[table].append((run["run_id"],) + row)
+        if sum(len(run[t]) for t in ["params", "tags", "metrics"]) >= self.batch_size:
+            self._flush(run)
+
+    def _flush(self, run:dict):
+        """
+        Write a run's buffered params, tags and metrics in one transaction
+        """
+        with self._conn as conn:
+            conn.executemany("INSERT OR REPLACE INTO params VALUES (?, ?, ?)", run["params"])
+            conn.executemany("INSERT OR REPLACE INTO tags VALUES (?, ?, ?)", run["tags"])
+            conn.executemany("INSERT INTO metric_history VALUES (?, ?, ?, ?, ?)", run["metrics"])
+            # keep the latest value of each metric (highest step, then most recent) for queries
+            conn.executemany("""INSERT INTO metrics VALUES (?, ?, ?, ?) ON CONFLICT (run_id, key) DO UPDATE
+                                SET value=excluded.value, step=excluded.step WHERE excluded.step >= metrics.step""",
+                             [m[:4] for m in run["metrics"]])
+            statuses = [t for t in run["tags"] if t[1] == "status"]
+            if len(statuses) > 0:
+                conn.execute("UPDATE runs SET status=? WHERE run_id=?", (statuses[-1][2], run["run_id"]))
+        for t in ["params", "tags", "metrics"]:
+            run[t] = []
+
+    @contextmanager
+    def start_run(self, experiment_name:str, run_id:str=None):
+        if run_id is None:
+            run_id = uuid.uuid4().hex
+            with self._conn as conn:
+                conn.execute("INSERT INTO runs VALUES (?, ?, NULL, ?, NULL)", (run_id, experiment_name, time.time()))
+        run = {"run_id":run_id, "params":[], "tags":[], "metrics":[]}
+        self._runs.append(run)
+        try:
+            yield run_id
+        finally:
+            self._flush(run)
+            with self._conn as conn:
+                conn.execute("UPDATE runs SET end_time=? WHERE run_id=?", (time.time(), run_id))
+            self._runs.remove(run)
+
+    def set_tag(self, key:str, value):
+        self._buffer("tags", (key, str(value)))
+
+    def log_param(self, key:str, value):
+        self._buffer("params", (key, str(value)))
+
+    def log_metric(self, key:str, value:float, step:int=None):
+        self._buffer("metrics", (key, float(value), step if step is not None else 0, time.time()))
+
+    def _artifact_path(self, artifact_file:str) -> str:
+        path = os.path.join(self.artifact_dir, self._active()["run_id"], artifact_file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def log_dict(self, dictionary:dict, artifact_file:str):
+        with open(self._artifact_path(artifact_file), "w") as f:
+            if artifact_file.endswith((".yaml", ".yml")):
+                import yaml
+                yaml.safe_dump(dictionary, f)
+            else:
+                json.dump(dictionary, f)
+
+    def log_text(self, text:str, artifact_file:str):
+        with open(self._artifact_path(artifact_file), "w") as f:
+            f.write(text)
+
+    def log_artifact(self, local_path:str, artifact_path:str=None):
+        import shutil
+        name = os.path.basename(local_path)
+        shutil.copyfile(local_path, self._artifact_path(os.path.join(artifact_path or "", name)))
+
+    def set_experiment_tag(self, experiment_name:str, key:str, value):
+        with self._conn as conn:
+            conn.execute("INSERT OR REPLACE INTO experiment_tags VALUES (?, ?, ?)", (experiment_name, key, str(value)))
+
+    def search_runs(self, experiment_name:str, columns:list=None, status:str=None, filters:dict=None,
+                    max_results:int=None, sample:bool=False, order_by:str=None, ascending:bool=False):
+        import pandas as pd
+
+        # make sure this thread's own writes are visible
+        for run in self._runs:
+            self._flush(run)
+        query = "SELECT runs.run_id, runs.start_time, runs.end_time FROM runs"
+        args = []
+        if order_by is not None:
+            assert order_by.startswith("metrics."), "can only order by a metric"
+            query += " JOIN metrics ON metrics.run_id = runs.run_id AND metrics.key = ?"
+            args.append(order_by[len("metrics."):])
+        query += " WHERE runs.experiment = ?"
+        args.append(experiment_name)
+        filters = dict(filters or {})
+        if status is not None:
+            filters["tags.status"] = status
+        for column, value in filters.items():
+            if column == "tags.status":
+                # indexed on the runs table
+                query += " AND runs.status = ?"
+                args.append(str(value))
+            else:
+                table, key = column.split(".", 1)
+                assert table in ["tags", "params"], "can only filter on tags and params"
+                query += f" AND EXISTS (SELECT 1 FROM {table} WHERE {table}.run_id = runs.run_id AND key = ? AND value = ?)"
+                args += [key, str(value)]
+        if sample:
+            query += " ORDER BY RANDOM()"
+        elif order_by is not None:
+            query += f" ORDER BY metrics.value {'ASC' if ascending else 'DESC'}"
+        else:
+            query += " ORDER BY runs.start_time DESC"
+        if max_results is not None:
+            query += " LIMIT ?"
+            args.append(max_results)
+        runs = self._conn.execute(query, args).fetchall()
+        run_ids = json.dumps([r[0] for r in runs])
+        rows = {r[0]:{"run_id":r[0], "start_time":r[1], "end_time":r[2]} for r in runs}
+        for table in ["tags", "params", "metrics"]:
+            query = f"SELECT run_id, key, value FROM {table} WHERE run_id IN (SELECT value FROM json_each(?))"
+            args = [run_ids]
+            if columns is not None:
+                keys = [c[len(table)+1:] for c in columns if c.startswith(f"{table}.")]
+                query += " AND key IN (SELECT value FROM json_each(?))"
+                args.append(json.dumps(keys))
+            for run_id, key, value in self._conn.execute(query, args):
+                rows[run_id][f"{table}.{key}"] = value
+        # like mlflow, only columns that something was logged under
+        df = pd.DataFrame(list(rows.values()))
+        if len(df) == 0:
+            df = pd.DataFrame(columns=["run_id", "start_time", "end_time"])
+        for c in ["start_time", "end_time"]:
+            df[c] = pd.to_datetime(df[c], unit="s", utc=True)
+        return df
+
+    def get_metric_history(self, run_id:str, key:str) -> dict:
+        rows = self._conn.execute("SELECT step, value FROM metric_history WHERE run_id=? AND key=? ORDER BY step, timestamp",
+                                  (run_id, key)).fetchall()
+        return dict(rows)
+
+    def export_to_mlflow(self, experiment_name:str=None) -> dict:
+        """
+        Copy runs that haven't been exported yet (with their metric histories, params, tags and
+        artifacts) into mlflow experiments of the same name on the active tracking server. Returns
+        a dictionary mapping run IDs here to the new mlflow run IDs.
+
+        :experiment_name: string; only export this experiment. None for all of them
+        """
+        import mlflow
+        from mlflow.entities import Metric, Param, RunTag
+        from mlflow.tracking import MlflowClient
+
+        client = MlflowClient()
+        query = "SELECT run_id, experiment, start_time, end_time FROM runs WHERE run_id NOT IN (SELECT run_id FROM exported)"
+        args = []
+        if experiment_name is not None:
+            query += " AND experiment = ?"
+            args.append(experiment_name)
+        runs = self._conn.execute(query + " ORDER BY start_time", args).fetchall()
+        experiment_ids = {}
+        exported = {}
+        for run_id, experiment, start_time, end_time in runs:
+            if experiment not in experiment_ids:
+                found = mlflow.get_experiment_by_name(experiment)
+                experiment_ids[experiment] = found.experiment_id if found is not None else client.create_experiment(experiment)
+                for key, value in self._conn.execute("SELECT key, value FROM experiment_tags WHERE experiment=?", (experiment,)):
+                    client.set_experiment_tag(experiment_ids[experiment], key, value)
+            new = client.create_run(experiment_ids[experiment], start_time=int(1000*start_time))
+            new_id = new.info.run_id
+            params = [Param(k, v) for k, v in self._conn.execute("SELECT key, value FROM params WHERE run_id=?", (run_id,))]
+            tags = [RunTag(k, v) for k, v in self._conn.execute("SELECT key, value FROM tags WHERE run_id=?", (run_id,))]
+            metrics = [Metric(k, v, int(1000*t), s) for k, v, s, t in
+                       self._conn.execute("SELECT key, value, step, timestamp FROM metric_history WHERE run_id=?", (run_id,))]
+            # mlflow's limits on a single log_batch() call
+            for i in range(0, max(len(params), len(tags)), 100):
+                client.log_batch(new_id, params=params[i:i+100], tags=tags[i:i+100])
+            for i in range(0, len(metrics), 1000):
+                client.log_batch(new_id, metrics=metrics[i:i+1000])
+            directory = os.path.join(self.artifact_dir, run_id)
+            if os.path.isdir(directory):
+                client.log_artifacts(new_id, directory)
+            client.set_terminated(new_id, end_time=int(1000*end_time) if end_time is not None else None)
+            with self._conn as conn:
+                conn.execute("INSERT INTO exported VALUES (?, ?)", (run_id, new_id))
+            exported[run_id] = new_id
+        return exported
@@ -0,0 +1,34 @@
+import dspy
+import pytest
+
+from bishop._main import Laboratory
+from bishop._tracking import SqliteTracker
+
+
+PROMPTS = {"background":"", "analysis_question":"", "function_name":"run", "constraints":""}
+
+
+class ScriptedLab(Laboratory):
+    # no LLM: experiment n sets x = n, and the analysis just reports the score
+    num_proposed = 0
+
+    def propose_experiment(self, **kwargs):
+        self.num_proposed += 1
+        return super().propose_experiment(plan="try it", code=f"x = {self.num_proposed - 1}")
+
+    def analyze_results(self, results, outdict):
+        return {"analysis":f"score {results['score']}"}
+
+
+@pytest.fixture
+def make_lab(tmp_path):
+    """
+    Build labs that log to a SqliteTracker in tmp_path (the same file for every lab in a test),
+    with a ScriptedLab unless lab_class says otherwise. Extra keyword arguments go to the lab.
+    """
+    def _make(experiment_fn=None, experiment_name:str="lab", lab_class=ScriptedLab, lm=None, **kwargs):
+        if lm is None:
+            lm = dspy.LM("test/none", temperature=0.)
+        return lab_class(lm, experiment_fn, experiment_name, ["score"], PROMPTS, human_in_loop=False,
+                         tracker=SqliteTracker(str(tmp_path / "runs.db")), **kwargs)
+    return _make
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+from bishop._analyst import (_pandas_query, _pandas_batch_query, _share_groupbys, _stratified_sample,
+                             _render_result, Analyst)
+from bishop._digest import describe_dataframe
+
+
+df = pd.DataFrame({"group":["a", "b", "c"]*100,
+                   "x":np.arange(300, dtype=float),
+                   "y":np.ones(300)})
+
+
+def test_pandas_query_rejects_lambda():
+    result = _pandas_query('df["x"].apply(lambda z: z)', df)
+    assert result.startswith("Command failed")
+
+
+def test_share_groupbys_rewrites_repeated_groupby():
+    commands = ['df.groupby("group")["x"].mean()', 'df.groupby("group")["y"].sum()', 'df["x"].mean()']
+    rewritten, namespace = _share_groupbys(commands, df)
+    assert rewritten[0].startswith("_groupby_0")
+    assert rewritten[1].startswith("_groupby_0")
+    assert rewritten[2] == commands[2]
+    assert "_groupby_0" in namespace
+
+
+def test_batch_query_matches_single_queries():
+    commands = ['df.groupby("group")["x"].mean()', 'df.groupby("group")["y"].sum()']
+    result = _pandas_batch_query(commands, df)
+    for c in commands:
+        assert str(_pandas_query(c, df)) in result
+
+
+def test_batch_query_reports_failures_individually():
+    result = _pandas_batch_query(['df["x"].mean()', 'df.foo()'], df)
+    assert "[0]" in result and "[1]" in result
+    assert result.count("Command failed") == 1
+    assert "149.5" in result
+
+
+def test_digest_covers_categoricals_and_replicates():
+    frame = df.copy()
+    frame["experiment_index"] = np.arange(300) % 3
+    digest = describe_dataframe(frame)
+    assert "300 rows" in digest
+    assert "group: 3 levels" in digest
+    assert "Variation between replicates" in digest
+
+
+def test_digest_respects_token_budget():
+    digest = describe_dataframe(df, max_tokens=50)
+    assert len(digest) < 50*4 + 100
+
+
+def test_stratified_sample_keeps_rare_groups():
+    frame = pd.DataFrame({"group":["a"]*9990 + ["rare"]*10, "x":np.arange(10000, dtype=float)})
+    sample = _stratified_sample(frame, 500)
+    assert 450 < len(sample) < 550
+    assert (sample["group"] == "rare").sum() == 5
+
+
+def test_analyst_samples_large_frames_unless_exact():
+    analyst = Analyst(sample_threshold=100, sample_size=50)
+    analyst.set_dataframe(df)
+    approx = analyst.pandas_query('df["x"].count()')
+    assert "APPROXIMATE" in approx and "of 300 rows" in approx
+    assert "exact=True" in approx
+    exact = str(analyst.pandas_query('df["x"].count()', exact=True))
+    assert "APPROXIMATE" not in exact
+    assert "300" in exact
+
+
+def test_render_result_bounds_output_without_head():
+    result = _render_result(pd.Series(np.arange(10**6)), maxlines=5)
+    assert "first 5 of 1,000,000 items" in result
+    assert len(result.split("\n")) < 10
+    # scalars and Index objects have no .head()
+    assert _render_result(3.5) == "3.5"
+    assert "first 5 of 100 items" in _render_result(pd.Index(range(100)), maxlines=5)
+    assert "columns" in _render_result(pd.DataFrame(np.zeros((2, 100))), maxcols=10)
+
+
+def test_render_result_caps_tokens():
+    result = _render_result(pd.Series(["word "*50]*10), maxlines=15, max_tokens=100)
+    assert len(result) < 600
+    assert "characters" in result
+
+
+def test_batch_query_accepts_a_single_string(capsys):
+    analyst = Analyst(df=df, batch=True)
+    assert "149.5" in analyst.pandas_batch_query('df["x"].mean()')
+    # a lone failing command counts as a failed batch, so the circuit breaker sees the repeat
+    analyst.pandas_batch_query("df.foo()")
+    assert "attempt 2 of the same failing call" in analyst.pandas_batch_query("df.foo()")
+    assert capsys.readouterr().out == ""
+
+
+def test_digest_handles_unhashable_columns():
+    frame = pd.DataFrame({"x":[1., 2., 3.], "tags":[["a"], ["a"], ["b", "c"]], "meta":[{"k":1}]*3})
+    digest = describe_dataframe(frame)
+    assert "tags: 2 levels" in digest
+    assert "meta: 1 levels" in digest
@@ -0,0 +1,81 @@
+import json
+import dspy
+import pytest
+from types import SimpleNamespace
+
+from bishop._coder import Coder
+from bishop._optimize import trajectory_demos
+from bishop._ratelimit import RateLimiter
+from bishop._replay import Recorder
+
+
+GOOD = 'def run(x):\n    """\n    Double the input\n    """\n    # scale it\n    return 2*x'
+BAD = "import os\ndef run(x):\n    return os.getcwd()"
+
+
+class _TemperatureLM(dspy.BaseLM):
+    """
+    Always submits code to validate_code; which code depends on the temperature. Keeps the prompts.
+    """
+    def __init__(self, code_by_temperature):
+        super().__init__("test/temperature", temperature=0.)
+        self.code_by_temperature = code_by_temperature
+        self.calls = []
+        self.prompts = []
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        temperature = kwargs.get("temperature", self.kwargs["temperature"])
+        self.calls.append(temperature)
+        self.prompts.append(messages[-1]["content"])
+        code = self.code_by_temperature[temperature]
+        if "next_tool_name" not in messages[0]["content"]:
+            content = f"[[ ## reasoning ## ]]\ndone\n\n[[ ## code ## ]]\n{code}\n\n[[ ## completed ## ]]"
+        else:
+            content = (f"[[ ## next_thought ## ]]\ntry it\n\n[[ ## next_tool_name ## ]]\nvalidate_code\n\n"
+                       f"[[ ## next_tool_args ## ]]\n{json.dumps({'code':code})}\n\n[[ ## completed ## ]]")
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+                               usage={"prompt_tokens":10, "completion_tokens":5}, model=self.model)
+
+
+def test_speculative_coder_keeps_passing_candidate():
+    lm = _TemperatureLM({0.:BAD, 1.:GOOD})
+    coder = Coder(human_in_loop=False, num_candidates=2, max_iters=5)
+    with dspy.context(lm=lm):
+        code = coder(background="", plan="double it", function_name="run").code
+    assert code == GOOD
+    assert coder.winning_candidate == 1
+    # the losing candidate stops instead of running out its iterations
+    assert lm.calls.count(0.) < 5
+    # the winner's trajectory is what gets logged, and it's usable as a demo
+    assert coder.last_call is coder.candidates[1].last_call
+    assert coder.last_call["failure"] is None
+    demos = trajectory_demos(coder.react, [coder.last_call])
+    assert demos[0].next_tool_args == {"code":GOOD}
+
+
+@pytest.mark.parametrize("wrap", ["rate_limiter", "recorder"])
+def test_speculative_coder_through_lab_wrappers(tmp_path, wrap):
+    lm = _TemperatureLM({0.:BAD, 1.:GOOD})
+    if wrap == "rate_limiter":
+        wrapped = RateLimiter().wrap_lm(lm, "coder")
+    else:
+        wrapped = Recorder(str(tmp_path / "log.jsonl")).wrap_lm(lm)
+    coder = Coder(human_in_loop=False, num_candidates=2, max_iters=5)
+    with dspy.context(lm=wrapped):
+        assert coder(background="", plan="double it", function_name="run").code == GOOD
+    # each candidate really ran at its own temperature
+    assert set(lm.calls) == {0., 1.}
+
+
+def test_smoke_test_failures_reach_the_llm():
+    def smoke_test(code):
+        namespace = {}
+        exec(code, namespace)
+        assert namespace["run"](2) == 5, "run(2) should be 5"
+
+    lm = _TemperatureLM({0.:GOOD, 1.:GOOD})
+    coder = Coder(human_in_loop=False, num_candidates=2, max_iters=3, max_repeats=5, smoke_test=smoke_test)
+    with dspy.context(lm=lm):
+        with pytest.raises(Exception, match="No candidate passed"):
+            coder(background="", plan="double it", function_name="run")
+    assert any("run(2) should be 5" in p for p in lm.prompts)
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+import mlflow
+
+from bishop._analyst import Analyst
+from bishop._crossrun import RunDataset
+from bishop._mlflow import log_dataframe_artifact
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    mlflow.set_tracking_uri(f"sqlite:///{tmp_path}/mlflow.db")
+    mlflow.create_experiment("crossrun", artifact_location=(tmp_path / "artifacts").as_uri())
+    mlflow.set_experiment("crossrun")
+    for i in range(4):
+        with mlflow.start_run():
+            mlflow.set_tag("status", "complete")
+            mlflow.log_metric("score", float(i))
+            if i < 3:
+                df = pd.DataFrame({"x":np.arange(10, dtype=float) + i, "group":["a", "b"]*5})
+                if i == 2:
+                    df["extra"] = 1.
+                log_dataframe_artifact(df, "eval_results.parquet")
+    yield RunDataset.from_experiment("crossrun", cache_dir=str(tmp_path / "cache"))
+    mlflow.set_tracking_uri(None)
+
+
+def test_dataset_projects_columns(dataset):
+    assert dataset.columns == ["run_id", "x", "group", "extra", "run_score", "run_status"]
+    assert len(dataset.missing) == 1
+    assert dataset.columns_for('df.groupby("run_score")["x"].mean()') == ["run_id", "x", "run_score"]
+    df = dataset.load(["x", "run_score"])
+    assert list(df.columns) == ["run_id", "x", "run_score"]
+    assert len(df) == 30
+    assert (df.groupby("run_score")["x"].mean() == [4.5, 5.5, 6.5]).all()
+    # columns missing from a run come back as NaN
+    assert dataset.load(["extra"])["extra"].isna().sum() == 20
+
+
+def test_column_less_queries_only_load_a_sample(dataset):
+    dataset.sample_runs = 2
+    assert dataset.columns_for("df.head()") is None
+    df = dataset.load()
+    assert list(df.columns) == dataset.columns
+    assert df["run_id"].nunique() == 2 and len(df) == 20
+    assert dataset.load() is df
+    assert len(dataset.load(dataset.columns)) == 30
+    assert len(dataset) == 30
+
+    result = Analyst(dataset=dataset).pandas_query("df.shape")
+    assert "only ran on 2 of the 3 runs" in result
+    assert "(20, 6)" in result
+
+
+def test_dataset_describe(dataset):
+    description = dataset.describe()
+    assert "3 runs, 30 rows" in description
+    assert "run_score" in description
+
+
+def test_analyst_queries_dataset(dataset):
+    analyst = Analyst(dataset=dataset)
+    result = str(analyst.pandas_query('df.groupby("run_score")["x"].mean()'))
+    assert "6.5" in result
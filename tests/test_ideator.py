@@ -0,0 +1,58 @@
+import json
+import dspy
+from types import SimpleNamespace
+
+from bishop._critic import LaboratoryWithIdeaCritic
+from bishop._ideator import ReActIdeator
+
+
+class _ScriptedLM(dspy.BaseLM):
+    """
+    Plays the ideator (submit one idea, then finish) and the novelty and alignment critics. The
+    feasibility critic always errors out.
+    """
+    def __init__(self):
+        super().__init__("test/scripted", temperature=0.)
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        system, last = messages[0]["content"], messages[-1]["content"]
+        if "judge feasibility" in system:
+            raise ValueError("feasibility critic is down")
+        if "judge novelty" in system:
+            fields = {"reasoning":"hmm", "feedback":"seen it before"}
+        elif "judge alignment" in system:
+            fields = {"reasoning":"hmm", "feedback":"fits the analysis"}
+        elif "next_tool_name" not in system:
+            fields = {"reasoning":"done", "idea_title":"bigger model", "idea_summary":"scale it up",
+                      "idea_explanation":"more layers"}
+        elif "observation_0" not in last:
+            fields = {"next_thought":"ask", "next_tool_name":"_get_criticism",
+                      "next_tool_args":json.dumps({"idea":"bigger model"})}
+        else:
+            fields = {"next_thought":"good enough", "next_tool_name":"finish", "next_tool_args":"{}"}
+        content = "".join(f"[[ ## {k} ## ]]\n{v}\n\n" for k, v in fields.items()) + "[[ ## completed ## ]]"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+                               usage={"prompt_tokens":10, "completion_tokens":5}, model=self.model)
+
+
+def test_parallel_critics_merge_feedback():
+    ideator = ReActIdeator(parallel_critics=True)
+    ideator.background, ideator._history = "", "[]"
+    with dspy.context(lm=_ScriptedLM()):
+        criticism = ideator._get_criticism("bigger model")
+    sections = criticism.split("\n\n")
+    assert sections[0] == "## Novelty\nseen it before"
+    # a critic that fails doesn't take the others down with it
+    assert sections[1].startswith("## Feasibility\n(no feedback:")
+    assert "feasibility critic is down" in sections[1]
+    assert sections[2] == "## Alignment\nfits the analysis"
+
+
+def test_lab_with_parallel_critics(make_lab):
+    lab = make_lab(lab_class=LaboratoryWithIdeaCritic, lm=_ScriptedLM(), parallel_critics=True, ideator_iters=3)
+    with lab.tracker.start_run("lab"):
+        idea = lab._call_agent("ideator", background="", history="[]")
+    assert idea.idea_title == "bigger model"
+    observation = idea.trajectory["observation_0"]
+    assert "## Novelty\nseen it before" in observation
+    assert "## Alignment\nfits the analysis" in observation
@@ -0,0 +1,24 @@
+import os
+import sys
+import subprocess
+
+import pytest
+import bishop
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_bishop_is_lightweight():
+    script = ("import sys, bishop, bishop._scrub, bishop._mlflow; "
+              "print([m for m in ['dspy', 'mlflow', 'pandas', 'tqdm'] if m in sys.modules])")
+    out = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+
+def test_lazy_attributes_resolve():
+    from bishop._main import Laboratory
+    assert bishop.Laboratory is Laboratory
+    assert "Recorder" in dir(bishop)
+    with pytest.raises(AttributeError):
+        bishop.NotAThing
@@ -0,0 +1,105 @@
+import dspy
+import pytest
+
+from bishop._main import Laboratory, _lookup_price, PRICING
+
+
+class _ModelAgent(dspy.Module):
+    """
+    Fails on "test/broken" models, stalls (never calls finish) on "test/stuck" ones and otherwise
+    reports which model it ran on
+    """
+    def __init__(self):
+        super().__init__()
+        self.models = []
+
+    def forward(self, question):
+        model = dspy.settings.lm.model
+        self.models.append(model)
+        if model == "test/broken":
+            raise ValueError("context window exceeded")
+        trajectory = {"tool_name_0":"pandas_query"}
+        if model != "test/stuck":
+            trajectory["tool_name_1"] = "finish"
+        return dspy.Prediction(trajectory=trajectory, answer=model)
+
+
+def _lab(make_lab, agent_lms):
+    lab = make_lab(lab_class=Laboratory, lm=dspy.LM("openai/gpt-4.1", temperature=0.), agent_lms=agent_lms)
+    lab.agents["fake"] = _ModelAgent()
+    return lab
+
+
+def test_lookup_price_matches_whole_model_names():
+    assert _lookup_price("openai/gpt-4.1") == PRICING["gpt4.1"]
+    assert _lookup_price("openai/gpt-4.1-2025-04-14") == PRICING["gpt4.1"]
+    assert _lookup_price("lambda/deepseek-r1") == PRICING["DeepSeek_R1"]
+    assert _lookup_price("openai/gpt-4.1-mini") is None
+    assert _lookup_price("openai/gpt-4o") is None
+
+
+def test_stalled():
+    assert Laboratory._stalled({"trajectory":{"tool_name_0":"pandas_query"}})
+    assert not Laboratory._stalled({"trajectory":{"tool_name_0":"pandas_query", "tool_name_1":"finish"}})
+    assert not Laboratory._stalled({"answer":"no tool loop"})
+
+
+def test_agents_escalate_on_failure_and_stalls(make_lab):
+    lms = [dspy.LM("test/broken"), dspy.LM("test/stuck"), dspy.LM("test/big")]
+    lab = _lab(make_lab, {"fake":lms})
+    with lab.tracker.start_run("lab"):
+        outputs = lab._call_agent("fake", question="?")
+    assert outputs.answer == "test/big"
+    assert lab.agents["fake"].models == ["test/broken", "test/stuck", "test/big"]
+    assert lab.tracker.search_runs("lab")["params.fake.model"][0] == "test/big"
+
+    # the last model's answer is kept even if it stalls, and failures on the last model propagate
+    lab.agent_lms["fake"] = [dspy.LM("test/big"), dspy.LM("test/stuck")]
+    with lab.tracker.start_run("lab"):
+        assert lab._call_agent("fake", question="?").answer == "test/big"
+        lab.agent_lms["fake"] = [dspy.LM("test/stuck"), dspy.LM("test/broken")]
+        with pytest.raises(ValueError):
+            lab._call_agent("fake", question="?")
+    # agents that aren't routed use the lab's LM
+    assert lab._get_lms("analyst") == [lab.lm]
+
+
+def test_cost_only_logged_for_priced_models(make_lab):
+    lab = _lab(make_lab, {})
+    tokens = {"prompt_tokens":1e6, "completion_tokens":1e6}
+    with lab.tracker.start_run("lab"):
+        lab.usage = {"coder":{"openai/gpt-4.1":tokens}, "analyst":{"openai/gpt-4.1-mini":tokens}}
+        lab._log_usage()
+    with lab.tracker.start_run("lab"):
+        lab.usage = {"coder":{"openai/gpt-4.1-mini":tokens}}
+        lab._log_usage()
+    runs = lab.tracker.search_runs("lab")
+    assert runs["metrics.cost"].isna().tolist() == [True, False]
+    assert runs["metrics.cost"][1] == pytest.approx(sum(PRICING["gpt4.1"]))
+    assert runs["metrics.prompt_tokens"][0] == 1e6
+
+
+def test_successive_halving_promotes_the_best(make_lab):
+    calls = []
+
+    def experiment_fn(code, budget):
+        namespace = {}
+        exec(code, namespace)
+        calls.append((namespace["x"], budget))
+        if namespace["x"] == 1:
+            raise ValueError("bad experiment")
+        return {"score":namespace["x"]*budget}
+
+    lab = make_lab(experiment_fn, num_experiment_averages=2)
+    finished = lab.successive_halving(N=9, budgets=[1, 3, 9], eta=3)
+    # 8 of 9 experiments work; the top 8//3 move on, then the top one, which gets 2 replicates at the end
+    assert sorted(calls) == sorted([(x, 1) for x in range(9)] + [(7, 3), (8, 3), (8, 9), (8, 9)])
+    assert len(finished) == 8
+    assert finished[-1].analysis == "score 72.0"
+
+    runs = lab.tracker.search_runs("lab").set_index("params.coder.code")
+    assert runs.loc["x = 8", "tags.status"] == "complete"
+    assert runs.loc["x = 1", "tags.status"] == "error"
+    assert (runs.drop(["x = 8", "x = 1"])["tags.status"] == "pruned").all()
+    assert runs.loc["x = 7", "tags.budget"] == "3"
+    assert lab.tracker.get_metric_history(runs.loc["x = 8", "run_id"], "score") == {0:8., 1:24., 2:72.}
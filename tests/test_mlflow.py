@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+import mlflow
+
+from bishop._mlflow import (get_dataframe_from_mlflow_artifact, get_dataframes_from_mlflow_artifacts,
+                            log_dataframe_artifact)
+
+
+@pytest.fixture
+def runs(tmp_path):
+    mlflow.set_tracking_uri(f"sqlite:///{tmp_path}/mlflow.db")
+    # keep artifacts out of ./mlruns
+    mlflow.create_experiment("artifacts", artifact_location=(tmp_path / "artifacts").as_uri())
+    mlflow.set_experiment("artifacts")
+    run_ids = []
+    for i, path in enumerate(["eval_results.csv", "eval_results.parquet", "results/eval.feather"]):
+        with mlflow.start_run() as run:
+            df = pd.DataFrame({"a":np.arange(10) + i, "b":np.ones(10), "c":["x"]*10})
+            log_dataframe_artifact(df, path)
+            run_ids.append((run.info.run_id, path))
+    yield run_ids
+    mlflow.set_tracking_uri(None)
+
+
+def test_artifact_formats_and_projection(runs, tmp_path):
+    for i, (run_id, path) in enumerate(runs):
+        df = get_dataframe_from_mlflow_artifact(run_id, path, columns=["a", "c"], cache_dir=str(tmp_path))
+        assert list(df.columns) == ["a", "c"]
+        assert df["a"].iloc[0] == i
+
+
+def test_artifact_cache_skips_download(runs, tmp_path, monkeypatch):
+    run_id, path = runs[0]
+    first = get_dataframe_from_mlflow_artifact(run_id, path, cache_dir=str(tmp_path))
+
+    def fail(*args, **kwargs):
+        raise AssertionError("should have used the cache")
+    monkeypatch.setattr(mlflow.artifacts, "download_artifacts", fail)
+    second = get_dataframe_from_mlflow_artifact(run_id, path, cache_dir=str(tmp_path))
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_bulk_download_skips_missing(runs, tmp_path):
+    run_ids = [r for r,_ in runs]
+    df = get_dataframes_from_mlflow_artifacts(run_ids, "eval_results.parquet", columns=["a"],
+                                              cache_dir=str(tmp_path))
+    assert len(df) == 10
+    assert set(df.columns) == {"a", "run_id"}
+    assert (df["run_id"] == run_ids[1]).all()
+
+
+def test_csv_kept_when_conversion_fails(runs, tmp_path, monkeypatch):
+    run_id, path = runs[0]
+
+    def fail(*args, **kwargs):
+        raise TypeError("arrow can't convert this column")
+    monkeypatch.setattr(pd.DataFrame, "to_parquet", fail)
+    df = get_dataframe_from_mlflow_artifact(run_id, path, columns=["a"], cache_dir=str(tmp_path))
+    assert list(df["a"]) == list(range(10))
@@ -0,0 +1,64 @@
+import mlflow
+import pytest
+
+from bishop._analyst import Analyst
+from bishop._optimize import trajectory_demos, compile_agent, save_compiled_agent, load_compiled_agent
+
+
+def _call(commands, observations, finish=True, failure=None):
+    trajectory = {}
+    for i, (c, o) in enumerate(zip(commands, observations)):
+        trajectory[f"thought_{i}"] = f"thought {i}"
+        trajectory[f"tool_name_{i}"] = "pandas_query"
+        trajectory[f"tool_args_{i}"] = {"command":c}
+        trajectory[f"observation_{i}"] = o
+    if finish:
+        i = len(commands)
+        trajectory.update({f"thought_{i}":"done", f"tool_name_{i}":"finish", f"tool_args_{i}":{},
+                           f"observation_{i}":"Completed."})
+    return {"inputs":{"question":"which group is best?", "description":"x\n"*1000},
+            "trajectory":trajectory, "failure":failure}
+
+
+CALLS = [_call(['df.apply(lambda x: x)', 'df.groupby("g")["x"].mean()'], ["Command failed: no lambdas", "a 1.0"]),
+         _call(['df.describe()'], ["..."], finish=False),
+         _call(['df.describe()'], ["..."], failure="pandas_query: giving up"),
+         _call(['df["x"].mean()'], ["3.0"])]
+
+
+def test_demos_skip_failed_steps_and_calls():
+    analyst = Analyst()
+    demos = trajectory_demos(analyst.react, CALLS, max_input_tokens=50)
+    assert [d.next_tool_args["command"] for d in demos] == ['df.groupby("g")["x"].mean()', 'df["x"].mean()']
+    # the failed lambda call is still part of the trajectory leading up to the demo
+    assert "lambda" in demos[0].trajectory
+    assert len(demos[0].description) < 300
+
+
+def test_compiling_without_demos_keeps_loaded_ones():
+    analyst = Analyst()
+    compile_agent(analyst, CALLS, max_demos=2)
+    assert compile_agent(analyst, CALLS[1:3]) == 0
+    assert len(analyst.react.react.demos) == 2
+
+
+def test_save_and_load_compiled_versions(tmp_path):
+    mlflow.set_tracking_uri(f"sqlite:///{tmp_path}/mlflow.db")
+    try:
+        mlflow.create_experiment("lab.compiled", artifact_location=(tmp_path / "artifacts").as_uri())
+        analyst = Analyst()
+        assert compile_agent(analyst, CALLS, max_demos=1) == 2
+        assert save_compiled_agent(analyst, "analyst", "lab") == 1
+        compile_agent(analyst, CALLS, max_demos=2)
+        assert save_compiled_agent(analyst, "analyst", "lab") == 2
+
+        fresh = Analyst()
+        assert load_compiled_agent(fresh, "analyst", "lab") == 2
+        assert len(fresh.react.react.demos) == 2
+        assert load_compiled_agent(fresh, "analyst", "lab", version=1) == 1
+        assert len(fresh.react.react.demos) == 1
+        assert load_compiled_agent(fresh, "coder", "lab") is None
+        with pytest.raises(AssertionError):
+            load_compiled_agent(fresh, "analyst", "lab", version=3)
+    finally:
+        mlflow.set_tracking_uri(None)
@@ -0,0 +1,32 @@
+import time
+
+import dspy
+import pytest
+from dspy.utils.usage_tracker import track_usage
+
+from bishop._parallel import run_in_threads
+
+
+def _use_lm():
+    time.sleep(0.1)
+    dspy.settings.usage_tracker.add_usage(dspy.settings.lm, {"prompt_tokens":10})
+    return dspy.settings.lm
+
+
+def test_run_in_threads_keeps_context_and_usage():
+    tic = time.perf_counter()
+    with dspy.context(lm="fake-lm"):
+        with track_usage() as usage:
+            results = run_in_threads([_use_lm]*3)
+    assert time.perf_counter() - tic < 0.25
+    assert results == ["fake-lm"]*3
+    assert usage.get_total_tokens()["fake-lm"]["prompt_tokens"] == 30
+
+
+def test_run_in_threads_exceptions():
+    def fail():
+        raise ValueError("nope")
+    results = run_in_threads([lambda: 1, fail], return_exceptions=True)
+    assert results[0] == 1 and isinstance(results[1], ValueError)
+    with pytest.raises(ValueError):
+        run_in_threads([lambda: 1, fail])
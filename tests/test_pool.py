@@ -0,0 +1,75 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from bishop._pool import ExperimentPool
+from bishop._pruning import ExperimentPruned
+
+
+def _setup():
+    return {"x":np.arange(1000, dtype=float), "scale":2.}
+
+
+def _worker_init(fixtures):
+    # stand-in for loading a model or initializing a library
+    time.sleep(0.5)
+    return {"pid":os.getpid()}
+
+
+def _init_once(fixtures):
+    # the first worker starts; any replacement fails
+    if os.path.exists(fixtures["marker"]):
+        raise RuntimeError("no GPU left")
+    open(fixtures["marker"], "w").close()
+
+
+def _experiment_fn(code, fixtures, report=None):
+    namespace = {}
+    exec(code, namespace)
+    y = namespace["run"](fixtures["x"])*fixtures["scale"]
+    if report is not None:
+        for step in range(3):
+            report(step, {"score":float(step)})
+    return {"score":float(y.mean()), "pid":fixtures["pid"]}
+
+
+def test_pool_reuses_warm_workers_and_shares_fixtures():
+    with ExperimentPool(_experiment_fn, setup=_setup, worker_init=_worker_init) as pool:
+        results = [pool("def run(x):\n    return x + 1") for _ in range(3)]
+        assert results[0]["score"] == 2*500.5
+        # same worker every time, and the fixtures are read-only
+        assert len(set(r["pid"] for r in results)) == 1
+        with pytest.raises(ValueError):
+            pool("def run(x):\n    x[0] = 1\n    return x")
+
+
+def test_pool_relays_reports_and_replaces_dead_workers():
+    reports = []
+
+    def report(step, metrics):
+        reports.append(step)
+        if step == 1:
+            raise ExperimentPruned(step, 1., "losing")
+
+    with ExperimentPool(_experiment_fn, setup=_setup, worker_init=_worker_init, timeout=5) as pool:
+        with pytest.raises(ExperimentPruned):
+            pool("def run(x):\n    return x", report=report)
+        assert reports == [0, 1]
+        pid = pool("def run(x):\n    return x")["pid"]
+        with pytest.raises(Exception, match="died"):
+            pool("import os\ndef run(x):\n    os._exit(1)")
+        assert pool("def run(x):\n    return x")["pid"] != pid
+
+
+def test_pool_reports_failed_replacements(tmp_path):
+    marker = str(tmp_path / "started")
+    with ExperimentPool(_experiment_fn, setup=lambda: {**_setup(), "marker":marker}, worker_init=_init_once, timeout=5) as pool:
+        with pytest.raises(Exception, match="died") as info:
+            pool("import os\ndef run(x):\n    os._exit(1)")
+        assert "no GPU left" in "\n".join(info.value.__notes__)
+        # no workers left, so later calls fail instead of waiting forever
+        for _ in range(2):
+            with pytest.raises(Exception, match="no workers left"):
+                pool("def run(x):\n    return x")
@@ -0,0 +1,64 @@
+import pytest
+from bishop._pruning import MedianStoppingPruner, SuccessiveHalvingPruner
+
+
+def _add_runs(pruner, curves):
+    for c in curves:
+        pruner.start_run()
+        for step, value in c.items():
+            pruner.report(step, value)
+        pruner.finish_run()
+
+
+def test_median_pruner_waits_for_min_runs():
+    pruner = MedianStoppingPruner("acc", min_runs=3)
+    _add_runs(pruner, [{0:0.5}, {0:0.6}])
+    assert not pruner.should_prune(0, 0.0)
+
+
+def test_median_pruner_prunes_below_median():
+    pruner = MedianStoppingPruner("acc", min_runs=3)
+    _add_runs(pruner, [{0:0.5, 1:0.6}, {0:0.6, 1:0.7}, {0:0.7, 1:0.8}])
+    assert pruner.should_prune(1, 0.1)
+    assert not pruner.should_prune(1, 0.9)
+
+
+def test_median_pruner_minimize():
+    pruner = MedianStoppingPruner("loss", maximize=False, min_runs=3)
+    _add_runs(pruner, [{0:0.5}, {0:0.6}, {0:0.7}])
+    assert pruner.should_prune(0, 1.0)
+    assert not pruner.should_prune(0, 0.1)
+
+
+def test_median_pruner_only_compares_runs_that_reached_the_step():
+    pruner = MedianStoppingPruner("acc", min_runs=3)
+    # the first two runs were stopped early; their step 0 values don't count at step 5
+    _add_runs(pruner, [{0:0.1}, {0:0.1}, {0:0.5, 5:0.8}, {0:0.6, 5:0.9}])
+    assert not pruner.should_prune(5, 0.1)
+    pruner.curves.append({5:0.7})
+    assert pruner.should_prune(5, 0.75)
+    assert not pruner.should_prune(5, 0.85)
+
+
+def test_replicates_are_averaged():
+    pruner = MedianStoppingPruner("acc")
+    pruner.start_run()
+    pruner.report(0, 0.2)
+    assert pruner.report(0, 0.4) == pytest.approx(0.3)
+
+
+def test_successive_halving_only_checks_rungs():
+    pruner = SuccessiveHalvingPruner("acc", min_runs=3, min_resource=1, reduction_factor=3)
+    _add_runs(pruner, [{1:0.5, 2:0.5, 3:0.5}, {1:0.6, 2:0.6, 3:0.6}, {1:0.9, 2:0.9, 3:0.9}])
+    # step 2 isn't a rung
+    assert not pruner.should_prune(2, 0.0)
+    # rungs at 1 and 3; only the best of three survives
+    assert pruner.should_prune(3, 0.7)
+    assert not pruner.should_prune(3, 0.95)
+
+
+def test_successive_halving_validates_rungs():
+    with pytest.raises(AssertionError):
+        SuccessiveHalvingPruner("acc", min_resource=0)
+    with pytest.raises(AssertionError):
+        SuccessiveHalvingPruner("acc", reduction_factor=1)
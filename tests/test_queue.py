@@ -0,0 +1,87 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bishop._queue import JobQueue
+
+
+def test_queue_hands_out_jobs_in_order(tmp_path):
+    q = JobQueue(str(tmp_path / "q.db"))
+    for i in range(3):
+        q.put("exp", f"run{i}", {"i":i})
+    q.put("other", "run_other", {})
+    job = q.claim("exp")
+    assert job["run_id"] == "run0" and job["payload"] == {"i":0}
+    q.complete(job["id"])
+    q.fail(q.claim("exp")["id"], "oops")
+    assert q.counts("exp") == {"done":1, "failed":1, "queued":1}
+    assert q.claim("exp")["run_id"] == "run2"
+    assert q.claim("exp") is None
+
+
+def test_queue_never_double_claims(tmp_path):
+    q = JobQueue(str(tmp_path / "q.db"))
+    for i in range(20):
+        q.put("exp", f"run{i}", {})
+
+    def work(_):
+        claimed = []
+        while (job := q.claim("exp")) is not None:
+            claimed.append(job["id"])
+        return claimed
+
+    with ThreadPoolExecutor(4) as pool:
+        claimed = sum(pool.map(work, range(4)), [])
+    assert sorted(claimed) == list(range(1, 21))
+
+
+def test_queue_reclaims_expired_leases(tmp_path):
+    q = JobQueue(str(tmp_path / "q.db"), lease=0.01, max_attempts=2)
+    q.put("exp", "run0", {})
+    assert q.claim("exp")["attempts"] == 1
+    time.sleep(0.02)
+    assert q.claim("exp")["attempts"] == 2
+    time.sleep(0.02)
+    # out of attempts
+    assert q.claim("exp") is None
+    assert q.counts("exp") == {"failed":1}
+
+
+def test_heartbeats_keep_the_lease_and_fence_stale_workers(tmp_path):
+    q = JobQueue(str(tmp_path / "q.db"), lease=0.2)
+    q.put("exp", "run0", {})
+    job = q.claim("exp")
+    with q.keep_alive(job):
+        time.sleep(0.4)
+        # still ours
+        assert q.claim("exp") is None
+    time.sleep(0.3)
+    stolen = q.claim("exp")
+    assert stolen["attempts"] == 2
+    # the first worker can't renew or finish a job it no longer holds
+    assert not q.heartbeat(job["id"], job["attempts"])
+    assert not q.fail(job["id"], "slow", attempt=job["attempts"])
+    assert q.complete(stolen["id"], attempt=stolen["attempts"])
+    assert q.counts("exp") == {"done":1}
+
+
+def _experiment_fn(code):
+    namespace = {}
+    exec(code, namespace)
+    if namespace["x"] == 1:
+        raise ValueError("bad experiment")
+    return {"score":float(namespace["x"])}
+
+
+def test_enqueue_and_run_worker_end_to_end(tmp_path, make_lab):
+    q = JobQueue(str(tmp_path / "q.db"), lease=10)
+    # both labs log to the same run store
+    coordinator, worker = [make_lab(_experiment_fn, "exp") for _ in range(2)]
+    run_ids = coordinator.enqueue_experiments(q, N=3)
+    assert q.counts("exp") == {"queued":3}
+    assert worker.run_worker(q, poll_interval=0.01, idle_timeout=0.05, worker="w1") == 3
+    assert q.counts("exp") == {"done":2, "failed":1}
+    runs = worker.tracker.search_runs("exp").set_index("run_id").loc[run_ids]
+    assert list(runs["tags.status"]) == ["complete", "error", "complete"]
+    assert list(runs["tags.worker"]) == ["w1"]*3
+    assert runs["metrics.score"].iloc[2] == 2.
+    assert runs["params.coder.code"].iloc[0] == "x = 0"
@@ -0,0 +1,88 @@
+import time
+import threading
+import dspy
+import pytest
+from types import SimpleNamespace
+
+from bishop._ratelimit import RateLimiter
+
+
+class _FlakyLM(dspy.BaseLM):
+    """
+    Fails with a rate-limit error the first few times it's called
+    """
+    def __init__(self, failures:int=0):
+        super().__init__("test/flaky", temperature=0.)
+        self.failures = failures
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        if self.failures > 0:
+            self.failures -= 1
+            error = Exception("slow down")
+            error.status_code = 429
+            raise error
+        content = "[[ ## answer ## ]]\nok\n\n[[ ## completed ## ]]"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+                               usage={"prompt_tokens":10, "completion_tokens":5, "total_tokens":15}, model=self.model)
+
+
+def test_bucket_throttles_requests(monkeypatch):
+    # a fake clock, in steps that are exact in floating point
+    clock = [1024.]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+    limiter = RateLimiter(requests_per_minute=480, tokens_per_minute=480)
+    # the bucket starts full, then refills at 8 requests per second
+    assert all(limiter._take(0) == 0 for _ in range(480))
+    assert limiter._take(0) == pytest.approx(0.125)
+    clock[0] += 0.0625
+    assert limiter._take(0) == pytest.approx(0.0625)
+    clock[0] += 0.0625
+    assert limiter._take(0) == 0
+    # and 8 tokens per second; 80 tokens short means 10 seconds to wait
+    clock[0] += 60
+    assert limiter._take(400) == 0
+    assert limiter._take(160) == pytest.approx(10)
+
+
+def test_priority_goes_first():
+    limiter = RateLimiter(requests_per_minute=120)
+    for _ in range(120):
+        limiter.acquire()
+    order = []
+
+    def wait(priority, name):
+        limiter.acquire(priority=priority)
+        order.append(name)
+    low = threading.Thread(target=wait, args=(2, "analyst"))
+    low.start()
+    time.sleep(0.05)
+    high = threading.Thread(target=wait, args=(0, "ideator"))
+    high.start()
+    low.join(); high.join()
+    # the analyst was queued first, but the ideator gets the next request
+    assert order == ["ideator", "analyst"]
+
+
+def test_retries_and_reports_wait(tmp_path):
+    limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=100000, path=str(tmp_path/"limits.db"),
+                          base_delay=0.01)
+    lm = limiter.wrap_lm(_FlakyLM(failures=2), "ideator")
+    with dspy.context(lm=lm):
+        with dspy.track_usage() as usage:
+            assert dspy.Predict("question -> answer")(question="hi").answer == "ok"
+    totals = usage.get_total_tokens()["test/flaky"]
+    assert totals["rate_limit_retries"] == 2
+    assert totals["rate_limit_wait"] > 0
+    with pytest.raises(Exception):
+        with dspy.context(lm=RateLimiter(max_retries=1, base_delay=0.01).wrap_lm(_FlakyLM(failures=5))):
+            dspy.Predict("question -> answer")(question="hi")
+
+
+def test_failed_attempts_give_their_tokens_back():
+    limiter = RateLimiter(tokens_per_minute=1000, base_delay=0.01)
+    with dspy.context(lm=limiter.wrap_lm(_FlakyLM(failures=2))):
+        dspy.Predict("question -> answer")(question="hi")
+    # only the successful call's 15 tokens stay debited
+    with limiter._cond:
+        with limiter._buckets() as levels:
+            assert 1000 - 15 <= levels["tokens"] < 1000 - 10
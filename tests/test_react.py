@@ -0,0 +1,132 @@
+import json
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import dspy
+import pytest
+from bishop._react import CompactReAct, CircuitBreaker, ToolLoopFailure
+
+
+def _tool(code:str) -> str:
+    """check some code"""
+    return "pass"
+
+
+def _trajectory(n, observation="line\n"*100):
+    trajectory = {}
+    for i in range(n):
+        trajectory[f"thought_{i}"] = f"thought {i}"
+        trajectory[f"tool_name_{i}"] = "_tool"
+        trajectory[f"tool_args_{i}"] = {"code":f"def draft_{i}():\n    return {i}"}
+        trajectory[f"observation_{i}"] = observation
+    return trajectory
+
+
+def test_compact_keeps_recent_steps_verbatim():
+    react = CompactReAct("question -> answer", tools=[_tool], keep_last=2, superseded_args=["code"])
+    trajectory = _trajectory(5)
+    compacted = react._compact(trajectory)
+    for i in [3, 4]:
+        assert compacted[f"observation_{i}"] == trajectory[f"observation_{i}"]
+        assert compacted[f"tool_args_{i}"] == trajectory[f"tool_args_{i}"]
+    for i in [0, 1, 2]:
+        assert compacted[f"observation_{i}"].startswith("[compacted")
+        assert "superseded" in compacted[f"tool_args_{i}"]["code"]
+    # the original trajectory shouldn't be modified
+    assert trajectory["observation_0"] == "line\n"*100
+
+
+def test_compact_enforces_token_ceiling():
+    react = CompactReAct("question -> answer", tools=[_tool], keep_last=1, max_trajectory_tokens=200)
+    compacted = react._compact(_trajectory(20))
+    assert "observation_19" in compacted
+    assert "observation_0" not in compacted
+
+
+def test_circuit_breaker_escalates_then_trips():
+    breaker = CircuitBreaker("pandas_query", max_repeats=3)
+    first = breaker.check("df.foo()", "Command failed", True)
+    assert first == "Command failed"
+    # whitespace differences still count as a repeat
+    second = breaker.check("df.foo( )", "Command failed", True)
+    assert "next repeat will end the session" in second
+    with pytest.raises(ToolLoopFailure):
+        breaker.check("df.foo()", "Command failed", True)
+    assert breaker.num_failures == 3
+
+
+def test_circuit_breaker_ignores_distinct_and_passing_calls():
+    breaker = CircuitBreaker("pandas_query", max_repeats=2)
+    breaker.check("df.foo()", "Command failed", True)
+    breaker.check("df.groupby('x').size()", "Command failed", True)
+    assert breaker.check("df.mean()", "ok", False) == "ok"
+    assert breaker.failure_rate() == pytest.approx(2/3)
+    breaker.reset()
+    assert breaker.num_calls == 0
+
+
+def test_circuit_breaker_allows_repair_loops():
+    breaker = CircuitBreaker("validate_code", max_repeats=3)
+    code = "import numpy as np\ndef run(lr=0.1):\n    return np.zeros(3)"
+    breaker.check(code, "Code failed: score too low", True)
+    breaker.check(code.replace("0.1", "0.01"), "Code failed: score too low", True)
+    breaker.check(code.replace("numpy", "jax.numpy"), "Code failed: score too low", True)
+    # the same code failing differently isn't a repeat either
+    assert breaker.check(code, "Code failed: timeout", True) == "Code failed: timeout"
+
+
+def test_circuit_breaker_warnings_count_down():
+    breaker = CircuitBreaker("pandas_query", max_repeats=5)
+    results = [breaker.check("df.foo()", "Command failed", True) for _ in range(4)]
+    assert results[0] == "Command failed"
+    assert all("NOTE" in r for r in results[1:3])
+    assert "next repeat will end the session" in results[3]
+    with pytest.raises(ToolLoopFailure, match="5 identical"):
+        breaker.check("df.foo()", "Command failed", True)
+
+
+class _ToolLM(dspy.BaseLM):
+    """
+    Always calls the tool; answers "done" when asked to extract
+    """
+    def __init__(self):
+        super().__init__("test/tool", temperature=0.)
+        self.num_calls = 0
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        self.num_calls += 1
+        if "next_tool_name" not in messages[0]["content"]:
+            content = "[[ ## reasoning ## ]]\nok\n\n[[ ## answer ## ]]\ndone\n\n[[ ## completed ## ]]"
+        else:
+            content = (f"[[ ## next_thought ## ]]\ntry it\n\n[[ ## next_tool_name ## ]]\n_failing_tool\n\n"
+                       f"[[ ## next_tool_args ## ]]\n{json.dumps({'code':'x'})}\n\n[[ ## completed ## ]]")
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+                               usage={"prompt_tokens":10, "completion_tokens":5}, model=self.model)
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        return self.forward(prompt=prompt, messages=messages, **kwargs)
+
+
+def _failing_tool(code:str) -> str:
+    """check some code"""
+    raise ToolLoopFailure("_failing_tool: giving up")
+
+
+def test_async_loop_stops_on_tool_loop_failure_and_cancellation():
+    lm = _ToolLM()
+    react = CompactReAct("question -> answer", tools=[_failing_tool], max_iters=5)
+    with dspy.context(lm=lm):
+        pred = asyncio.run(react.acall(question="q"))
+    assert pred.failure == "_failing_tool: giving up"
+    assert pred.answer == "done"
+    assert react.last_call["failure"] == pred.failure
+    # one tool selection, then extract
+    assert lm.num_calls == 2
+
+    react.cancel_event = threading.Event()
+    react.cancel_event.set()
+    with dspy.context(lm=lm):
+        pred = asyncio.run(react.acall(question="q"))
+    assert pred.failure == "cancelled"
+    assert lm.num_calls == 2
@@ -0,0 +1,69 @@
+import dspy
+import pytest
+from types import SimpleNamespace
+from bishop._replay import Recorder
+
+
+class _CountingLM(dspy.BaseLM):
+    def __init__(self):
+        super().__init__("test/counting", temperature=0.)
+        self.num_calls = 0
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        self.num_calls += 1
+        content = f"[[ ## answer ## ]]\nanswer {self.num_calls}\n\n[[ ## completed ## ]]"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+                               usage={"prompt_tokens":10, "completion_tokens":5}, model=self.model)
+
+
+def test_record_then_replay_lm(tmp_path):
+    path = str(tmp_path/"log.jsonl.gz")
+    predict = dspy.Predict("question -> answer")
+    lm = _CountingLM()
+    recorder = Recorder(path, mode="record")
+    with dspy.context(lm=recorder.wrap_lm(lm)):
+        recorded = [predict(question=q).answer for q in ["a", "b"]]
+    recorder.close()
+    assert lm.num_calls == 2
+
+    lm = _CountingLM()
+    recorder = Recorder(path, mode="replay", strict=True)
+    with dspy.context(lm=recorder.wrap_lm(lm)):
+        # out of order, to make sure requests are matched by content
+        replayed = [predict(question=q).answer for q in ["b", "a"]]
+    assert lm.num_calls == 0
+    assert replayed == recorded[::-1]
+
+
+def test_record_then_replay_tools(tmp_path):
+    path = str(tmp_path/"log.jsonl")
+    recorder = Recorder(path, mode="record")
+    assert recorder.tool("analyst.pandas_query", "df.mean()", lambda: "3.0") == "3.0"
+    recorder.close()
+
+    recorder = Recorder(path, mode="replay", replay_tools=True)
+    assert recorder.tool("analyst.pandas_query", "df.mean()", lambda: "something else") == "3.0"
+
+
+def test_tools_replay_by_input_in_any_order(tmp_path):
+    path = str(tmp_path/"log.jsonl")
+    recorder = Recorder(path, mode="record")
+    for call, result in [("a", "1"), ("b", "2"), ("a", "3")]:
+        recorder.tool("coder.validate_code", call, lambda: result)
+    recorder.tool("analyst.pandas_query", {"command":"df.mean()", "exact":False}, lambda: "approx")
+    recorder.close()
+
+    recorder = Recorder(path, mode="replay", replay_tools=True, strict=True)
+    # e.g. coder candidates running in a different order than when they were recorded
+    assert recorder.tool("coder.validate_code", "b", lambda: None) == "2"
+    assert recorder.tool("coder.validate_code", "a", lambda: None) == "1"
+    assert recorder.tool("coder.validate_code", "a", lambda: None) == "3"
+    with pytest.raises(Exception):
+        recorder.tool("analyst.pandas_query", {"command":"df.mean()", "exact":True}, lambda: "exact")
+    assert recorder.tool("analyst.pandas_query", {"command":"df.mean()", "exact":False}, lambda: None) == "approx"
+
+
+def test_wrap_lm_returns_a_wrapper_for_each_lm(tmp_path):
+    recorder = Recorder(str(tmp_path/"log.jsonl"), mode="record")
+    lms = [_CountingLM(), _CountingLM()]
+    assert [recorder.wrap_lm(lm).lm for lm in lms] == lms
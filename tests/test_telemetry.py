@@ -0,0 +1,42 @@
+import time
+
+import mlflow
+import numpy as np
+
+from bishop._telemetry import ResourceMonitor
+from bishop._mlflow import get_runs_as_json
+
+
+def test_monitor_measures_cpu_and_memory():
+    with ResourceMonitor() as monitor:
+        x = np.ones(20_000_000)
+        tic = time.process_time()
+        while time.process_time() - tic < 0.2:
+            x.sum()
+        del x
+    resources = monitor.resources
+    assert resources["wall_time"] >= 0.2
+    assert resources["cpu_time"] >= 0.15
+    # 20M float64s is about 150MB
+    assert resources["peak_rss_mb"] > 150
+    with ResourceMonitor() as monitor:
+        time.sleep(0.1)
+    assert monitor.resources["cpu_time"] < 0.05
+    assert monitor.resources["peak_rss_mb"] < resources["peak_rss_mb"]
+
+
+def test_history_includes_resources_on_request(tmp_path):
+    mlflow.set_tracking_uri(f"sqlite:///{tmp_path}/mlflow.db")
+    try:
+        mlflow.create_experiment("telemetry", artifact_location=(tmp_path / "artifacts").as_uri())
+        mlflow.set_experiment("telemetry")
+        with mlflow.start_run():
+            mlflow.log_metric("score", 1.)
+            mlflow.log_metrics({"resources.wall_time":12., "resources.peak_rss_mb":300.})
+        mapping = {"metrics.score":"score"}
+        assert get_runs_as_json("telemetry", mapping) == [{"score":1.}]
+        history = get_runs_as_json("telemetry", mapping, resources=True)[0]
+        assert history["wall_time_s"] == 12.
+        assert history["peak_memory_mb"] == 300.
+    finally:
+        mlflow.set_tracking_uri(None)
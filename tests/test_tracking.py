@@ -0,0 +1,83 @@
+import mlflow
+import pytest
+
+from bishop._tracking import Tracker, SqliteTracker
+from bishop._mlflow import get_runs_as_json
+from bishop._pruning import MedianStoppingPruner
+
+
+def _log_runs(tracker, scores):
+    for i, score in enumerate(scores):
+        with tracker.start_run("lab"):
+            tracker.set_tag("status", "complete" if i != 1 else "error")
+            tracker.log_params({"planner.title":f"run {i}"})
+            for step in range(3):
+                tracker.log_metric("intermediate.acc", score*step, step=step)
+            tracker.log_metric("acc", score)
+            tracker.log_dict({"n":i}, "usage.json")
+
+
+def test_sqlite_tracker_queries(tmp_path):
+    tracker = SqliteTracker(str(tmp_path / "runs.db"), batch_size=2)
+    _log_runs(tracker, [0.5, 0.9, 0.7, 0.1])
+
+    runs = tracker.search_runs("lab")
+    assert list(runs["params.planner.title"]) == ["run 3", "run 2", "run 1", "run 0"]
+    assert list(runs["metrics.acc"]) == [0.1, 0.7, 0.9, 0.5]
+    top = tracker.search_runs("lab", order_by="metrics.acc", max_results=2, status="complete")
+    assert list(top["metrics.acc"]) == [0.7, 0.5]
+    assert list(tracker.search_runs("lab", columns=["metrics.acc"]).columns) == ["run_id", "start_time", "end_time",
+                                                                                 "metrics.acc"]
+    assert tracker.get_metric_history(runs["run_id"][0], "intermediate.acc") == {0:0., 1:0.1, 2:0.2}
+    assert len(tracker.search_runs("other")) == 0
+
+    history = get_runs_as_json("lab", {"metrics.acc":"acc", "tags.status":"status"}, tracker=tracker, status="error")
+    assert history == [{"acc":0.9, "status":"error"}]
+    pruner = MedianStoppingPruner("acc").load_history("lab", tracker=tracker)
+    assert len(pruner.curves) == 4
+
+
+def test_history_lookup_filters_and_samples_in_the_tracker(tmp_path):
+    tracker = SqliteTracker(str(tmp_path / "runs.db"))
+    _log_runs(tracker, [0.5, 0.9, 0.7, 0.1])
+
+    runs = tracker.search_runs("lab", filters={"params.planner.title":"run 2", "tags.status":"complete"})
+    assert list(runs["metrics.acc"]) == [0.7]
+    sample = tracker.search_runs("lab", status="complete", max_results=2, sample=True)
+    assert len(sample) == 2 and set(sample["metrics.acc"]) <= {0.5, 0.7, 0.1}
+
+    mapping = {"metrics.acc":"acc", "tags.status":"status", "params.planner.title":"title"}
+    history = get_runs_as_json("lab", mapping, max_runs=2, tracker=tracker, status="complete")
+    assert len(history) == 2 and all(h["status"] == "complete" for h in history)
+    # filters on metrics still work, after the fact
+    assert get_runs_as_json("lab", mapping, tracker=tracker, acc=0.7) == [{"acc":0.7, "status":"complete",
+                                                                            "title":"run 2"}]
+
+
+def test_tracker_is_abstract():
+    with pytest.raises(TypeError):
+        Tracker()
+
+
+def test_export_to_mlflow(tmp_path):
+    tracker = SqliteTracker(str(tmp_path / "runs.db"))
+    _log_runs(tracker, [0.5, 0.9])
+    tracker.set_experiment_tag("lab", "mlflow.note.content", "notes")
+    mlflow.set_tracking_uri(f"sqlite:///{tmp_path}/mlflow.db")
+    try:
+        mlflow.create_experiment("lab", artifact_location=(tmp_path / "artifacts").as_uri())
+        exported = tracker.export_to_mlflow()
+        assert len(exported) == 2
+        # only new runs get exported the second time around
+        _log_runs(tracker, [0.3])
+        assert len(tracker.export_to_mlflow()) == 1
+
+        runs = mlflow.search_runs(experiment_names=["lab"])
+        assert sorted(runs["metrics.acc"]) == [0.3, 0.5, 0.9]
+        assert mlflow.get_experiment_by_name("lab").tags["mlflow.note.content"] == "notes"
+        run_id = exported[tracker.search_runs("lab", order_by="metrics.acc", max_results=1)["run_id"][0]]
+        history = mlflow.MlflowClient().get_metric_history(run_id, "intermediate.acc")
+        assert [m.value for m in history] == [0., 0.9, 1.8]
+        assert mlflow.artifacts.load_dict(f"runs:/{run_id}/usage.json") == {"n":1}
+    finally:
+        mlflow.set_tracking_uri(None)